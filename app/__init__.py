@@ -47,6 +47,13 @@ def create_app():
     
     # Inicializar extensiones
     db.init_app(app)
+    # Balances incrementales: aplicar el delta de cada transacción al hacer flush
+    from app.services.balance_service import BalanceService
+    BalanceService.install()
+    # Workers del pool de gráficas: se crean con fork ahora, antes de que existan hilos
+    # (scheduler, pool de descifrado, servidor); un request nunca hace fork
+    from app.services.chart_pool import init_render_pool
+    init_render_pool(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Por favor, inicia sesión para acceder a esta página.'
@@ -56,8 +63,12 @@ def create_app():
     from app.models.user import User
     from app.models.account import Account
     from app.models.transaction import Transaction
+    from app.models.transaction_search_token import TransactionSearchToken
     from app.models.credit_card import CreditCard
     from app.models.reminder import Reminder
+    from app.models.key_rotation_state import KeyRotationState
+    from app.models.balance_checkpoint import BalanceCheckpoint
+    from app.models.monthly_rollup import MonthlyRollup
     
     # Registro de blueprints
     from app.routes import main_bp, auth_bp
@@ -76,6 +87,11 @@ def create_app():
                 if email and not AuthController._is_beta_email_allowed(email):
                     abort(403)
     
+    # Latencia de requests (EWMA) usada por la rotación de llaves online para pausarse bajo carga
+    if app.config.get('KEY_ROTATION_ENABLED'):
+        from app.services.online_key_rotation import init_request_timing
+        init_request_timing(app)
+
     # Filtros personalizados para plantillas
     @app.template_filter('month_name')
     def month_name_filter(month_num):
@@ -118,6 +134,7 @@ def create_app():
                 'enc_version': 'SMALLINT',
                 # nuevos campos cifrados numéricos
                 'amount_enc': 'BLOB',
+                'amount_bucket_bidx': 'VARCHAR(64)',
                 # en account y credit_card hay columnas en otras tablas; sólo las de transactions aquí
             }
             for col, ddl in wanted.items():
@@ -193,6 +210,7 @@ def create_app():
                         from app.models.transaction import Transaction as _Tx
                         from app.models.account import Account as _Acct
                         from app.models.credit_card import CreditCard as _CC
+                        from app.services.balance_service import recompute_balances
                         active_ver = int(os.getenv('APP_ENC_ACTIVE_VERSION', '1'))
 
                         # Helper: existe columna en tabla
@@ -259,20 +277,14 @@ def create_app():
                                 except Exception:
                                     db.session.rollback()
                             else:
-                                # Recalcular desde transacciones si no hay columna legacy
+                                # Recalcular desde transacciones si no hay columna legacy (una pasada por lotes)
                                 ids = [r[0] for r in conn.exec_driver_sql('SELECT id FROM accounts WHERE balance_enc IS NULL').fetchall()]
-                                for rid in ids:
-                                    acct = _Acct.query.get(rid)
-                                    if not acct:
-                                        continue
+                                if ids:
                                     try:
-                                        acct.update_balance()
+                                        recompute_balances(account_ids=ids, card_ids=[])
+                                        db.session.commit()
                                     except Exception:
-                                        pass
-                                try:
-                                    db.session.commit()
-                                except Exception:
-                                    db.session.rollback()
+                                        db.session.rollback()
 
                         # 4) Rellenar credit_cards.current_balance_enc: usar legacy si existe; si no, recalcular
                         if _has_col('credit_cards', 'current_balance_enc'):
@@ -295,19 +307,12 @@ def create_app():
                                     db.session.rollback()
                             else:
                                 ids = [r[0] for r in conn.exec_driver_sql('SELECT id FROM credit_cards WHERE current_balance_enc IS NULL').fetchall()]
-                                for rid in ids:
-                                    cc = _CC.query.get(rid)
-                                    if not cc:
-                                        continue
+                                if ids:
                                     try:
-                                        cc.update_balance()
-                                        cc.update_minimum_payment()
+                                        recompute_balances(account_ids=[], card_ids=ids)
+                                        db.session.commit()
                                     except Exception:
-                                        pass
-                                try:
-                                    db.session.commit()
-                                except Exception:
-                                    db.session.rollback()
+                                        db.session.rollback()
                 except Exception:
                     pass
         except Exception:
@@ -44,12 +44,12 @@ class AccountController:
                     flash('Nombre y tipo de cuenta son obligatorios.', 'error')
                     return render_template('accounts/create.html')
                 
-                # Crear nueva cuenta
+                # Crear nueva cuenta en 0: el saldo inicial entra como transacción (delta)
                 account = Account(
                     user_id=current_user.id,
                     name=name,
                     account_type=account_type,
-                    balance=initial_balance,
+                    balance=0,
                     bank_name=bank_name
                 )
                 
@@ -141,7 +141,6 @@ class AccountController:
                 account.account_type = request.form.get('account_type')
                 account.bank_name = request.form.get('bank_name')
                 # account_number intentionally ignored (deprecated)
-                account.balance = new_balance
                 account.is_active = bool(request.form.get('is_active'))
                 
                 # Actualizar campos de inversión
@@ -178,14 +177,8 @@ class AccountController:
                         transaction_type='income' if balance_difference > 0 else 'expense',
                         date=datetime.now().date()
                     )
+                    # El balance se ajusta con el delta de la transacción al hacer flush
                     db.session.add(transaction)
-                    
-                    # Actualizar balance basado en las transacciones
-                    db.session.flush()  # Para asegurar que la transacción se agrega
-                    account.update_balance()
-                else:
-                    # Solo actualizar el balance directamente si no hay cambio en saldo
-                    account.balance = new_balance
                 
                 db.session.commit()
                 flash('Cuenta actualizada exitosamente.', 'success')
@@ -227,7 +220,7 @@ class AccountController:
         account = Account.query.filter_by(id=account_id, user_id=current_user.id).first_or_404()
         
         # Obtener transacciones recientes
-        recent_transactions = Transaction.query.filter(
+        recent_transactions = Transaction.query.options(*Transaction.profile('list')).filter(
             Transaction.account_id == account.id,
             Transaction.user_id == current_user.id
         ).order_by(Transaction.date.desc()).limit(20).all()
@@ -236,7 +229,7 @@ class AccountController:
         current_date = datetime.now()
         month_start = datetime(current_date.year, current_date.month, 1)
         
-        monthly_transactions = Transaction.query.filter(
+        monthly_transactions = Transaction.query.options(*Transaction.profile('aggregate')).filter(
             Transaction.account_id == account.id,
             Transaction.user_id == current_user.id,
             Transaction.date >= month_start
@@ -3,8 +3,26 @@ from flask_login import login_required, current_user
 from app.models.credit_card import CreditCard
 from app.models.transaction import Transaction
 from app.services.payment_reminder_service import PaymentReminderService
+from app.utils.crypto_fields import to_cents
 from app import db
 from datetime import datetime
+from decimal import Decimal
+
+def balance_adjustment(credit_card, difference_cents, description):
+    """Transacción que mueve la deuda de la tarjeta ``difference_cents`` (gasto +, pago -).
+
+    El saldo guardado sólo cambia con el delta de sus transacciones al hacer flush
+    (``CreditCard.apply_balance_delta``), así que el recálculo desde el ledger lo conserva.
+    """
+    return Transaction(
+        user_id=credit_card.user_id,
+        credit_card_id=credit_card.id,
+        amount=Decimal(abs(difference_cents)).scaleb(-2),
+        description=description,
+        category='other',
+        transaction_type='expense' if difference_cents > 0 else 'income',
+        date=datetime.now().date()
+    )
 
 class CreditCardController:
     
@@ -70,14 +88,14 @@ class CreditCardController:
                     flash('Las fechas de vencimiento y corte deben estar entre 1 y 31.', 'error')
                     return render_template('credit_cards/create.html')
                 
-                # Crear nueva tarjeta
+                # Crear nueva tarjeta en 0: el saldo inicial entra como transacción (delta)
                 credit_card = CreditCard(
                     user_id=current_user.id,
                     name=name,
                     bank_name=bank_name,
                     last_four_digits=last_four_digits,
                     credit_limit=credit_limit,
-                    current_balance=current_balance,
+                    current_balance=0,
                     due_date=due_date,
                     closing_date=closing_date,
                     interest_rate=interest_rate,
@@ -86,6 +104,11 @@ class CreditCardController:
                 
                 credit_card.update_minimum_payment()
                 db.session.add(credit_card)
+                db.session.flush()  # Asigna el ID para la transacción de saldo inicial
+                
+                if to_cents(current_balance) != 0:
+                    db.session.add(balance_adjustment(credit_card, to_cents(current_balance), 'Saldo inicial'))
+                
                 db.session.commit()
                 
                 # Crear recordatorio de pago
@@ -114,17 +137,25 @@ class CreditCardController:
                 credit_card.bank_name = request.form.get('bank_name')
                 credit_card.last_four_digits = request.form.get('last_four_digits')
                 credit_card.credit_limit = float(request.form.get('credit_limit'))
-                credit_card.current_balance = float(request.form.get('current_balance'))
+                new_balance = float(request.form.get('current_balance'))
                 credit_card.due_date = int(request.form.get('due_date'))
                 credit_card.closing_date = int(request.form.get('closing_date'))
                 credit_card.interest_rate = float(request.form.get('interest_rate', 0))
                 credit_card.is_active = bool(request.form.get('is_active'))
                 
                 # Validaciones
-                if credit_card.current_balance > credit_card.credit_limit:
+                if new_balance > credit_card.credit_limit:
                     flash('El saldo actual no puede ser mayor al límite de crédito.', 'error')
                     return render_template('credit_cards/edit.html', credit_card=credit_card)
                 
+                # Si cambió el saldo mostrado, una transacción de ajuste lleva el saldo
+                # guardado (sin recortar) al nuevo valor; se aplica con su delta al hacer flush
+                if to_cents(new_balance) != to_cents(credit_card.current_balance):
+                    difference_cents = to_cents(new_balance) - credit_card.stored_balance_cents()
+                    if difference_cents:
+                        db.session.add(balance_adjustment(credit_card, difference_cents,
+                                                          'Ajuste de saldo - Edición de tarjeta'))
+                
                 credit_card.update_minimum_payment()
                 db.session.commit()
                 flash('Tarjeta de crédito actualizada exitosamente.', 'success')
@@ -162,7 +193,7 @@ class CreditCardController:
         credit_card = CreditCard.query.filter_by(id=card_id, user_id=current_user.id).first_or_404()
         
         # Obtener transacciones recientes
-        recent_transactions = Transaction.query.filter(
+        recent_transactions = Transaction.query.options(*Transaction.profile('list_annotated')).filter(
             Transaction.credit_card_id == card_id,
             Transaction.user_id == current_user.id
         ).order_by(Transaction.date.desc()).limit(20).all()
@@ -171,7 +202,7 @@ class CreditCardController:
         current_date = datetime.now()
         month_start = datetime(current_date.year, current_date.month, 1)
         
-        monthly_transactions = Transaction.query.filter(
+        monthly_transactions = Transaction.query.options(*Transaction.profile('aggregate')).filter(
             Transaction.credit_card_id == card_id,
             Transaction.user_id == current_user.id,
             Transaction.date >= month_start
@@ -220,9 +251,6 @@ class CreditCardController:
                                              credit_card=credit_card, 
                                              accounts=current_user.accounts)
                     
-                    # Descontar de la cuenta
-                    account.balance -= amount
-                    
                     # Crear transacción de transferencia para la cuenta bancaria
                     account_transaction = Transaction(
                         user_id=current_user.id,
@@ -244,10 +272,7 @@ class CreditCardController:
                     transaction_type='income'  # Para la tarjeta es ingreso (pago)
                 )
                 
-                # Actualizar saldo de tarjeta
-                credit_card.current_balance -= amount
-                credit_card.update_minimum_payment()
-                
+                # Saldo de tarjeta, pago mínimo y cuenta origen: deltas aplicados en el flush
                 db.session.add(card_transaction)
                 db.session.commit()
                 
@@ -2,8 +2,10 @@ from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app.models.account import Account
 from app.models.transaction import Transaction
+from app.utils.crypto_fields import to_cents
 from app import db
 from datetime import datetime
+from decimal import Decimal
 
 class DebtController:
     
@@ -99,7 +101,7 @@ class DebtController:
         ).first_or_404()
         
         # Obtener transacciones de la deuda
-        transactions = Transaction.query.filter_by(
+        transactions = Transaction.query.options(*Transaction.profile('list')).filter_by(
             account_id=debt_id,
             user_id=current_user.id
         ).order_by(Transaction.date.desc()).limit(20).all()
@@ -190,11 +192,8 @@ class DebtController:
                         )
                         
                         db.session.add(expense_transaction)
-                        source_account.update_balance()
-                
-                # Actualizar balance de la deuda
-                debt_account.update_balance()
                 
+                # Balances de la deuda y de la cuenta origen: deltas aplicados en el flush
                 db.session.commit()
                 flash('Pago registrado exitosamente.', 'success')
                 return redirect(url_for('main.debt_detail', debt_id=debt_id))
@@ -280,9 +279,21 @@ class DebtController:
                     debt_account.original_debt_amount = float(original_amount)
                 
                 current_balance = request.form.get('current_balance')
-                if current_balance:
-                    # Para deudas, almacenar como valor positivo
-                    debt_account.balance = float(current_balance)
+                new_cents = to_cents(float(current_balance)) if current_balance else None
+                if new_cents is not None and new_cents != to_cents(debt_account.current_balance):
+                    # El saldo sólo cambia con transacciones: la diferencia entra como ajuste
+                    # (cargo = income, abono = expense) y se aplica con su delta al hacer flush
+                    difference_cents = new_cents - to_cents(debt_account.balance)
+                    if difference_cents:
+                        db.session.add(Transaction(
+                            user_id=current_user.id,
+                            account_id=debt_account.id,
+                            amount=Decimal(abs(difference_cents)).scaleb(-2),
+                            description='Ajuste de saldo - Edición de deuda',
+                            category='other',
+                            transaction_type='income' if difference_cents > 0 else 'expense',
+                            date=datetime.now().date()
+                        ))
                 
                 debt_account.interest_rate = float(request.form.get('interest_rate', 0))
                 debt_account.minimum_payment = float(request.form.get('minimum_payment', 0))
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort, current_app
 from flask_login import login_required, current_user
 from app.services.report_service import ReportService
 from app.services.payment_reminder_service import PaymentReminderService
@@ -6,6 +6,21 @@ from datetime import datetime
 
 class ReportController:
     
+    @staticmethod
+    def _chart_mode():
+        """'server' (PNG en el HTML) o 'client' (JSON + navegador); ``?render=`` tiene prioridad"""
+        mode = request.args.get('render') or current_app.config.get('REPORT_CHART_MODE', 'server')
+        return 'client' if mode == 'client' else 'server'
+    
+    @staticmethod
+    def _cached_json(payload):
+        """JSON con ETag: el navegador revalida y recibe 304 si las series no cambiaron"""
+        response = jsonify(payload)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.add_etag()
+        return response.make_conditional(request)
+    
     @staticmethod
     @login_required
     def monthly_report():
@@ -19,13 +34,19 @@ class ReportController:
         debt_summary = ReportService.get_debt_summary(current_user.id)
         net_worth = ReportService.get_net_worth(current_user.id)
         
-        # Generar gráficos
-        expense_chart = ReportService.generate_expense_chart(current_user.id, year, month)
-        assets_liabilities_pie = ReportService.generate_assets_liabilities_pie(current_user.id)
-        debt_breakdown_pie = ReportService.generate_debt_breakdown_pie(current_user.id)
-        monthly_flow_chart = ReportService.generate_monthly_flow_chart(current_user.id, year, month)
-        account_balances_chart = ReportService.generate_account_balances_chart(current_user.id)
-        income_expense_trend = ReportService.generate_income_expense_trend(current_user.id, year)
+        # Generar gráficos (en modo 'client' los dibuja el navegador desde /api/reports/monthly)
+        chart_mode = ReportController._chart_mode()
+        expense_chart = assets_liabilities_pie = debt_breakdown_pie = None
+        monthly_flow_chart = account_balances_chart = income_expense_trend = None
+        if chart_mode == 'server':
+            # Las que no están en caché se dibujan en paralelo (app/services/chart_pool.py)
+            charts = ReportService.monthly_charts(current_user.id, year, month)
+            expense_chart = charts['expense_pie']
+            assets_liabilities_pie = charts['assets_liabilities_pie']
+            debt_breakdown_pie = charts['debt_breakdown_pie']
+            monthly_flow_chart = charts['monthly_flow']
+            account_balances_chart = charts['account_balances']
+            income_expense_trend = charts['income_expense_trend']
         
         # Obtener recordatorios pendientes
         pending_reminders = PaymentReminderService.get_pending_reminders(current_user.id)
@@ -44,6 +65,7 @@ class ReportController:
                              monthly_flow_chart=monthly_flow_chart,
                              account_balances_chart=account_balances_chart,
                              income_expense_trend=income_expense_trend,
+                             chart_mode=chart_mode,
                              pending_reminders=pending_reminders,
                              overdue_reminders=overdue_reminders)
     
@@ -59,8 +81,11 @@ class ReportController:
         income_summary = ReportService.get_income_by_account_summary(current_user.id, year, month)
         
         # Generar gráficos
-        income_pie_chart = ReportService.generate_income_by_account_pie(current_user.id, year, month)
-        income_bar_chart = ReportService.generate_income_by_account_bar(current_user.id, year, month)
+        charts = ReportService.render_charts({
+            'pie': ('income_by_account_pie', ReportService.income_by_account_data(current_user.id, year, month)),
+            'bar': ('income_by_account_bar', ReportService.income_by_account_bar_data(current_user.id, year, month)),
+        })
+        income_pie_chart, income_bar_chart = charts['pie'], charts['bar']
         
         return render_template('reports/income_by_account.html',
                              year=year,
@@ -117,30 +142,9 @@ class ReportController:
         """Mostrar resumen anual"""
         year = request.args.get('year', datetime.now().year, type=int)
         
-        # Obtener datos de todos los trimestres
-        annual_data = {
-            'quarters': [],
-            'total_income': 0,
-            'total_expenses': 0,
-            'net_income': 0
-        }
-        
-        for quarter in range(1, 5):
-            quarterly_data = ReportService.get_quarterly_report(current_user.id, year, quarter)
-            annual_data['quarters'].append(quarterly_data)
-            annual_data['total_income'] += quarterly_data['total_income']
-            annual_data['total_expenses'] += quarterly_data['total_expenses']
-        
-        annual_data['net_income'] = annual_data['total_income'] - annual_data['total_expenses']
-        
-        # Promedios mensuales
-        annual_data['avg_monthly_income'] = annual_data['total_income'] / 12
-        annual_data['avg_monthly_expenses'] = annual_data['total_expenses'] / 12
-        
-        # Tasa de ahorro anual
-        savings_rate = 0
-        if annual_data['total_income'] > 0:
-            savings_rate = (annual_data['net_income'] / annual_data['total_income']) * 100
+        # Trimestres, totales y promedios de un único escaneo anual
+        annual_data = ReportService.get_annual_summary(current_user.id, year)
+        savings_rate = annual_data['savings_rate']
         
         # Datos adicionales
         debt_summary = ReportService.get_debt_summary(current_user.id)
@@ -216,9 +220,34 @@ class ReportController:
             'export_date': datetime.now().isoformat()
         }
         
-        # Datos anuales
-        for quarter in range(1, 5):
-            quarterly_data = ReportService.get_quarterly_report(current_user.id, year, quarter)
-            export_data['quarterly_reports'][f'Q{quarter}'] = quarterly_data
+        # Datos anuales (un solo escaneo del año, descifrado en paralelo)
+        annual_data = ReportService.get_annual_summary(current_user.id, year)
+        export_data['annual_summary'] = {key: value for key, value in annual_data.items() if key != 'quarters'}
+        for quarterly_data in annual_data['quarters']:
+            export_data['quarterly_reports'][f"Q{quarterly_data['quarter']}"] = quarterly_data
         
         return jsonify(export_data)
+    
+    @staticmethod
+    @login_required
+    def monthly_charts_api():
+        """Series de todas las gráficas del reporte mensual en JSON"""
+        year = request.args.get('year', datetime.now().year, type=int)
+        month = request.args.get('month', datetime.now().month, type=int)
+        return ReportController._cached_json({
+            'year': year,
+            'month': month,
+            'charts': ReportService.monthly_charts_data(current_user.id, year, month)
+        })
+    
+    @staticmethod
+    @login_required
+    def chart_data_api(kind):
+        """Series de una gráfica en JSON (``spec`` es null si no hay datos)"""
+        year = request.args.get('year', datetime.now().year, type=int)
+        month = request.args.get('month', datetime.now().month, type=int)
+        try:
+            spec = ReportService.chart_data(kind, current_user.id, year, month)
+        except KeyError:
+            abort(404)
+        return ReportController._cached_json({'kind': kind, 'year': year, 'month': month, 'spec': spec})
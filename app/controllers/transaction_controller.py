@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from app.models.transaction import Transaction
 from app.models.account import Account
 from app.models.credit_card import CreditCard
+from app.services.transaction_search import paginate_ids, verified_ids
+from app.services.running_balance import running_balances
 from app.utils.security import (
     ensure_transaction_account_ownership,
     ensure_transaction_credit_card_ownership
@@ -43,6 +45,9 @@ class TransactionController:
         account_id = request.args.get('account_id')
         category = request.args.get('category')
         transaction_type = request.args.get('transaction_type')
+        search_text = (request.args.get('q') or '').strip()
+        min_amount = request.args.get('min_amount', type=float)
+        max_amount = request.args.get('max_amount', type=float)
         
         query = Transaction.query.filter_by(user_id=current_user.id)
         
@@ -53,9 +58,16 @@ class TransactionController:
         if transaction_type:
             query = query.filter_by(transaction_type=transaction_type)
         
-        transactions = query.order_by(Transaction.date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        query = query.order_by(Transaction.date.desc(), Transaction.id.desc())
+        # Texto y monto al final: los tokens HMAC y los buckets de monto dan candidatos
+        # entre las filas que ya cumplen los demás filtros y sólo esos se descifran
+        # (los trigramas admiten falsos positivos; los buckets de borde, montos fuera de rango)
+        ids = verified_ids(query, current_user.id, search_text, min_amount, max_amount)
+        page_query = query.options(*Transaction.profile('list_annotated'))
+        if ids is None:
+            transactions = page_query.paginate(page=page, per_page=per_page, error_out=False)
+        else:
+            transactions = paginate_ids(page_query, ids, page, per_page)
         
         # Obtener cuentas para el filtro
         accounts = Account.query.filter_by(user_id=current_user.id, is_active=True).all()
@@ -85,7 +97,7 @@ class TransactionController:
         category = request.args.get('category')
         transaction_type = request.args.get('transaction_type')
         
-        query = Transaction.query.filter_by(
+        query = Transaction.query.options(*Transaction.profile('statement')).filter_by(
             user_id=current_user.id,
             account_id=account_id
         )
@@ -95,9 +107,12 @@ class TransactionController:
         if transaction_type:
             query = query.filter_by(transaction_type=transaction_type)
         
-        transactions = query.order_by(Transaction.date.desc()).paginate(
+        # Mismo orden (date, id) que el saldo acumulado
+        transactions = query.order_by(Transaction.date.desc(), Transaction.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
+        # Saldo después de cada transacción: se descifra sólo la página
+        balances = running_balances(transactions.items)
         
         # Categorías disponibles
         categories = get_transaction_categories()
@@ -105,7 +120,8 @@ class TransactionController:
         return render_template('transactions/account_list.html',
                              transactions=transactions,
                              account=account,
-                             categories=categories)
+                             categories=categories,
+                             running_balances=balances)
     
     @staticmethod
     @login_required
@@ -162,20 +178,8 @@ class TransactionController:
                     transaction.creditor_name = creditor_name
                     transaction.is_debt_payment = True
                 
+                # El balance de la cuenta/tarjeta se ajusta con el delta en el flush (BalanceService)
                 db.session.add(transaction)
-                
-                # Actualizar balance de cuenta usando el método update_balance
-                if _account:
-                    _account.update_balance()
-                
-                # Actualizar balance de tarjeta de crédito
-                elif _card:
-                    if transaction_type == 'expense':
-                        _card.current_balance += amount
-                    elif transaction_type == 'income':  # Pago de tarjeta
-                        _card.current_balance -= amount
-                        _card.update_minimum_payment()
-                
                 db.session.commit()
                 flash('Transacción registrada exitosamente.', 'success')
                 return redirect(url_for('main.transactions'))
@@ -206,16 +210,12 @@ class TransactionController:
     @login_required
     def edit_transaction(transaction_id):
         """Editar transacción existente"""
-        transaction = Transaction.query.filter_by(id=transaction_id, user_id=current_user.id).first_or_404()
+        transaction = Transaction.query.options(*Transaction.profile('detail')).filter_by(
+            id=transaction_id, user_id=current_user.id
+        ).first_or_404()
 
         if request.method == 'POST':
             try:
-                # Guardar información anterior para recalcular balances
-                old_account_id = transaction.account_id
-                old_credit_card_id = transaction.credit_card_id
-                old_amount = transaction.amount
-                old_type = transaction.transaction_type
-
                 # Actualizar transacción (validando pertenencia de nuevos recursos)
                 new_account_id = request.form.get('account_id')
                 new_card_id = request.form.get('credit_card_id')
@@ -232,39 +232,8 @@ class TransactionController:
                 if date:
                     transaction.date = datetime.strptime(date, '%Y-%m-%d')
 
-                db.session.commit()
-
-                # Recalcular balances para todas las cuentas afectadas
-                affected_accounts = set()
-                if old_account_id:
-                    affected_accounts.add(old_account_id)
-                if transaction.account_id:
-                    affected_accounts.add(transaction.account_id)
-
-                for acc_id in affected_accounts:
-                    account = Account.query.get(acc_id)
-                    if account and account.user_id == current_user.id:
-                        account.update_balance()
-
-                # Manejar tarjetas de crédito
-                if old_credit_card_id and old_credit_card_id != transaction.credit_card_id:
-                    old_card = CreditCard.query.get(old_credit_card_id)
-                    if old_card and old_card.user_id == current_user.id:
-                        if old_type == 'expense':
-                            old_card.current_balance -= old_amount
-                        elif old_type == 'income':
-                            old_card.current_balance += old_amount
-                        old_card.update_minimum_payment()
-
-                if transaction.credit_card_id:
-                    new_card = CreditCard.query.get(transaction.credit_card_id)
-                    if new_card and new_card.user_id == current_user.id:
-                        if transaction.transaction_type == 'expense':
-                            new_card.current_balance += transaction.amount
-                        elif transaction.transaction_type == 'income':
-                            new_card.current_balance -= transaction.amount
-                            new_card.update_minimum_payment()
-
+                # Los balances de cuentas/tarjetas anteriores y nuevas se ajustan con el
+                # delta (valores previos vs. nuevos) al hacer flush (BalanceService)
                 db.session.commit()
                 flash('Transacción actualizada exitosamente.', 'success')
                 return redirect(url_for('main.transactions'))
@@ -287,7 +256,9 @@ class TransactionController:
     @login_required
     def delete_transaction(transaction_id):
         """Eliminar transacción con lógica en cascada para actualizar balances"""
-        transaction = Transaction.query.filter_by(id=transaction_id, user_id=current_user.id).first_or_404()
+        transaction = Transaction.query.options(*Transaction.profile('detail')).filter_by(
+            id=transaction_id, user_id=current_user.id
+        ).first_or_404()
 
         try:
             # Usar el nuevo método que maneja automáticamente todas las actualizaciones
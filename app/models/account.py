@@ -1,10 +1,10 @@
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from decimal import Decimal, ROUND_HALF_UP
 from app import db
-from app.utils.crypto_fields import encrypt_field, decrypt_field, get_active_enc_version
+from app.utils.crypto_fields import encrypt_amount, decrypt_cents, decrypt_column, get_active_enc_version
+from app.utils.plaintext_cache import PlaintextCacheMixin
 
-class Account(db.Model):
+class Account(PlaintextCacheMixin, db.Model):
     __tablename__ = 'accounts'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -13,6 +13,8 @@ class Account(db.Model):
     account_type = db.Column(db.String(50), nullable=False)  # 'checking', 'savings', 'investment', 'debt'
     balance_enc = db.Column(db.LargeBinary, nullable=False)
     enc_version = db.Column(db.SmallInteger, default=get_active_enc_version)
+    # Control optimista de concurrencia (UPDATE ... WHERE version_id = :leída)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
     bank_name = db.Column(db.String(100))
     # Deprecated sensitive field: previously stored full account numbers.
     # Now unused and should remain NULL. Plan: create migration to DROP COLUMN accounts.account_number.
@@ -38,6 +40,8 @@ class Account(db.Model):
     maturity_date = db.Column(db.Date)  # Fecha de vencimiento para inversiones a plazo
     compound_frequency = db.Column(db.String(20), default='monthly')  # monthly, quarterly, annually
     
+    __mapper_args__ = {'version_id_col': version_id}
+    
     # Relaciones
     transactions = db.relationship('Transaction', 
                                   foreign_keys='Transaction.account_id',
@@ -49,53 +53,48 @@ class Account(db.Model):
                                           lazy=True)
     
     def get_monthly_balance(self, year, month):
-        """Obtener balance al final del mes especificado"""
-        from app.models.transaction import Transaction
-        
-        # Transacciones hasta el final del mes
-        end_of_month = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
-        transactions = Transaction.query.filter(
-            Transaction.account_id == self.id,
-            Transaction.user_id == self.user_id,
-            Transaction.date < end_of_month
-        ).all()
-        
-        monthly_balance = 0.0
-        for transaction in transactions:
-            if transaction.transaction_type == 'income':
-                monthly_balance += transaction.amount
-            else:
-                monthly_balance -= transaction.amount
-                
-        return monthly_balance
+        """Obtener balance al final del mes especificado (checkpoint mensual + cola de transacciones)"""
+        from app.services.balance_checkpoint_service import BalanceCheckpointService
+        return BalanceCheckpointService.balance_at(self, year, month)
     
     def calculate_current_balance(self):
         """Calcular el balance actual basado en todas las transacciones"""
         from app.models.transaction import Transaction
         
-        transactions = Transaction.query.filter_by(account_id=self.id).all()
+        # Sólo las columnas necesarias: evita hidratar objetos ORM y descifra en bloque
+        rows = db.session.query(
+            Transaction.amount_enc,
+            Transaction.enc_version,
+            Transaction.transaction_type
+        ).filter(Transaction.account_id == self.id).all()
+        # Centavos enteros: sin parseo Decimal por fila
+        amounts = decrypt_column(rows, 0, 'amount', version_index=1, kind='cents', parallel=True)
         
         # Para cuentas de deuda, empezar con el monto original
         if self.is_debt_account:
-            calculated_balance = self.original_debt_amount or 0.0
+            calculated_cents = 0
             # Para deudas, los pagos (expense) reducen la deuda
-            for transaction in transactions:
-                if transaction.transaction_type == 'expense':
-                    calculated_balance -= transaction.amount  # Pagos reducen la deuda
-                elif transaction.transaction_type == 'income':
-                    calculated_balance += transaction.amount  # Cargos aumentan la deuda
-        else:
-            # Para cuentas normales, lógica tradicional
-            calculated_balance = 0.0
-            for transaction in transactions:
-                if transaction.transaction_type == 'income':
-                    calculated_balance += transaction.amount
-                else:  # expense or transfer
-                    calculated_balance -= transaction.amount
-        return calculated_balance
+            for (_, _, tx_type), cents in zip(rows, amounts):
+                if tx_type == 'expense':
+                    calculated_cents -= cents  # Pagos reducen la deuda
+                elif tx_type == 'income':
+                    calculated_cents += cents  # Cargos aumentan la deuda
+            return (self.original_debt_amount or 0.0) + calculated_cents / 100
+        # Para cuentas normales, lógica tradicional
+        calculated_cents = 0
+        for (_, _, tx_type), cents in zip(rows, amounts):
+            if tx_type == 'income':
+                calculated_cents += cents
+            else:  # expense or transfer
+                calculated_cents -= cents
+        return calculated_cents / 100
     
     def update_balance(self):
-        """Actualizar el balance de la cuenta basado en las transacciones"""
+        """Reparación: recalcular el balance desde todas las transacciones (O(historial)).
+
+        El flujo normal no lo necesita: ``BalanceService`` aplica el delta de cada
+        transacción al hacer flush.
+        """
         new_value = self.calculate_current_balance()
         # usar setter cifrado
         self.balance = new_value
@@ -165,10 +164,8 @@ class Account(db.Model):
             is_automatic=True
         )
 
+        # El saldo de la deuda aumenta con el delta de la transacción (BalanceService)
         db.session.add(interest_transaction)
-
-        # Aumentar saldo de la deuda (positivo)
-        self.balance = float(self.balance) + interest_amount
         self.last_interest_calculation = datetime.utcnow()
 
         return interest_transaction
@@ -284,10 +281,8 @@ class Account(db.Model):
                 is_automatic=True
             )
             
+            # El balance aumenta con el delta de la transacción (BalanceService)
             db.session.add(interest_transaction)
-            
-            # Actualizar balance (para inversiones, los rendimientos aumentan el balance)
-            self.balance += interest_amount
             self.last_interest_calculation = datetime.utcnow()
             
             return interest_transaction
@@ -385,10 +380,13 @@ class Account(db.Model):
     # ---- Accesores cifrados ----
     @property
     def balance(self) -> float:
-        txt = decrypt_field(self.balance_enc, 'account_balance', self.enc_version)
-        if txt is None:
+        return self._cached_plain('balance_enc', self._decrypt_balance)
+
+    def _decrypt_balance(self, blob):
+        cents = decrypt_cents(blob, 'account_balance', self.enc_version)
+        if cents is None:
             return 0.0
-        return float(Decimal(txt))
+        return cents / 100
 
     @balance.setter
     def balance(self, value: float | int | str):
@@ -396,5 +394,5 @@ class Account(db.Model):
             raise ValueError('balance no puede ser None')
         if not self.enc_version:
             self.enc_version = get_active_enc_version()
-        dec = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        self.balance_enc = encrypt_field(str(dec), 'account_balance', self.enc_version)
+        self._reset_plain('balance_enc')
+        self.balance_enc = encrypt_amount(value, 'account_balance', self.enc_version)
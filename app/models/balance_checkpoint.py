@@ -0,0 +1,42 @@
+from datetime import datetime
+from app import db
+from app.utils.crypto_fields import encrypt_cents, decrypt_cents, get_active_enc_version
+
+
+class BalanceCheckpoint(db.Model):
+    """Balance de cierre cifrado de una cuenta al final de un mes.
+
+    ``period`` es el primer día del mes; el balance cubre todas las transacciones
+    con ``date`` anterior al inicio del mes siguiente (misma regla que
+    ``Account.get_monthly_balance``). Lo escribe el job nocturno y se parchea al
+    insertar/editar/borrar transacciones con fecha dentro o antes del mes
+    (ver ``app.services.balance_checkpoint_service``).
+    """
+    __tablename__ = 'balance_checkpoints'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'period', name='uq_balance_checkpoints_account_period'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False, index=True)
+    period = db.Column(db.Date, nullable=False)
+    balance_enc = db.Column(db.LargeBinary, nullable=False)
+    enc_version = db.Column(db.SmallInteger, default=get_active_enc_version)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def balance_cents(self) -> int:
+        return decrypt_cents(self.balance_enc, 'account_balance', self.enc_version or 1) or 0
+
+    @balance_cents.setter
+    def balance_cents(self, cents: int):
+        if not self.enc_version:
+            self.enc_version = get_active_enc_version()
+        self.balance_enc = encrypt_cents(int(cents), 'account_balance', self.enc_version)
+
+    @property
+    def balance(self) -> float:
+        return self.balance_cents / 100
+
+    def __repr__(self):
+        return f'<BalanceCheckpoint account={self.account_id} {self.period:%Y-%m}>'
@@ -1,9 +1,9 @@
 from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
 from app import db
-from app.utils.crypto_fields import encrypt_field, decrypt_field, get_active_enc_version
+from app.utils.crypto_fields import encrypt_amount, encrypt_cents, decrypt_cents, decrypt_column, get_active_enc_version
+from app.utils.plaintext_cache import PlaintextCacheMixin
 
-class CreditCard(db.Model):
+class CreditCard(PlaintextCacheMixin, db.Model):
     __tablename__ = 'credit_cards'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -15,12 +15,18 @@ class CreditCard(db.Model):
     current_balance_enc = db.Column(db.LargeBinary, nullable=False)
     enc_version = db.Column(db.SmallInteger, default=get_active_enc_version)
     minimum_payment = db.Column(db.Float, default=0.0)
+    # Control optimista de concurrencia (UPDATE ... WHERE version_id = :leída)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    # Marca de agua: mayor id de transacción cuyo delta ya está aplicado en current_balance
+    balance_applied_tx_id = db.Column(db.Integer, default=0)
     due_date = db.Column(db.Integer)  # Día del mes (1-31)
     closing_date = db.Column(db.Integer)  # Día del mes (1-31)
     interest_rate = db.Column(db.Float, default=0.0)  # Tasa de interés mensual
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __mapper_args__ = {'version_id_col': version_id}
+
     # Relaciones
     transactions = db.relationship('Transaction', backref='credit_card', lazy=True)
     
@@ -70,30 +76,111 @@ class CreditCard(db.Model):
         today = datetime.now()
         return (next_due - today).days
     
+    @staticmethod
+    def minimum_payment_for(balance):
+        """Pago mínimo para un saldo dado (generalmente 5% del saldo)"""
+        return max(balance * 0.05, 50.0) if balance > 0 else 0.0
+
     def calculate_minimum_payment(self):
         """Calcular pago mínimo (generalmente 5% del saldo)"""
-        return max(self.current_balance * 0.05, 50.0) if self.current_balance > 0 else 0.0
+        return self.minimum_payment_for(self.current_balance)
     
     def update_minimum_payment(self):
         """Actualizar el pago mínimo"""
         self.minimum_payment = self.calculate_minimum_payment()
     
-    def update_balance(self):
-        """Actualizar balance basado en las transacciones"""
+    @classmethod
+    def apply_balance_delta(cls, session, card_id, delta_cents, applied_tx_id=None):
+        """Aplicar un delta (centavos) a la deuda de la tarjeta: único camino de escritura incremental.
+
+        Suma el delta sin recortar (un pago de más deja saldo a favor, negativo en
+        el ledger; ``current_balance`` lo muestra como 0), recalcula
+        ``minimum_payment`` y avanza ``balance_applied_tx_id``. Escribe con Core dentro de la transacción en curso
+        con control optimista sobre ``version_id`` (reintento acotado, ver
+        ``balance_service.versioned_update``) y sincroniza el objeto cargado en la
+        sesión. Devuelve el nuevo saldo en centavos (None si no hubo escritura).
+        """
+        from sqlalchemy.orm.attributes import set_committed_value
+        from app.services.balance_service import versioned_update
+
+        written = {}
+
+        def compute(row):
+            version = row.enc_version or 1
+            current = decrypt_cents(row.current_balance_enc, 'cc_current_balance', version) or 0
+            high_water = max(row.balance_applied_tx_id or 0, applied_tx_id or 0)
+            if not delta_cents and high_water == (row.balance_applied_tx_id or 0):
+                return None
+            # Sin recortar en cada paso: así coincide con la suma de ``calculate_balance_cents``
+            new_cents = current + delta_cents
+            written['cents'] = new_cents
+            return {
+                'current_balance_enc': encrypt_cents(new_cents, 'cc_current_balance', version),
+                'minimum_payment': cls.minimum_payment_for(new_cents / 100),
+                'balance_applied_tx_id': high_water,
+            }
+
+        values = versioned_update(session.connection(), cls.__table__, card_id,
+                                  ('current_balance_enc', 'enc_version', 'balance_applied_tx_id'), compute)
+        if values is None:
+            return None
+        card = session.identity_map.get(session.identity_key(cls, card_id))
+        if card is not None:
+            for attr, value in values.items():
+                set_committed_value(card, attr, value)
+            card._reset_plain('current_balance_enc')
+        return written['cents']
+
+    def calculate_balance_cents(self):
+        """Deuda recalculada desde todas las transacciones: (centavos, mayor id de transacción).
+
+        Es la suma del ledger sin recortar (negativa si hay saldo a favor), igual
+        que lo que acumula ``apply_balance_delta``.
+        """
         from app.models.transaction import Transaction
 
-        transactions = Transaction.query.filter_by(credit_card_id=self.id).all()
-        calculated_balance = 0.0
+        rows = db.session.query(
+            Transaction.amount_enc,
+            Transaction.enc_version,
+            Transaction.transaction_type,
+            Transaction.id
+        ).filter(Transaction.credit_card_id == self.id).all()
+        amounts = decrypt_column(rows, 0, 'amount', version_index=1, kind='cents', parallel=True)
+        calculated_cents = 0
 
-        for transaction in transactions:
-            if transaction.transaction_type == 'expense':
+        for (_, _, tx_type, _), cents in zip(rows, amounts):
+            if tx_type == 'expense':
                 # Gastos aumentan la deuda de la tarjeta
-                calculated_balance += transaction.amount
-            elif transaction.transaction_type == 'income':
+                calculated_cents += cents
+            elif tx_type == 'income':
                 # Pagos reducen la deuda de la tarjeta
-                calculated_balance -= transaction.amount
+                calculated_cents -= cents
+        return calculated_cents, max((r[3] for r in rows), default=0)
+
+    def stored_balance_cents(self):
+        """Saldo guardado en centavos, sin recortar (negativo si hay saldo a favor)."""
+        return decrypt_cents(self.current_balance_enc, 'cc_current_balance', self.enc_version) or 0
+
+    def verify_balance(self):
+        """Verificación: comparar el saldo incremental con el recálculo completo (O(historial))."""
+        computed, last_tx_id = self.calculate_balance_cents()
+        stored = self.stored_balance_cents()
+        return {
+            'stored': stored / 100,
+            'computed': computed / 100,
+            'high_water': self.balance_applied_tx_id or 0,
+            'last_tx_id': last_tx_id,
+            'ok': stored == computed and (self.balance_applied_tx_id or 0) >= last_tx_id,
+        }
 
-        self.current_balance = max(0.0, calculated_balance)  # No permitir balance negativo
+    def update_balance(self):
+        """Reparación: recalcular la deuda desde todas las transacciones (O(historial)).
+
+        En el flujo normal cada transacción aplica su delta con ``apply_balance_delta``.
+        """
+        computed, last_tx_id = self.calculate_balance_cents()
+        self.current_balance = computed / 100
+        self.balance_applied_tx_id = last_tx_id
         self.update_minimum_payment()
         return self.current_balance
     
@@ -103,10 +190,14 @@ class CreditCard(db.Model):
     # ---- Accesores cifrados ----
     @property
     def current_balance(self) -> float:
-        txt = decrypt_field(self.current_balance_enc, 'cc_current_balance', self.enc_version)
-        if txt is None:
+        return self._cached_plain('current_balance_enc', self._decrypt_current_balance)
+
+    def _decrypt_current_balance(self, blob):
+        cents = decrypt_cents(blob, 'cc_current_balance', self.enc_version)
+        if cents is None:
             return 0.0
-        return float(Decimal(txt))
+        # El ledger guarda la suma sin recortar; un saldo a favor se muestra como deuda 0
+        return max(cents, 0) / 100
 
     @current_balance.setter
     def current_balance(self, value: float | int | str):
@@ -114,5 +205,5 @@ class CreditCard(db.Model):
             raise ValueError('current_balance no puede ser None')
         if not self.enc_version:
             self.enc_version = get_active_enc_version()
-        dec = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        self.current_balance_enc = encrypt_field(str(dec), 'cc_current_balance', self.enc_version)
+        self._reset_plain('current_balance_enc')
+        self.current_balance_enc = encrypt_amount(value, 'cc_current_balance', self.enc_version)
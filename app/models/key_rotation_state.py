@@ -0,0 +1,31 @@
+from datetime import datetime
+from app import db
+
+
+class KeyRotationState(db.Model):
+    """Cursor persistente de la rotación de llaves online (una fila por tabla cifrada)."""
+    __tablename__ = 'key_rotation_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False, unique=True)
+    from_version = db.Column(db.SmallInteger, nullable=False)
+    to_version = db.Column(db.SmallInteger, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # último id procesado (keyset)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, paused, done
+    pause_reason = db.Column(db.String(200))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def reset(self, from_version: int, to_version: int):
+        """Reiniciar el cursor para una nueva pareja de versiones."""
+        self.from_version = from_version
+        self.to_version = to_version
+        self.last_id = 0
+        self.rows_done = 0
+        self.status = 'pending'
+        self.pause_reason = None
+        self.finished_at = None
+
+    def __repr__(self):
+        return f'<KeyRotationState {self.table_name} v{self.from_version}->v{self.to_version} @{self.last_id} {self.status}>'
@@ -0,0 +1,36 @@
+from datetime import datetime
+from app import db
+from app.utils.crypto_fields import get_active_enc_version
+
+
+class MonthlyRollup(db.Model):
+    """Total mensual cifrado por usuario, categoría y tipo de transacción.
+
+    Una fila por ``(user_id, year, month, category, transaction_type,
+    is_card_payment)`` con la suma de montos (``total_enc``, centavos cifrados) y
+    el número de transacciones. ``is_card_payment`` marca las transacciones con
+    ``credit_card_id`` (los abonos a tarjeta no cuentan como ingreso en reportes).
+    Se mantiene en el mismo flush que inserta/edita/borra la transacción
+    (ver ``app.services.monthly_rollup``).
+    """
+    __tablename__ = 'monthly_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', 'category', 'transaction_type', 'is_card_payment',
+                            name='uq_monthly_rollups_key'),
+        db.Index('ix_monthly_rollups_user_period', 'user_id', 'year', 'month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    year = db.Column(db.SmallInteger, nullable=False)
+    month = db.Column(db.SmallInteger, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    transaction_type = db.Column(db.String(20), nullable=False)
+    is_card_payment = db.Column(db.Boolean, nullable=False, default=False)
+    total_enc = db.Column(db.LargeBinary, nullable=False)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    enc_version = db.Column(db.SmallInteger, default=get_active_enc_version)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MonthlyRollup user={self.user_id} {self.year}-{self.month:02d} {self.category}/{self.transaction_type}>'
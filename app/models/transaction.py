@@ -1,10 +1,21 @@
 from datetime import datetime
+from sqlalchemy.orm import load_only
 from app import db
-from decimal import Decimal, ROUND_HALF_UP
-from app.utils.crypto_fields import encrypt_field, decrypt_field, blind_index, dual_encrypt, get_active_enc_version
+from app.utils.crypto_fields import (
+    decrypt_field, blind_index, dual_encrypt, get_active_enc_version,
+    encrypt_amount, decrypt_cents, search_tokens as make_search_tokens,
+    to_cents, amount_bucket_index
+)
+from app.utils.plaintext_cache import PlaintextCacheMixin
+from app.models.transaction_search_token import TransactionSearchToken
 
-class Transaction(db.Model):
+class Transaction(PlaintextCacheMixin, db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Orden de estado de cuenta (saldo acumulado): (ámbito, date, id)
+        db.Index('ix_transactions_account_date_id', 'account_id', 'date', 'id'),
+        db.Index('ix_transactions_card_date_id', 'credit_card_id', 'date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -13,43 +24,101 @@ class Transaction(db.Model):
     
     # Monto sensible: almacenar sólo cifrado
     amount_enc = db.Column(db.LargeBinary, nullable=False)
+    # HMAC del bucket log-escala del monto: filtros por rango sin descifrar todo
+    amount_bucket_bidx = db.deferred(db.Column(db.String(64), index=True), group='blind_indexes')
     # Campos en claro previos: description, notes, creditor_name.
     # Se migran a *_enc (BYTEA) + blind indexes para consultas futuras.
     description_enc = db.Column(db.LargeBinary, nullable=True)
-    description_bidx = db.Column(db.String(64), index=True)  # HMAC hex
+    description_bidx = db.deferred(db.Column(db.String(64), index=True), group='blind_indexes')  # HMAC hex
     category = db.Column(db.String(50), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)  # 'income', 'expense', 'transfer'
     date = db.Column(db.DateTime, default=datetime.utcnow)
-    notes_enc = db.Column(db.LargeBinary, nullable=True)
-    notes_bidx = db.Column(db.String(64), index=True)
+    notes_enc = db.deferred(db.Column(db.LargeBinary, nullable=True), group='annotations')
+    notes_bidx = db.deferred(db.Column(db.String(64), index=True), group='blind_indexes')
     
     # Para transferencias entre cuentas
     transfer_to_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=True)
     
     # Para pagos de deudas a terceros
-    creditor_name_enc = db.Column(db.LargeBinary, nullable=True)
-    creditor_name_bidx = db.Column(db.String(64), index=True)
+    creditor_name_enc = db.deferred(db.Column(db.LargeBinary, nullable=True), group='annotations')
+    creditor_name_bidx = db.deferred(db.Column(db.String(64), index=True), group='blind_indexes')
     is_debt_payment = db.Column(db.Boolean, default=False)
     
     # Para transacciones automáticas (como intereses)
     is_automatic = db.Column(db.Boolean, default=False)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Saldo de la cuenta (o de la tarjeta si no hay cuenta) después de esta transacción,
+    # en orden (date, id). Lo mantiene app.services.running_balance al hacer flush.
+    running_balance_enc = db.deferred(db.Column(db.LargeBinary, nullable=True), group='statement')
     # Versión de cifrado aplicada a los campos *_enc / *_bidx.
     # Se obtiene dinámicamente de APP_ENC_ACTIVE_VERSION para nuevas filas.
     enc_version = db.Column(db.SmallInteger, default=get_active_enc_version)
+    # Control optimista de concurrencia (UPDATE ... WHERE version_id = :leída): la
+    # rotación de llaves lo incrementa, así que un flush con la versión de cifrado
+    # anterior falla con StaleDataError en vez de escribir blobs ilegibles
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
+
+    # Grupos diferidos: 'blind_indexes' (*_bidx, sólo se usan en WHERE),
+    # 'annotations' (notes_enc, creditor_name_enc) y 'statement' (running_balance_enc)
+    # no se cargan por defecto.
+    # Las consultas eligen columnas con Transaction.profile(...):
+    #   aggregate      -> sumas/reportes (monto, tipo, categoría, fecha, cuenta/tarjeta)
+    #   list           -> listados compactos (dashboard, detalles de cuenta/tarjeta/deuda)
+    #   list_annotated -> listados que muestran notas/acreedor
+    #   statement      -> estado de cuenta paginado con saldo acumulado por fila
+    #   detail         -> una transacción completa (editar / ver)
+    QUERY_PROFILES = {
+        'aggregate': ('id', 'amount_enc', 'enc_version', 'transaction_type', 'category', 'date',
+                      'credit_card_id', 'account_id'),
+        'list': ('id', 'user_id', 'account_id', 'credit_card_id', 'transfer_to_account_id', 'amount_enc',
+                 'enc_version', 'description_enc', 'category', 'transaction_type', 'date',
+                 'is_debt_payment', 'is_automatic'),
+    }
+    QUERY_PROFILES['list_annotated'] = QUERY_PROFILES['list'] + ('notes_enc', 'creditor_name_enc')
+    QUERY_PROFILES['statement'] = QUERY_PROFILES['list_annotated'] + ('running_balance_enc',)
+
+    @classmethod
+    def profile(cls, name: str):
+        """Opciones de carga para ``query.options(*Transaction.profile('list'))``."""
+        if name == 'detail':
+            return (db.undefer_group('annotations'),)
+        try:
+            columns = cls.QUERY_PROFILES[name]
+        except KeyError:
+            raise ValueError(f'Perfil de consulta desconocido: {name}') from None
+        # version_id siempre: si no está cargado el flush lo lee en ese momento y el
+        # control optimista ya no detecta una rotación ocurrida tras la carga
+        return (load_only(*(getattr(cls, c) for c in columns), cls.version_id),)
+
+    # Tokens HMAC para búsqueda por substring en description/notes
+    search_tokens = db.relationship('TransactionSearchToken', backref='transaction', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True)
+
+    def _set_search_tokens(self, field: str, value: str | None, version: int):
+        """Reemplazar los tokens de búsqueda de ``field`` por los de ``value``."""
+        keep = [tok for tok in self.search_tokens if tok.field != field]
+        self.search_tokens = keep + [
+            TransactionSearchToken(field=field, token_hash=h, enc_version=version, user_id=self.user_id)
+            for h in make_search_tokens(value, version)
+        ]
 
     # ---- Accesores de alto nivel (mantienen API lógica) ----
     @property
     def amount(self) -> float:
-        """Monto desencriptado como float. Se almacena internamente como string decimal cifrada.
+        """Monto desencriptado como float.
 
-        Nota: se usa cuantización a 2 decimales para evitar sorpresas de float.
+        Se almacena cifrado como centavos enteros (formato binario); los blobs
+        legacy con string decimal se siguen leyendo.
         """
-        txt = decrypt_field(self.amount_enc, 'amount', self.enc_version)
-        if txt is None:
+        return self._cached_plain('amount_enc', self._decrypt_amount)
+
+    def _decrypt_amount(self, blob):
+        cents = decrypt_cents(blob, 'amount', self.enc_version)
+        if cents is None:
             return 0.0
-        return float(Decimal(txt))
+        return cents / 100
 
     @amount.setter
     def amount(self, value: float | int | str):
@@ -57,13 +126,23 @@ class Transaction(db.Model):
             raise ValueError('amount no puede ser None')
         if not self.enc_version:
             self.enc_version = get_active_enc_version()
-        # Normalizar a string decimal con 2 decimales
-        dec = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        enc = encrypt_field(str(dec), 'amount', self.enc_version)
+        # Normalizar a centavos (2 decimales, HALF_UP)
+        enc = encrypt_amount(value, 'amount', self.enc_version)
+        self._reset_plain('amount_enc')
         self.amount_enc = enc
+        self.amount_bucket_bidx = amount_bucket_index(to_cents(value), self.enc_version)
+
+    @property
+    def running_balance(self):
+        """Saldo del ámbito (cuenta o tarjeta) después de esta transacción; None si aún no se calculó."""
+        if self.running_balance_enc is None:
+            return None
+        cents = decrypt_cents(self.running_balance_enc, 'running_balance', self.enc_version)
+        return None if cents is None else cents / 100
+
     @property
     def description(self) -> str | None:  # type: ignore[override]
-        return decrypt_field(self.description_enc, 'description', self.enc_version)
+        return self._cached_plain('description_enc', lambda blob: decrypt_field(blob, 'description', self.enc_version))
 
     @description.setter
     def description(self, value: str | None):  # type: ignore[override]
@@ -72,12 +151,14 @@ class Transaction(db.Model):
             self.enc_version = get_active_enc_version()
         version = self.enc_version
         enc, bidx = dual_encrypt(value, 'description', version)
+        self._reset_plain('description_enc')
         self.description_enc = enc
         self.description_bidx = bidx
+        self._set_search_tokens('description', value, version)
 
     @property
     def notes(self) -> str | None:  # type: ignore[override]
-        return decrypt_field(self.notes_enc, 'notes', self.enc_version)
+        return self._cached_plain('notes_enc', lambda blob: decrypt_field(blob, 'notes', self.enc_version))
 
     @notes.setter
     def notes(self, value: str | None):  # type: ignore[override]
@@ -85,12 +166,14 @@ class Transaction(db.Model):
             self.enc_version = get_active_enc_version()
         version = self.enc_version
         enc, bidx = dual_encrypt(value, 'notes', version)
+        self._reset_plain('notes_enc')
         self.notes_enc = enc
         self.notes_bidx = bidx
+        self._set_search_tokens('notes', value, version)
 
     @property
     def creditor_name(self) -> str | None:  # type: ignore[override]
-        return decrypt_field(self.creditor_name_enc, 'creditor_name', self.enc_version)
+        return self._cached_plain('creditor_name_enc', lambda blob: decrypt_field(blob, 'creditor_name', self.enc_version))
 
     @creditor_name.setter
     def creditor_name(self, value: str | None):  # type: ignore[override]
@@ -98,29 +181,36 @@ class Transaction(db.Model):
             self.enc_version = get_active_enc_version()
         version = self.enc_version
         enc, bidx = dual_encrypt(value, 'creditor_name', version)
+        self._reset_plain('creditor_name_enc')
         self.creditor_name_enc = enc
         self.creditor_name_bidx = bidx
     
+    CATEGORY_DISPLAY = {
+        'food': 'Alimentación',
+        'transport': 'Transporte',
+        'entertainment': 'Entretenimiento',
+        'utilities': 'Servicios',
+        'healthcare': 'Salud',
+        'shopping': 'Compras',
+        'education': 'Educación',
+        'travel': 'Viajes',
+        'debt_payment': 'Pago de Deudas',
+        'debt_interest': 'Interés de Deuda',
+        'investment_income': 'Rendimiento de Inversión',
+        'salary': 'Salario',
+        'freelance': 'Trabajos Independientes',
+        'investment': 'Inversiones',
+        'other': 'Otros'
+    }
+
+    @staticmethod
+    def category_label(category):
+        """Nombre legible de una categoría sin necesitar una instancia (consultas por columnas)"""
+        return Transaction.CATEGORY_DISPLAY.get(category, category)
+
     def get_category_display(self):
         """Obtener nombre legible de la categoría"""
-        categories = {
-            'food': 'Alimentación',
-            'transport': 'Transporte',
-            'entertainment': 'Entretenimiento',
-            'utilities': 'Servicios',
-            'healthcare': 'Salud',
-            'shopping': 'Compras',
-            'education': 'Educación',
-            'travel': 'Viajes',
-            'debt_payment': 'Pago de Deudas',
-            'debt_interest': 'Interés de Deuda',
-            'investment_income': 'Rendimiento de Inversión',
-            'salary': 'Salario',
-            'freelance': 'Trabajos Independientes',
-            'investment': 'Inversiones',
-            'other': 'Otros'
-        }
-        return categories.get(self.category, self.category)
+        return Transaction.category_label(self.category)
     
     def get_type_display(self):
         """Obtener nombre legible del tipo de transacción"""
@@ -132,71 +222,33 @@ class Transaction(db.Model):
         return types.get(self.transaction_type, self.transaction_type)
     
     def update_affected_balances(self):
-        """Actualizar balances de todas las cuentas/tarjetas afectadas por esta transacción"""
-        from app.models.account import Account
-        from app.models.credit_card import CreditCard
-        
-        # Actualizar cuenta principal si existe
-        if self.account_id:
-            account = Account.query.get(self.account_id)
-            if account:
-                account.update_balance()
-        
-        # Actualizar tarjeta de crédito si existe
-        if self.credit_card_id:
-            credit_card = CreditCard.query.get(self.credit_card_id)
-            if credit_card:
-                credit_card.update_balance()
-        
-        # Actualizar cuenta destino si es transferencia
-        if self.transfer_to_account_id:
-            target_account = Account.query.get(self.transfer_to_account_id)
-            if target_account:
-                target_account.update_balance()
+        """Reparación: recalcular desde cero los balances de las cuentas/tarjetas afectadas.
+
+        No es necesario en el flujo normal: ``BalanceService`` aplica el delta de cada
+        alta/edición/borrado al hacer flush.
+        """
+        from app.services.balance_service import recompute_balances
+
+        # Cuenta principal, cuenta destino (transferencias) y tarjeta en una sola pasada
+        account_ids = [i for i in (self.account_id, self.transfer_to_account_id) if i]
+        card_ids = [self.credit_card_id] if self.credit_card_id else []
+        recompute_balances(account_ids=account_ids, card_ids=card_ids)
     
     def delete_with_cascade_update(self):
-        """Eliminar transacción y actualizar balances automáticamente"""
+        """Eliminar transacción; el balance de cuenta/tarjeta se ajusta con su delta al hacer flush"""
         from app import db
         
-        # Guardar referencias antes de eliminar
-        account_id = self.account_id
-        credit_card_id = self.credit_card_id
-        transfer_to_account_id = self.transfer_to_account_id
-        
-        # Eliminar la transacción
         db.session.delete(self)
-        
-        # Actualizar balances de las cuentas afectadas
-        if account_id:
-            from app.models.account import Account
-            account = Account.query.get(account_id)
-            if account:
-                account.update_balance()
-        
-        if credit_card_id:
-            from app.models.credit_card import CreditCard
-            credit_card = CreditCard.query.get(credit_card_id)
-            if credit_card:
-                credit_card.update_balance()
-        
-        if transfer_to_account_id:
-            from app.models.account import Account
-            target_account = Account.query.get(transfer_to_account_id)
-            if target_account:
-                target_account.update_balance()
     
     @staticmethod
     def create_with_balance_update(transaction_data):
-        """Crear transacción y actualizar balances automáticamente"""
+        """Crear transacción y actualizar balances automáticamente (delta aplicado en el flush)"""
         from app import db
         
         # Crear la transacción
         transaction = Transaction(**transaction_data)
         db.session.add(transaction)
-        db.session.flush()  # Para obtener el ID sin hacer commit
-        
-        # Actualizar balances
-        transaction.update_affected_balances()
+        db.session.flush()  # Asigna ID y aplica el delta de balance
         
         return transaction
     
@@ -0,0 +1,32 @@
+from app import db
+from sqlalchemy import event
+
+
+class TransactionSearchToken(db.Model):
+    """Token HMAC (palabra o trigrama) de description/notes para búsqueda por substring.
+
+    Se mantiene desde los setters de ``Transaction.description``/``notes``; no
+    contiene texto en claro. Ver ``app.services.transaction_search.search_transactions``.
+    """
+    __tablename__ = 'transaction_search_tokens'
+    __table_args__ = (
+        db.Index('ix_search_tokens_user_token', 'user_id', 'token_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'),
+                               nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    field = db.Column(db.String(20), nullable=False)  # 'description' | 'notes'
+    token_hash = db.Column(db.String(64), nullable=False)
+    enc_version = db.Column(db.SmallInteger, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<TransactionSearchToken tx={self.transaction_id} {self.field}>'
+
+
+@event.listens_for(TransactionSearchToken, 'before_insert')
+def _fill_user_id(mapper, connection, target):
+    # Los setters pueden ejecutarse antes de asignar user_id a la transacción
+    if target.user_id is None and target.transaction is not None:
+        target.user_id = target.transaction.user_id
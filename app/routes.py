@@ -68,7 +68,7 @@ def dashboard():
     
     # Transacciones recientes
     from app.models.transaction import Transaction
-    recent_transactions = Transaction.query.filter_by(
+    recent_transactions = Transaction.query.options(*Transaction.profile('list')).filter_by(
         user_id=current_user.id
     ).order_by(Transaction.date.desc()).limit(10).all()
     
@@ -195,6 +195,16 @@ def income_by_account_report():
 def export_data():
     return ReportController.export_data()
 
+@main_bp.route('/api/reports/monthly')
+@login_required
+def monthly_charts_api():
+    return ReportController.monthly_charts_api()
+
+@main_bp.route('/api/reports/charts/<kind>')
+@login_required
+def chart_data_api(kind):
+    return ReportController.chart_data_api(kind)
+
 
 # ================================
 # RUTAS DE DEUDAS
@@ -0,0 +1,187 @@
+"""Checkpoints mensuales de balance por cuenta.
+
+``Account.get_monthly_balance`` descifraba todas las transacciones anteriores al
+fin de mes en cada consulta. Con la tabla ``balance_checkpoints`` la consulta
+pasa a ser *checkpoint + cola*: el último balance de cierre guardado en o antes
+del mes pedido, más las transacciones posteriores a ese checkpoint.
+
+- El job nocturno (``refresh_account``) escribe los checkpoints de los meses ya
+  cerrados que falten, continuando desde el último existente.
+- Al insertar/editar/borrar una transacción con fecha en un mes que ya tiene
+  checkpoints (transacción retroactiva), ``patch_checkpoints`` suma su efecto a
+  los checkpoints de ese mes en adelante, dentro del mismo flush
+  (lo invoca ``app.services.balance_service``).
+
+Regla de signo (la de ``get_monthly_balance``): income suma, el resto resta.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db
+from app.models.balance_checkpoint import BalanceCheckpoint
+from app.utils.crypto_fields import decrypt_cents, decrypt_column, encrypt_cents
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(period: date) -> date:
+    return date(period.year + 1, 1, 1) if period.month == 12 else date(period.year, period.month + 1, 1)
+
+
+def monthly_effect(tx_type: str, cents: int) -> int:
+    return cents if tx_type == 'income' else -cents
+
+
+def _as_datetime(period: date) -> datetime:
+    # Transaction.date es DateTime: comparar contra medianoche del día
+    return datetime(period.year, period.month, period.day)
+
+
+class BalanceCheckpointService:
+    """Escritura, parcheo y lectura de checkpoints de balance mensual."""
+
+    @staticmethod
+    def _tail_rows(account, start: Optional[date], end: date):
+        from app.models.transaction import Transaction
+
+        query = db.session.query(
+            Transaction.date,
+            Transaction.transaction_type,
+            Transaction.amount_enc,
+            Transaction.enc_version,
+        ).filter(
+            Transaction.account_id == account.id,
+            Transaction.user_id == account.user_id,
+            Transaction.date < _as_datetime(end),
+        )
+        if start is not None:
+            query = query.filter(Transaction.date >= _as_datetime(start))
+        rows = query.order_by(Transaction.date.asc()).all()
+        cents = decrypt_column(rows, 2, 'amount', version_index=3, kind='cents')
+        return rows, cents
+
+    @staticmethod
+    def latest(account_id: int, period: Optional[date] = None) -> Optional[BalanceCheckpoint]:
+        """Último checkpoint de la cuenta (en o antes de ``period`` si se indica)."""
+        query = BalanceCheckpoint.query.filter(BalanceCheckpoint.account_id == account_id)
+        if period is not None:
+            query = query.filter(BalanceCheckpoint.period <= period)
+        return query.order_by(BalanceCheckpoint.period.desc()).first()
+
+    @staticmethod
+    def balance_at(account, year: int, month: int) -> float:
+        """Balance al cierre del mes: checkpoint + transacciones posteriores al checkpoint."""
+        period = date(year, month, 1)
+        checkpoint = BalanceCheckpointService.latest(account.id, period)
+        total = checkpoint.balance_cents if checkpoint else 0
+        start = next_month(checkpoint.period) if checkpoint else None
+        end = next_month(period)
+        if start is None or start < end:
+            rows, cents = BalanceCheckpointService._tail_rows(account, start, end)
+            total += sum(monthly_effect(row[1], c) for row, c in zip(rows, cents))
+        return total / 100
+
+    @staticmethod
+    def month_end_series(account, first: date, last: date) -> List[Tuple[date, float]]:
+        """Balances de cierre de ``first`` a ``last`` (inclusive) para gráficas históricas.
+
+        Una sola consulta de checkpoints; los meses sin checkpoint (p.ej. el mes
+        en curso) se completan con ``balance_at``.
+        """
+        first, last = month_start(first), month_start(last)
+        stored = {
+            cp.period: cp.balance_cents
+            for cp in BalanceCheckpoint.query.filter(
+                BalanceCheckpoint.account_id == account.id,
+                BalanceCheckpoint.period >= first,
+                BalanceCheckpoint.period <= last,
+            )
+        }
+        series = []
+        period = first
+        while period <= last:
+            if period in stored:
+                series.append((period, stored[period] / 100))
+            else:
+                series.append((period, BalanceCheckpointService.balance_at(account, period.year, period.month)))
+            period = next_month(period)
+        return series
+
+    @staticmethod
+    def refresh_account(account, until: Optional[date] = None) -> int:
+        """Escribir los checkpoints de meses cerrados que falten (job nocturno).
+
+        Continúa desde el último checkpoint existente, así que cada ejecución sólo
+        descifra las transacciones nuevas. Devuelve los checkpoints escritos (sin commit).
+        """
+        until = month_start(until or datetime.utcnow())  # primer mes aún abierto
+        last = BalanceCheckpointService.latest(account.id)
+        start = next_month(last.period) if last else None
+        if start is not None and start >= until:
+            return 0
+        rows, cents = BalanceCheckpointService._tail_rows(account, start, until)
+        if start is None:
+            if not rows:
+                return 0
+            start = month_start(rows[0][0])
+
+        running = last.balance_cents if last else 0
+        written = 0
+        i = 0
+        period = start
+        while period < until:
+            end = _as_datetime(next_month(period))
+            while i < len(rows) and rows[i][0] < end:
+                running += monthly_effect(rows[i][1], cents[i])
+                i += 1
+            checkpoint = BalanceCheckpoint(account_id=account.id, period=period, enc_version=account.enc_version)
+            checkpoint.balance_cents = running
+            db.session.add(checkpoint)
+            written += 1
+            period = next_month(period)
+        return written
+
+    @staticmethod
+    def rebuild_account(account, until: Optional[date] = None) -> int:
+        """Reparación: borrar y regenerar todos los checkpoints de la cuenta."""
+        BalanceCheckpoint.query.filter_by(account_id=account.id).delete(synchronize_session=False)
+        return BalanceCheckpointService.refresh_account(account, until)
+
+
+def patch_checkpoints(session, conn, account_id: int, items: Sequence[Tuple]) -> int:
+    """Sumar el efecto de transacciones (``(tipo, centavos firmados, fecha, ...)``) a los
+    checkpoints del mes de cada una en adelante. Devuelve checkpoints reescritos."""
+    deltas: Dict[date, int] = {}
+    for tx_type, cents, tx_date, *_ in items:
+        period = month_start(tx_date or datetime.utcnow())
+        deltas[period] = deltas.get(period, 0) + monthly_effect(tx_type, cents)
+    deltas = {p: d for p, d in deltas.items() if d}
+    if not deltas:
+        return 0
+    table = BalanceCheckpoint.__table__
+    rows = conn.execute(
+        select(table.c.id, table.c.period, table.c.balance_enc, table.c.enc_version)
+        .where(table.c.account_id == account_id, table.c.period >= min(deltas))
+        .order_by(table.c.period).with_for_update()
+    ).all()
+    patched = 0
+    for row in rows:
+        delta = sum(d for p, d in deltas.items() if p <= row.period)
+        if not delta:
+            continue
+        version = row.enc_version or 1
+        current = decrypt_cents(row.balance_enc, 'account_balance', version) or 0
+        blob = encrypt_cents(current + delta, 'account_balance', version)
+        conn.execute(update(table).where(table.c.id == row.id).values(balance_enc=blob))
+        loaded = session.identity_map.get(session.identity_key(BalanceCheckpoint, row.id))
+        if loaded is not None:
+            set_committed_value(loaded, 'balance_enc', blob)
+        patched += 1
+    return patched
@@ -0,0 +1,478 @@
+"""Mantenimiento incremental de balances de cuentas y tarjetas.
+
+En lugar de recalcular el balance descifrando todo el historial en cada alta,
+edición o borrado de una transacción, un listener de la sesión aplica el *delta*
+firmado de cada cambio al balance cifrado almacenado, dentro de la misma
+transacción de base de datos:
+
+- ``before_flush``: por cada Transaction nueva, modificada (monto, tipo, cuenta o
+  tarjeta) o eliminada se registra su efecto: ``+`` valores nuevos, ``-`` valores
+  previos (leídos de la fila en DB, que aún no se ha escrito).
+- ``after_flush``: por cada cuenta/tarjeta afectada (en orden de id) se lee el
+  balance y su ``version_id``, se suma el delta y se escribe con
+  ``UPDATE ... WHERE version_id = :leída`` (control optimista, ver
+  ``versioned_update``); si otra escritura ganó, se relee y reintenta hasta
+  ``MAX_VERSION_RETRIES`` veces. El objeto en memoria se sincroniza con
+  ``set_committed_value``.
+  Los checkpoints mensuales (``balance_checkpoints``) del mes de la transacción
+  en adelante reciben el mismo delta, y el saldo acumulado por transacción
+  (``running_balance_enc``) se reescribe desde la transacción afectada
+  (``app.services.running_balance``), y los rollups mensuales de reportes
+  (``monthly_rollups``) reciben el delta de monto y conteo
+  (``app.services.monthly_rollup``).
+
+Crear una transacción cuesta O(1). El recálculo completo sigue disponible como
+reparación explícita: ``recompute_balances`` (muchas cuentas/tarjetas en una sola
+pasada por lotes) o ``Account.update_balance()`` / ``CreditCard.update_balance()``.
+
+Reglas de signo (idénticas a ``Account.calculate_current_balance`` y
+``CreditCard.update_balance``):
+- Cuenta normal: income suma; expense y transfer restan.
+- Cuenta de deuda: income (cargos/intereses) suma; expense (pagos) resta.
+- Tarjeta: expense suma deuda; income (pagos) resta. Se guarda la suma sin recortar
+  (negativa = saldo a favor) y sólo ``current_balance``/``minimum_payment`` la
+  muestran como 0, para que incremental y recálculo coincidan. Se escribe con
+  ``CreditCard.apply_balance_delta`` (también refresca ``minimum_payment`` y la marca
+  de agua ``balance_applied_tx_id``).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, event, inspect, or_, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db
+from app.services.balance_checkpoint_service import patch_checkpoints
+from app.services.monthly_rollup import ROLLUP_TRACKED, apply_rollup_changes, rollup_entry
+from app.services.report_memo import invalidate_report_memo
+from app.services.running_balance import apply_changes as apply_running_changes, scope_of
+from app.utils.crypto_fields import decrypt_cents, decrypt_column, decrypt_many, encrypt_cents, to_cents
+
+_SESSION_KEY = 'balance_deltas'
+_RUNNING_KEY = 'running_balance_changes'
+_ROLLUP_KEY = 'monthly_rollup_changes'
+RECOMPUTE_CHUNK = 500  # ids por consulta IN en recompute_balances
+MAX_VERSION_RETRIES = 5  # reintentos de un delta ante conflicto de version_id
+_TRACKED = ('amount_enc', 'enc_version', 'transaction_type', 'account_id', 'credit_card_id', 'date')
+_ROLLUP_TRACKED = _TRACKED + tuple(a for a in ROLLUP_TRACKED if a not in _TRACKED)
+
+
+def account_effect(tx_type: str, cents: int, is_debt: bool) -> int:
+    """Efecto firmado (centavos) de una transacción sobre el balance de una cuenta."""
+    if tx_type == 'income':
+        return cents
+    if tx_type == 'expense':
+        return -cents
+    return 0 if is_debt else -cents
+
+
+def card_effect(tx_type: str, cents: int) -> int:
+    """Efecto firmado (centavos) de una transacción sobre la deuda de una tarjeta."""
+    if tx_type == 'expense':
+        return cents
+    if tx_type == 'income':
+        return -cents
+    return 0
+
+
+class BalanceService:
+    """Aplicación de deltas de balance y recálculo explícito."""
+
+    @staticmethod
+    def install() -> None:
+        """Registrar los listeners de sesión (idempotente)."""
+        if not event.contains(Session, 'before_flush', _before_flush):
+            event.listen(Session, 'before_flush', _before_flush)
+            event.listen(Session, 'after_flush', _after_flush)
+            event.listen(Session, 'after_soft_rollback', _discard_pending)
+
+    @staticmethod
+    def recompute_account(account) -> float:
+        """Reparación: recalcular el balance desde todas las transacciones."""
+        recompute_balances(account_ids=[account.id], card_ids=[])
+        return account.balance
+
+    @staticmethod
+    def recompute_card(card) -> float:
+        """Reparación: recalcular la deuda de la tarjeta desde todas sus transacciones."""
+        recompute_balances(account_ids=[], card_ids=[card.id])
+        return card.current_balance
+
+
+def _chunks(ids: Sequence[int], size: int) -> Iterable[List[int]]:
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def recompute_balances(
+    account_ids: Optional[Iterable[int]] = None,
+    card_ids: Optional[Iterable[int]] = None,
+    write: bool = True,
+    chunk_size: int = RECOMPUTE_CHUNK,
+    session=None,
+) -> Dict[str, Any]:
+    """Recalcular balances de muchas cuentas/tarjetas desde el ledger, por lotes.
+
+    ``None`` significa "todas" (``[]`` = ninguna). Por cada lote de ``chunk_size``
+    ids: una consulta trae ``(account_id, credit_card_id, tipo, amount_enc,
+    enc_version, id)`` de todas sus transacciones, se descifra en bloque, se agrupa
+    en memoria y se compara con el balance guardado. Con ``write=True`` las filas
+    que difieren se escriben con un único UPDATE masivo (executemany) por tabla que
+    exige el ``version_id`` leído; las filas que otra escritura cambió en el
+    intervalo se recalculan de nuevo (hasta ``MAX_VERSION_RETRIES`` veces).
+
+    Devuelve estadísticas y la deriva encontrada:
+    ``{'accounts', 'cards', 'transactions', 'written', 'seconds',
+    'drift': [{'kind', 'id', 'stored', 'computed'}]}`` (montos en centavos).
+    No hace commit.
+    """
+    from app.models.account import Account
+    from app.models.credit_card import CreditCard
+
+    session = session or db.session
+    started = time.monotonic()
+    stats: Dict[str, Any] = {'accounts': 0, 'cards': 0, 'transactions': 0, 'written': 0, 'drift': []}
+    if account_ids is None:
+        account_ids = [r[0] for r in session.execute(select(Account.__table__.c.id))]
+    if card_ids is None:
+        card_ids = [r[0] for r in session.execute(select(CreditCard.__table__.c.id))]
+    for ids in _chunks(list(account_ids), chunk_size):
+        _recompute_chunk(_recompute_account_chunk, 'account', session, ids, write, stats)
+    for ids in _chunks(list(card_ids), chunk_size):
+        _recompute_chunk(_recompute_card_chunk, 'card', session, ids, write, stats)
+    if stats['written']:
+        invalidate_report_memo()  # UPDATE de Core: no pasa por after_flush
+    stats['seconds'] = time.monotonic() - started
+    return stats
+
+
+def _ledger_rows(session, column, ids: List[int]):
+    from app.models.transaction import Transaction
+
+    table = Transaction.__table__
+    rows = session.execute(
+        select(table.c[column], table.c.transaction_type, table.c.amount_enc, table.c.enc_version, table.c.id)
+        .where(table.c[column].in_(ids))
+    ).all()
+    return rows, decrypt_column(rows, 2, 'amount', version_index=3, kind='cents', parallel=True)
+
+
+def _recompute_chunk(recompute, kind: str, session, ids: List[int], write: bool, stats: Dict[str, Any]) -> None:
+    """Ejecutar un lote y repetir sólo las filas cuyo ``version_id`` cambió antes del UPDATE."""
+    lost = recompute(session, ids, write, stats)
+    for _ in range(MAX_VERSION_RETRIES):
+        if not lost:
+            return
+        # La deriva medida para esas filas ya no vale: se vuelve a medir
+        stats['drift'] = [d for d in stats['drift'] if not (d['kind'] == kind and d['id'] in lost)]
+        retry: Dict[str, Any] = {'accounts': 0, 'cards': 0, 'transactions': 0, 'written': 0, 'drift': []}
+        lost = recompute(session, sorted(lost), write, retry)
+        stats['written'] += retry['written']
+        stats['drift'].extend(retry['drift'])
+    if lost:
+        raise StaleDataError(f'{kind} ids={sorted(lost)[:20]}: version_id cambió en {MAX_VERSION_RETRIES} reintentos')
+
+
+def _write_versioned(session, model, params: List[Dict[str, Any]], blob_column: str) -> Tuple[int, List[int]]:
+    """UPDATE masivo con ``WHERE version_id = :leída``. Devuelve (escritas, ids a recalcular).
+
+    ``params`` trae ``b_id``, ``b_read`` (versión leída), ``b_version`` (nueva) y los
+    valores de las columnas. executemany no da el rowcount por fila, así que se
+    releen versión y blob: el cifrado es aleatorio, un blob igual al enviado
+    prueba que la fila es la que escribimos. Sólo esas se sincronizan en la sesión.
+    """
+    table = model.__table__
+    columns = [k for k in params[0] if not k.startswith('b_')]
+    session.execute(
+        update(table).where(table.c.id == bindparam('b_id'), table.c.version_id == bindparam('b_read'))
+        .values(**{c: bindparam(c) for c in columns}, version_id=bindparam('b_version')), params)
+    current = {
+        r.id: r for r in session.execute(
+            select(table.c.id, table.c.version_id, table.c[blob_column])
+            .where(table.c.id.in_([p['b_id'] for p in params])))
+    }
+    written, lost = 0, []
+    for p in params:
+        row = current.get(p['b_id'])
+        if row is None:
+            continue  # borrada en el intervalo
+        if row.version_id != p['b_version'] or bytes(row[2]) != p[blob_column]:
+            lost.append(p['b_id'])
+            continue
+        _sync(session, model, p['b_id'], {**{c: p[c] for c in columns}, 'version_id': p['b_version']})
+        written += 1
+    return written, lost
+
+
+def _recompute_account_chunk(session, ids: List[int], write: bool, stats: Dict[str, Any]) -> List[int]:
+    from app.models.account import Account
+
+    table = Account.__table__
+    accounts = session.execute(
+        select(table.c.id, table.c.balance_enc, table.c.enc_version, table.c.is_debt_account,
+               table.c.original_debt_amount, table.c.version_id).where(table.c.id.in_(ids))
+    ).all()
+    if not accounts:
+        return []
+    rows, amounts = _ledger_rows(session, 'account_id', ids)
+    is_debt = {a.id: bool(a.is_debt_account) for a in accounts}
+    computed = {a.id: to_cents(a.original_debt_amount or 0) if a.is_debt_account else 0 for a in accounts}
+    for (account_id, tx_type, _, _, _), cents in zip(rows, amounts):
+        if account_id in computed:
+            computed[account_id] += account_effect(tx_type, cents, is_debt[account_id])
+    stored = decrypt_many([a.balance_enc for a in accounts], 'account_balance',
+                          [a.enc_version for a in accounts], kind='cents')
+    params = []
+    for a, current in zip(accounts, stored):
+        new = computed[a.id]
+        if a.balance_enc is not None and current == new:
+            continue
+        stats['drift'].append({'kind': 'account', 'id': a.id, 'stored': current, 'computed': new})
+        params.append({'b_id': a.id, 'b_read': a.version_id, 'b_version': (a.version_id or 1) + 1,
+                       'balance_enc': encrypt_cents(new, 'account_balance', a.enc_version or 1)})
+    stats['accounts'] += len(accounts)
+    stats['transactions'] += len(rows)
+    if not (write and params):
+        return []
+    written, lost = _write_versioned(session, Account, params, 'balance_enc')
+    stats['written'] += written
+    return lost
+
+
+def _recompute_card_chunk(session, ids: List[int], write: bool, stats: Dict[str, Any]) -> List[int]:
+    from app.models.credit_card import CreditCard
+
+    table = CreditCard.__table__
+    cards = session.execute(
+        select(table.c.id, table.c.current_balance_enc, table.c.enc_version, table.c.balance_applied_tx_id,
+               table.c.version_id).where(table.c.id.in_(ids))
+    ).all()
+    if not cards:
+        return []
+    rows, amounts = _ledger_rows(session, 'credit_card_id', ids)
+    computed = {c.id: 0 for c in cards}
+    high_water = {c.id: 0 for c in cards}
+    for (card_id, tx_type, _, _, tx_id), cents in zip(rows, amounts):
+        if card_id in computed:
+            computed[card_id] += card_effect(tx_type, cents)
+            high_water[card_id] = max(high_water[card_id], tx_id)
+    stored = decrypt_many([c.current_balance_enc for c in cards], 'cc_current_balance',
+                          [c.enc_version for c in cards], kind='cents')
+    params = []
+    for c, current in zip(cards, stored):
+        new = computed[c.id]  # suma sin recortar, igual que apply_balance_delta
+        if c.current_balance_enc is not None and current == new and (c.balance_applied_tx_id or 0) >= high_water[c.id]:
+            continue
+        if current != new or c.current_balance_enc is None:
+            stats['drift'].append({'kind': 'card', 'id': c.id, 'stored': current, 'computed': new})
+        params.append({
+            'b_id': c.id,
+            'b_read': c.version_id,
+            'b_version': (c.version_id or 1) + 1,
+            'current_balance_enc': encrypt_cents(new, 'cc_current_balance', c.enc_version or 1),
+            'minimum_payment': CreditCard.minimum_payment_for(new / 100),
+            'balance_applied_tx_id': high_water[c.id],
+        })
+    stats['cards'] += len(cards)
+    stats['transactions'] += len(rows)
+    if not (write and params):
+        return []
+    written, lost = _write_versioned(session, CreditCard, params, 'current_balance_enc')
+    stats['written'] += written
+    return lost
+
+
+def _target(obj, fk: str, rel: str):
+    """Id del destino, o el objeto relacionado pendiente si aún no tiene id."""
+    value = getattr(obj, fk)
+    if value is not None:
+        return value
+    return obj.__dict__.get(rel)
+
+
+def _entries(values: Dict[str, Any], sign: int, account, card, tx) -> List[Tuple[str, Any, str, int, Any, Any]]:
+    if values['amount_enc'] is None:
+        return []
+    cents = decrypt_cents(values['amount_enc'], 'amount', values['enc_version'] or 1) or 0
+    out = []
+    if account is not None:
+        out.append(('account', account, values['transaction_type'], sign * cents, values['date'], tx))
+    if card is not None:
+        out.append(('card', card, values['transaction_type'], sign * cents, values['date'], tx))
+    return out
+
+
+def _before_flush(session, flush_context, instances):
+    from app.models.transaction import Transaction
+
+    entries: List[Tuple[str, Any, str, int, Any, Any]] = []
+    running: List[Any] = []  # Transaction (valores nuevos) o (ámbito, id, clave previa)
+    rollups: List[Any] = []  # Transaction (valores nuevos) o entrada de rollup previa
+    old_ids = []
+    balance_ids = set()  # transacciones que afectan balances (el resto sólo rollups)
+    changed = []
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Transaction):
+                values = {a: getattr(obj, a) for a in _TRACKED}
+                entries.extend(_entries(values, +1, _target(obj, 'account_id', 'account'),
+                                        _target(obj, 'credit_card_id', 'credit_card'), obj))
+                running.append(obj)
+                rollups.append(obj)
+        for obj in session.deleted:
+            if isinstance(obj, Transaction) and obj.id is not None:
+                old_ids.append(obj.id)
+                balance_ids.add(obj.id)
+        for obj in session.dirty:
+            if not isinstance(obj, Transaction) or obj.id is None:
+                continue
+            state = inspect(obj)
+            modified = {a for a in _ROLLUP_TRACKED if state.attrs[a].history.has_changes()}
+            if modified:
+                old_ids.append(obj.id)
+                changed.append(obj)
+                if modified & set(_TRACKED):
+                    balance_ids.add(obj.id)
+        if old_ids:
+            table = Transaction.__table__
+            rows = session.connection().execute(
+                select(table.c.id, *(table.c[a] for a in _ROLLUP_TRACKED)).where(table.c.id.in_(old_ids))
+            ).mappings().all()
+            for row in rows:
+                rollups.append(rollup_entry(row, -1))
+                if row['id'] not in balance_ids:
+                    continue
+                entries.extend(_entries(dict(row), -1, row['account_id'], row['credit_card_id'], row['id']))
+                scope = scope_of(row['account_id'], row['credit_card_id'])
+                if scope:
+                    running.append((*scope, (row['date'], row['id'])))
+        for obj in changed:
+            rollups.append(obj)
+            if obj.id not in balance_ids:
+                continue
+            values = {a: getattr(obj, a) for a in _TRACKED}
+            entries.extend(_entries(values, +1, _target(obj, 'account_id', 'account'),
+                                    _target(obj, 'credit_card_id', 'credit_card'), obj))
+            running.append(obj)
+    if entries:
+        session.info.setdefault(_SESSION_KEY, []).extend(entries)
+    if running:
+        session.info.setdefault(_RUNNING_KEY, []).extend(running)
+    if rollups:
+        session.info.setdefault(_ROLLUP_KEY, []).extend(rollups)
+
+
+def _discard_pending(session, previous_transaction):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_RUNNING_KEY, None)
+    session.info.pop(_ROLLUP_KEY, None)
+
+
+def _resolve_id(target) -> Optional[int]:
+    return target if isinstance(target, int) else getattr(target, 'id', None)
+
+
+def _running_changes(items: List[Any]):
+    for item in items:
+        if isinstance(item, tuple):
+            yield item
+            continue
+        # Transaction nueva/editada: ya tiene id, fecha por defecto y FKs tras el flush
+        scope = scope_of(item.account_id, item.credit_card_id)
+        if scope and item.id is not None:
+            yield (*scope, (item.date, item.id))
+
+
+def _after_flush(session, flush_context):
+    changes = session.info.pop(_RUNNING_KEY, None)
+    if changes:
+        apply_running_changes(session, session.connection(), _running_changes(changes))
+    rollups = session.info.pop(_ROLLUP_KEY, None)
+    if rollups:
+        apply_rollup_changes(session, session.connection(), rollups)
+    entries = session.info.pop(_SESSION_KEY, None)
+    if not entries:
+        return
+    grouped: Dict[Tuple[str, int], List[Tuple[str, int, Any, Optional[int]]]] = defaultdict(list)
+    for kind, target, tx_type, cents, tx_date, tx in entries:
+        target_id = _resolve_id(target)
+        if target_id is not None and cents:
+            grouped[(kind, target_id)].append((tx_type, cents, tx_date, _resolve_id(tx)))
+    conn = session.connection()
+    for (kind, target_id) in sorted(grouped):
+        if kind == 'account':
+            _apply_account(session, conn, target_id, grouped[(kind, target_id)])
+            # Transacciones retroactivas: parchear checkpoints mensuales del mes en adelante
+            patch_checkpoints(session, conn, target_id, grouped[(kind, target_id)])
+        else:
+            _apply_card(session, conn, target_id, grouped[(kind, target_id)])
+
+
+def versioned_update(conn, table, row_id: int, columns: Sequence[str], compute,
+                     retries: int = MAX_VERSION_RETRIES) -> Optional[Dict[str, Any]]:
+    """Leer-calcular-escribir una fila con control optimista sobre ``version_id``.
+
+    ``compute(row)`` recibe la fila leída (``columns`` + ``version_id``) y devuelve
+    los valores a escribir, o None si no hay nada que escribir. El UPDATE exige la
+    versión leída y la incrementa; si no afecta filas (otra transacción escribió
+    primero) se relee y se vuelve a calcular. Devuelve los valores escritos
+    (incluido el nuevo ``version_id``) o None. Lanza ``StaleDataError`` si se agotan
+    los reintentos.
+    """
+    for _ in range(retries):
+        row = conn.execute(
+            select(*(table.c[c] for c in columns), table.c.version_id).where(table.c.id == row_id)
+        ).first()
+        if row is None:
+            return None
+        values = compute(row)
+        if values is None:
+            return None
+        current = row.version_id or 1
+        values['version_id'] = current + 1
+        result = conn.execute(
+            update(table).where(table.c.id == row_id, table.c.version_id == row.version_id).values(**values)
+        )
+        if result.rowcount == 1:
+            return values
+    raise StaleDataError(f'{table.name} id={row_id}: version_id cambió en {retries} intentos seguidos')
+
+
+def _sync(session, model, target_id: int, values: Dict[str, Any]) -> None:
+    obj = session.identity_map.get(session.identity_key(model, target_id))  # type: ignore[arg-type]
+    if obj is None:
+        return
+    for attr, value in values.items():
+        set_committed_value(obj, attr, value)
+    obj._reset_plain()
+
+
+def _apply_account(session, conn, account_id: int, items: List[Tuple[str, int, Any, Optional[int]]]) -> None:
+    from app.models.account import Account
+
+    def compute(row):
+        delta = sum(account_effect(tx_type, cents, bool(row.is_debt_account)) for tx_type, cents, _, _ in items)
+        if not delta:
+            return None
+        version = row.enc_version or 1
+        current = decrypt_cents(row.balance_enc, 'account_balance', version) or 0
+        return {'balance_enc': encrypt_cents(current + delta, 'account_balance', version)}
+
+    values = versioned_update(conn, Account.__table__, account_id,
+                              ('balance_enc', 'enc_version', 'is_debt_account'), compute)
+    if values:
+        _sync(session, Account, account_id, values)
+
+
+def _apply_card(session, conn, card_id: int, items: List[Tuple[str, int, Any, Optional[int]]]) -> None:
+    from app.models.credit_card import CreditCard
+
+    delta = sum(card_effect(tx_type, cents) for tx_type, cents, _, _ in items)
+    high_water = max((tx_id for _, cents, _, tx_id in items if tx_id is not None and cents > 0), default=None)
+    CreditCard.apply_balance_delta(session, card_id, delta, applied_tx_id=high_water)
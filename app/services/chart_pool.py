@@ -0,0 +1,186 @@
+"""Pool de procesos para dibujar gráficas fuera del worker web.
+
+``report_charts.render`` es CPU puro (matplotlib) y bloqueaba el request. Con
+``CHART_RENDER_WORKERS > 0`` las gráficas que no están en caché se envían a un
+``ProcessPoolExecutor`` propio de cada proceso web:
+
+- Las gráficas independientes de una página se dibujan en paralelo
+  (``render_many``) con un único plazo de ``CHART_RENDER_TIMEOUT`` segundos.
+- La cola está acotada a ``CHART_RENDER_MAX_PENDING`` dibujos en curso o en
+  espera; si está llena la gráfica no se encola.
+- Una gráfica que no termina a tiempo, que no cabe en la cola o cuyo worker
+  falla devuelve ``None``: ``ReportService`` muestra ``report_charts.placeholder()``
+  y no la guarda en caché, así que el siguiente request lo vuelve a intentar.
+
+Los workers se crean con ``fork``: con ``spawn``/``forkserver`` el hijo importaría
+el paquete ``app`` (donde vive ``report_charts``) y el ``__main__`` del proceso
+(``run.py``), que ejecutan ``create_app()``. Hacer fork de un proceso con hilos
+puede dejar al hijo con locks tomados (logging, pool de conexiones, pool de
+descifrado), así que los workers se crean una sola vez en ``init_render_pool``,
+llamado desde ``create_app()`` antes de que arranquen el scheduler, el pool de
+descifrado o los hilos del servidor. Un request nunca hace fork: si el pool no
+está listo (no se inició en este proceso, o un worker murió) se dibuja en el
+propio proceso. Con ``gunicorn --preload`` la app se crea en el master: llamar
+``init_render_pool(app)`` en el hook ``post_fork`` para que cada worker tenga el
+suyo. Sin ``fork`` (Windows) o con ``CHART_RENDER_WORKERS=0`` se dibuja en el
+propio proceso.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import report_charts
+
+logger = logging.getLogger(__name__)
+
+# nombre -> (tipo de gráfica, spec)
+Jobs = Dict[str, Tuple[str, Dict[str, Any]]]
+
+
+class ChartRenderPool:
+    """Executor de procesos con cola acotada y plazo por página."""
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, timeout: float = 10.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self.stats = {'rendered': 0, 'timeouts': 0, 'rejected': 0, 'errors': 0}
+
+    def start(self) -> None:
+        """Crear el executor y sus workers ahora (llamar sólo mientras el proceso no tiene hilos)."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            # Con fork el executor crea todos sus workers en el primer envío: forzarlo aquí
+            executor.submit(os.getpid).result()
+            self._executor, self._pid = executor, os.getpid()
+
+    def ready(self) -> bool:
+        return self._executor is not None and self._pid == os.getpid()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        # Nunca crear el executor aquí: se llama desde hilos de request (ver ``start``)
+        with self._lock:
+            return self._executor if self._pid == os.getpid() else None
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Descartar un executor roto (un worker murió); se dibuja en proceso hasta ``init_render_pool``."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                logger.error('[chart-pool] pool descartado; las gráficas se dibujan en el proceso web')
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, kind: str, spec: Dict[str, Any]) -> Optional[Tuple[Future, ProcessPoolExecutor]]:
+        if not self._slots.acquire(blocking=False):
+            self.stats['rejected'] += 1
+            logger.warning('[chart-pool] cola llena (%d), %s no se encola', self.max_pending, kind)
+            return None
+        executor = self._get_executor()
+        if executor is None:
+            self._slots.release()
+            self.stats['errors'] += 1
+            return None
+        try:
+            future = executor.submit(report_charts.render, kind, spec)
+        except (BrokenProcessPool, RuntimeError) as exc:
+            self._slots.release()
+            self.stats['errors'] += 1
+            logger.warning('[chart-pool] no se pudo encolar %s: %s', kind, exc)
+            self._discard(executor)
+            return None
+        # El lugar en la cola se libera al terminar, aunque el request ya no espere el resultado
+        future.add_done_callback(lambda _: self._slots.release())
+        return future, executor
+
+    def _result(self, kind: str, submitted: Optional[Tuple[Future, ProcessPoolExecutor]]) -> Optional[str]:
+        if submitted is None:
+            return None
+        future, executor = submitted
+        if not future.done():
+            future.cancel()  # sólo cancela si aún no empezó; si está corriendo termina en segundo plano
+            self.stats['timeouts'] += 1
+            logger.warning('[chart-pool] %s no terminó en %.1fs', kind, self.timeout)
+            return None
+        try:
+            value = future.result()
+        except BrokenProcessPool as exc:
+            self.stats['errors'] += 1
+            logger.error('[chart-pool] worker caído dibujando %s: %s', kind, exc)
+            self._discard(executor)
+            return None
+        except Exception:
+            self.stats['errors'] += 1
+            logger.exception('[chart-pool] error dibujando %s', kind)
+            return None
+        self.stats['rendered'] += 1
+        return value
+
+    def render_many(self, jobs: Jobs) -> Dict[str, Optional[str]]:
+        """Dibujar en paralelo; ``None`` para las que no terminan dentro del plazo."""
+        submitted = {name: self._submit(kind, spec) for name, (kind, spec) in jobs.items()}
+        wait([s[0] for s in submitted.values() if s is not None], timeout=self.timeout)
+        return {name: self._result(jobs[name][0], item) for name, item in submitted.items()}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[ChartRenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_render_pool(app) -> Optional[ChartRenderPool]:
+    """Crear el pool del proceso según la config de ``app`` (lo llama ``create_app``).
+
+    Debe ejecutarse antes de que el proceso tenga hilos. Idempotente: otra llamada
+    en el mismo proceso con la misma config reutiliza el pool ya iniciado.
+    """
+    global _pool
+    cfg = app.config
+    workers = int(cfg.get('CHART_RENDER_WORKERS', 0))
+    if workers <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    settings = (workers, int(cfg.get('CHART_RENDER_MAX_PENDING', 16)), float(cfg.get('CHART_RENDER_TIMEOUT', 10)))
+    with _pool_lock:
+        pool = _pool
+        if pool is None or (pool.workers, pool.max_pending, pool.timeout) != settings:
+            if pool is not None:
+                pool.shutdown()
+            pool = _pool = ChartRenderPool(*settings)
+    pool.start()
+    return pool
+
+
+def get_render_pool() -> Optional[ChartRenderPool]:
+    """Pool listo en este proceso (None = dibujar en el propio proceso)."""
+    from flask import current_app, has_app_context
+
+    if not has_app_context() or int(current_app.config.get('CHART_RENDER_WORKERS', 0)) <= 0:
+        return None
+    pool = _pool
+    return pool if pool is not None and pool.ready() else None
+
+
+def render_many(jobs: Jobs) -> Dict[str, Optional[str]]:
+    """PNG base64 por nombre; en el pool si está activo, si no en este proceso."""
+    if not jobs:
+        return {}
+    pool = get_render_pool()
+    if pool is None:
+        return {name: report_charts.render(kind, spec) for name, (kind, spec) in jobs.items()}
+    return pool.render_many(jobs)
@@ -1,8 +1,13 @@
+import logging
 from datetime import datetime
 from app import db
 from app.models.user import User
 from app.models.account import Account
 from app.models.credit_card import CreditCard
+from app.services.balance_checkpoint_service import BalanceCheckpointService
+from app.services.balance_service import recompute_balances
+
+logger = logging.getLogger(__name__)
 
 
 class DailyMaintenanceService:
@@ -13,9 +18,9 @@ class DailyMaintenanceService:
         """Ejecuta el mantenimiento diario para todos los usuarios.
 
         Acciones:
-        - Actualizar balances de cuentas y tarjetas basados en transacciones.
+        - Verificar balances de cuentas y tarjetas contra el ledger (recompute_balances) y reparar deriva.
         - Aplicar rendimientos/intereses de inversión según frecuencia configurada (si corresponde).
-        - Recalcular pagos mínimos de tarjetas.
+        - Escribir checkpoints de balance de meses cerrados.
         Nota: No aplica intereses de cuentas de deuda automáticamente a diario para evitar duplicados.
         """
         # Procesar usuarios por lotes
@@ -24,6 +29,10 @@ class DailyMaintenanceService:
         total_accounts = 0
         total_cards = 0
         created_auto_entries = 0
+        total_checkpoints = 0
+        total_repaired = 0
+        account_ids = []
+        card_ids = []
 
         for user in users:
             # Cuentas del usuario
@@ -59,21 +68,28 @@ class DailyMaintenanceService:
                 except Exception:
                     pass
 
-                # Recalcular balance en base a transacciones
+                # Checkpoints de balance de los meses cerrados que falten
                 try:
-                    account.update_balance()
+                    total_checkpoints += BalanceCheckpointService.refresh_account(account)
                 except Exception:
                     pass
 
             # Tarjetas de crédito del usuario
             cards = CreditCard.query.filter_by(user_id=user.id, is_active=True).all()
-            for card in cards:
-                total_cards += 1
-                try:
-                    card.update_balance()
-                    card.update_minimum_payment()
-                except Exception:
-                    pass
+            total_cards += len(cards)
+            account_ids.extend(a.id for a in accounts)
+            card_ids.extend(c.id for c in cards)
+
+        # Verificar saldos incrementales contra el ledger en una sola pasada por lotes
+        # y reparar sólo las filas con deriva
+        try:
+            result = recompute_balances(account_ids=account_ids, card_ids=card_ids)
+            for item in result['drift']:
+                logger.warning('Deriva de saldo %s id=%s: guardado=%s recalculado=%s',
+                               item['kind'], item['id'], item['stored'], item['computed'])
+            total_repaired = result['written']
+        except Exception:
+            logger.exception('Fallo recalculando balances')
 
         # Commit de todos los cambios
         try:
@@ -85,6 +101,8 @@ class DailyMaintenanceService:
             'users': len(users),
             'accounts_processed': total_accounts,
             'cards_processed': total_cards,
+            'balances_repaired': total_repaired,
             'auto_entries_created': created_auto_entries,
+            'checkpoints_written': total_checkpoints,
             'run_at': datetime.utcnow().isoformat()
         }
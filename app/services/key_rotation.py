@@ -0,0 +1,326 @@
+"""Motor de rotación de llaves para todas las columnas cifradas.
+
+Cubre cada columna ``*_enc`` / ``*_bidx`` de ``transactions``, ``accounts``,
+``credit_cards``, ``balance_checkpoints`` y ``monthly_rollups``
+(ver ``ROTATION_TABLES``). Por tabla:
+
+ 1. Recorre filas con ``enc_version == from_version`` usando paginación keyset
+    sobre ``id`` (``WHERE id > :last_id ORDER BY id LIMIT n``), sin sesiones ORM.
+ 2. Reparte el descifrado/re-cifrado del lote entre un pool de procesos.
+ 3. Escribe de vuelta con un ``UPDATE`` masivo (executemany) que exige
+    ``enc_version = from_version`` y que cada columna rotada siga con el blob
+    leído: si otra escritura cambió la fila entre la lectura y el UPDATE, no se
+    pisa. Esas filas se vuelven a leer y re-cifrar (``MAX_REWRITE_ATTEMPTS``).
+    En ``transactions``, ``accounts`` y ``credit_cards`` el UPDATE incrementa
+    ``version_id``: un objeto ORM cargado antes de la rotación cifraría con su
+    ``enc_version`` viejo, así que su flush falla (``StaleDataError``) en vez de
+    dejar blobs de la versión anterior en una fila marcada con la nueva.
+
+Los montos/balances se re-cifran en el formato binario de centavos, por lo que
+una rotación también convierte blobs numéricos legacy.
+
+Uso programático::
+
+    from app.services.key_rotation import rotate_all
+    stats = rotate_all(1, 2, batch_size=1000, workers=8)
+
+CLI: ``scripts/rotate_transaction_keys.py``.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+
+from app import db
+from app.utils.crypto_fields import (
+    blind_index,
+    decrypt_cents,
+    decrypt_field,
+    encrypt_cents,
+    encrypt_field,
+    search_tokens,
+    amount_bucket_index,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_REWRITE_ATTEMPTS = 5  # relecturas de filas que cambiaron entre la lectura y el UPDATE
+
+# tabla -> {'numeric': [(columna_enc, campo)], 'text': [(columna_enc, campo, columna_bidx)],
+#          'search_tokens': [campos con tokens en transaction_search_tokens],
+#          'buckets': {columna_enc: columna_bucket_bidx},
+#          'versioned': True si la tabla tiene version_id (control optimista del ORM)}
+ROTATION_TABLES: Dict[str, Dict[str, List[Tuple[str, ...]]]] = {
+    'transactions': {
+        'numeric': [('amount_enc', 'amount'), ('running_balance_enc', 'running_balance')],
+        'text': [
+            ('description_enc', 'description', 'description_bidx'),
+            ('notes_enc', 'notes', 'notes_bidx'),
+            ('creditor_name_enc', 'creditor_name', 'creditor_name_bidx'),
+        ],
+        'search_tokens': ['description', 'notes'],
+        'buckets': {'amount_enc': 'amount_bucket_bidx'},
+        'versioned': True,
+    },
+    'accounts': {
+        'numeric': [('balance_enc', 'account_balance')],
+        'text': [],
+        'versioned': True,
+    },
+    'credit_cards': {
+        'numeric': [('current_balance_enc', 'cc_current_balance')],
+        'text': [],
+        'versioned': True,
+    },
+    'balance_checkpoints': {
+        'numeric': [('balance_enc', 'account_balance')],
+        'text': [],
+    },
+    'monthly_rollups': {
+        'numeric': [('total_enc', 'rollup_total')],
+        'text': [],
+    },
+}
+
+
+def _columns(spec) -> List[str]:
+    return [c[0] for c in spec['numeric']] + [c[0] for c in spec['text']]
+
+
+def _version_filter(from_version: int) -> str:
+    # Filas legacy sin enc_version se cifraron con la versión 1
+    if from_version == 1:
+        return "(enc_version = :from_version OR enc_version IS NULL)"
+    return "enc_version = :from_version"
+
+
+def _select_rows(table: str, where: str, params: Dict[str, Any], limit: str = '', *bind) -> List[tuple]:
+    cols = _columns(ROTATION_TABLES[table])
+    sql = text(f"SELECT id, {', '.join(cols)} FROM {table} WHERE {where} ORDER BY id ASC {limit}").bindparams(*bind)
+    result = db.session.execute(sql, params)
+    # psycopg2 devuelve bytea como memoryview (no picklable): normalizar a bytes
+    return [tuple(bytes(v) if isinstance(v, memoryview) else v for v in r) for r in result.fetchall()]
+
+
+def fetch_batch(table: str, from_version: int, last_id: int, batch_size: int) -> List[tuple]:
+    """Siguiente lote de filas a rotar: (id, *columnas_enc) con id > last_id."""
+    return _select_rows(
+        table, f"id > :last_id AND {_version_filter(from_version)}",
+        {'last_id': last_id, 'from_version': from_version, 'batch': batch_size}, 'LIMIT :batch')
+
+
+def fetch_rows(table: str, from_version: int, ids: Sequence[int]) -> List[tuple]:
+    """Releer filas concretas que siguen en ``from_version`` (mismo formato que ``fetch_batch``)."""
+    return _select_rows(table, f"id IN :ids AND {_version_filter(from_version)}",
+                        {'ids': list(ids), 'from_version': from_version}, '', bindparam('ids', expanding=True))
+
+
+def reencrypt_rows(table: str, rows: Sequence[tuple], from_version: int, to_version: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Descifrar con ``from_version`` y re-cifrar con ``to_version``.
+
+    Función pura (sin DB) para poder ejecutarse en procesos worker. Devuelve
+    (parámetros de UPDATE, filas fallidas). Cada parámetro incluye el blob leído
+    (``old_<columna>``) para que el UPDATE sólo aplique si la fila no cambió. Una
+    fila cuyo blob no se pueda descifrar se omite (se cuenta como fallida) para
+    no perder datos.
+    """
+    spec = ROTATION_TABLES[table]
+    params: List[Dict[str, Any]] = []
+    failed = 0
+    for row in rows:
+        values = iter(row[1:])
+        out: Dict[str, Any] = {'id': row[0]}
+        out.update((f'old_{column}', blob) for column, blob in zip(_columns(spec), row[1:]))
+        ok = True
+        for column, field in spec['numeric']:
+            blob = next(values)
+            if blob is None:
+                out[column] = None
+                if column in spec.get('buckets', {}):
+                    out[spec['buckets'][column]] = None
+                continue
+            cents = decrypt_cents(blob, field, from_version)
+            if cents is None:
+                ok = False
+                break
+            out[column] = encrypt_cents(cents, field, to_version)
+            if column in spec.get('buckets', {}):
+                out[spec['buckets'][column]] = amount_bucket_index(cents, to_version)
+        if ok:
+            for column, field, bidx_column in spec['text']:
+                blob = next(values)
+                if blob is None:
+                    out[column] = None
+                    out[bidx_column] = None
+                    continue
+                plain = decrypt_field(blob, field, from_version)
+                if plain is None:
+                    ok = False
+                    break
+                out[column] = encrypt_field(plain, field, to_version)
+                out[bidx_column] = blind_index(plain, field, to_version)
+                if field in spec.get('search_tokens', ()):
+                    out.setdefault('_tokens', []).append((row[0], field, to_version, search_tokens(plain, to_version)))
+        if ok:
+            params.append(out)
+        else:
+            failed += 1
+    return params, failed
+
+
+def _reencrypt_chunk(args):
+    # Punto de entrada picklable para ProcessPoolExecutor
+    return reencrypt_rows(*args)
+
+
+def _unchanged(column: str) -> str:
+    # Comparación que también acepta NULL = NULL (columnas opcionales como notes_enc)
+    return f"({column} = :old_{column} OR ({column} IS NULL AND :old_{column} IS NULL))"
+
+
+def write_batch(table: str, params: List[Dict[str, Any]], from_version: int, to_version: int,
+                commit: bool = True) -> int:
+    """UPDATE masivo (executemany) de un lote ya re-cifrado. Devuelve filas escritas.
+
+    El UPDATE sólo aplica si la fila sigue en ``from_version`` y con los blobs
+    leídos. Las que cambiaron en el intervalo se releen (``fetch_rows``), se
+    re-cifran desde su valor actual y se vuelven a escribir, hasta
+    ``MAX_REWRITE_ATTEMPTS`` veces; las que ya están en otra versión se dejan.
+
+    Con ``commit=False`` el llamador decide cuándo confirmar (p.ej. para guardar
+    el cursor de la rotación online en la misma transacción).
+    """
+    if not params:
+        return 0
+    spec = ROTATION_TABLES[table]
+    sets = [f"{c[0]} = :{c[0]}" for c in spec['numeric']]
+    sets.extend(f"{b} = :{b}" for b in spec.get('buckets', {}).values())
+    for column, _, bidx_column in spec['text']:
+        sets.append(f"{column} = :{column}")
+        sets.append(f"{bidx_column} = :{bidx_column}")
+    sets.append("enc_version = :to_version")
+    if spec.get('versioned'):
+        sets.append("version_id = version_id + 1")
+    unchanged = ' AND '.join(_unchanged(column) for column in _columns(spec))
+    sql = text(
+        f"UPDATE {table} SET {', '.join(sets)} "
+        f"WHERE id = :id AND {_version_filter(from_version)} AND {unchanged}"
+    )
+    written = 0
+    attempt = 0
+    while params:
+        tokens = []
+        for p in params:
+            p['to_version'] = to_version
+            p['from_version'] = from_version
+            tokens.extend(p.pop('_tokens', ()))
+        db.session.execute(sql, params)
+        # Filas que el UPDATE no tocó y siguen pendientes: cambiaron tras la lectura
+        stale = {row[0] for row in fetch_rows(table, from_version, [p['id'] for p in params])}
+        written += len(params) - len(stale)
+        tokens = [t for t in tokens if t[0] not in stale]
+        if tokens:
+            # Los tokens de búsqueda dependen de la llave: reescribirlos con la nueva versión
+            from app.services.transaction_search import replace_search_tokens
+            replace_search_tokens(tokens)
+        if not stale:
+            break
+        attempt += 1
+        if attempt > MAX_REWRITE_ATTEMPTS:
+            logger.warning('[rotate] %s: %s filas siguen cambiando, se omiten: %s',
+                           table, len(stale), sorted(stale)[:20])
+            break
+        params, failed = reencrypt_rows(table, fetch_rows(table, from_version, stale), from_version, to_version)
+        if failed:
+            logger.warning('[rotate] %s: %s filas releídas no se pudieron descifrar', table, failed)
+    if commit:
+        db.session.commit()
+    return written
+
+
+def _split(rows: Sequence[tuple], parts: int) -> List[Sequence[tuple]]:
+    size = max(len(rows) // parts + (1 if len(rows) % parts else 0), 1)
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def rotate_table(
+    table: str,
+    from_version: int,
+    to_version: int,
+    batch_size: int = 1000,
+    workers: int = 0,
+    max_batches: int = 0,
+    start_after_id: int = 0,
+    executor: Optional[ProcessPoolExecutor] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Rotar una tabla completa (o ``max_batches`` lotes) y devolver estadísticas.
+
+    ``workers`` > 1 reparte cada lote en un pool de procesos (o usa ``executor``
+    si se provee); 0/1 procesa en el proceso actual.
+    """
+    if table not in ROTATION_TABLES:
+        raise ValueError(f"Tabla no soportada para rotación: {table}")
+    stats = {'table': table, 'rows': 0, 'failed': 0, 'batches': 0, 'last_id': start_after_id,
+             'seconds': 0.0, 'rows_per_sec': 0.0}
+    own_executor = None
+    if executor is None and workers and workers > 1:
+        own_executor = executor = ProcessPoolExecutor(max_workers=workers)
+    started = time.monotonic()
+    try:
+        while not max_batches or stats['batches'] < max_batches:
+            rows = fetch_batch(table, from_version, stats['last_id'], batch_size)
+            if not rows:
+                break
+            stats['last_id'] = rows[-1][0]
+            if executor is not None:
+                parts = _split(rows, max(workers, 1))
+                results = executor.map(_reencrypt_chunk, [(table, part, from_version, to_version) for part in parts])
+                params, failed = [], 0
+                for part_params, part_failed in results:
+                    params.extend(part_params)
+                    failed += part_failed
+            else:
+                params, failed = reencrypt_rows(table, rows, from_version, to_version)
+            stats['rows'] += write_batch(table, params, from_version, to_version)
+            stats['failed'] += failed
+            stats['batches'] += 1
+            stats['seconds'] = time.monotonic() - started
+            stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+            if progress:
+                progress(dict(stats))
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+    stats['seconds'] = time.monotonic() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    if stats['failed']:
+        logger.warning('[rotate] %s: %s filas no se pudieron descifrar con v%s', table, stats['failed'], from_version)
+    return stats
+
+
+def rotate_all(
+    from_version: int,
+    to_version: int,
+    batch_size: int = 1000,
+    workers: int = 0,
+    tables: Optional[Sequence[str]] = None,
+    max_batches: int = 0,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Rotar todas las tablas cifradas compartiendo un mismo pool de procesos."""
+    tables = list(tables or ROTATION_TABLES.keys())
+    executor = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    try:
+        return [
+            rotate_table(table, from_version, to_version, batch_size=batch_size, workers=workers,
+                         max_batches=max_batches, executor=executor, progress=progress)
+            for table in tables
+        ]
+    finally:
+        if executor is not None:
+            executor.shutdown()
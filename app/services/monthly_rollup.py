@@ -0,0 +1,236 @@
+"""Rollups mensuales cifrados para reportes (tabla ``monthly_rollups``).
+
+Los reportes por mes/trimestre/año descifraban todas las transacciones del
+período. Con ``monthly_rollups`` leen unas pocas filas por mes (una por
+categoría, tipo y si es de tarjeta) y su costo depende del número de
+categorías, no del historial.
+
+Mantenimiento (lo invoca ``app.services.balance_service``):
+
+- ``before_flush``: por cada Transaction eliminada o con cambios en monto, tipo,
+  fecha, categoría, tarjeta o usuario se registra ``-`` (monto, 1) sobre la clave
+  de sus valores previos (leídos de la fila en DB).
+- ``after_flush``: las transacciones nuevas/editadas suman ``+`` (monto, 1) sobre
+  la clave de sus valores actuales (la fecha por defecto ya está asignada) y
+  ``apply_rollup_changes`` escribe los deltas agrupados por clave.
+
+Reparación: ``rebuild_rollups`` regenera las filas de un usuario desde el ledger y
+``check_rollups`` las compara sin escribir (``scripts/rebuild_monthly_rollups.py``).
+
+Los reportes sólo leen rollups con ``REPORT_ROLLUPS_ENABLED=1`` (después de
+reconstruirlos una vez en instalaciones existentes).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.utils.crypto_fields import decrypt_cents, decrypt_column, encrypt_cents, get_active_enc_version
+
+ROLLUP_FIELD = 'rollup_total'
+ROLLUP_TRACKED = ('user_id', 'date', 'category', 'transaction_type', 'credit_card_id', 'amount_enc', 'enc_version')
+
+# (user_id, year, month, category, transaction_type, is_card_payment)
+RollupKey = Tuple[int, int, int, str, str, bool]
+
+
+def rollup_key(user_id: int, tx_date: Optional[datetime], category: str, tx_type: str,
+               credit_card_id: Optional[int]) -> RollupKey:
+    tx_date = tx_date or datetime.utcnow()
+    return (user_id, tx_date.year, tx_date.month, category, tx_type, credit_card_id is not None)
+
+
+def rollup_entry(values: Mapping[str, Any], sign: int) -> Optional[Tuple[RollupKey, int, int]]:
+    """``(clave, centavos firmados, conteo firmado)`` de una transacción."""
+    if values['user_id'] is None:
+        return None
+    cents = decrypt_cents(values['amount_enc'], 'amount', values['enc_version'] or 1) or 0
+    key = rollup_key(values['user_id'], values['date'], values['category'], values['transaction_type'],
+                     values['credit_card_id'])
+    return key, sign * cents, sign
+
+
+def _resolve(item) -> Optional[Tuple[RollupKey, int, int]]:
+    if isinstance(item, tuple):
+        return item
+    # Transaction nueva/editada: tras el flush ya tiene fecha por defecto y FKs
+    return rollup_entry({a: getattr(item, a) for a in ROLLUP_TRACKED}, +1)
+
+
+def apply_rollup_changes(session, conn, items: Iterable[Any]) -> int:
+    """Sumar los deltas a ``monthly_rollups`` (upsert por clave). Devuelve filas tocadas.
+
+    Las filas que quedan en cero transacciones se borran para que la tabla no crezca
+    con claves vacías.
+    """
+    from app.models.monthly_rollup import MonthlyRollup
+
+    deltas: Dict[RollupKey, List[int]] = defaultdict(lambda: [0, 0])
+    for item in items:
+        entry = _resolve(item)
+        if entry is None:
+            continue
+        key, cents, count = entry
+        deltas[key][0] += cents
+        deltas[key][1] += count
+    table = MonthlyRollup.__table__
+    touched = 0
+    for key in sorted(deltas):
+        cents, count = deltas[key]
+        if not cents and not count:
+            continue
+        row = _locked_row(conn, table, key)
+        if row is None:
+            # Primera escritura de la clave: crear la fila en cero sin pisar una
+            # creada en paralelo, y bloquearla antes de sumar
+            _insert_empty(conn, table, key)
+            row = _locked_row(conn, table, key)
+        if row.tx_count + count <= 0:
+            conn.execute(delete(table).where(table.c.id == row.id))
+        else:
+            version = row.enc_version or 1
+            total = (decrypt_cents(row.total_enc, ROLLUP_FIELD, version) or 0) + cents
+            blob = encrypt_cents(total, ROLLUP_FIELD, version)
+            conn.execute(update(table).where(table.c.id == row.id).values(
+                total_enc=blob, tx_count=row.tx_count + count, updated_at=datetime.utcnow()))
+            loaded = session.identity_map.get(session.identity_key(MonthlyRollup, row.id))
+            if loaded is not None:
+                set_committed_value(loaded, 'total_enc', blob)
+                set_committed_value(loaded, 'tx_count', row.tx_count + count)
+        touched += 1
+    return touched
+
+
+def _locked_row(conn, table, key: RollupKey):
+    return conn.execute(
+        select(table.c.id, table.c.total_enc, table.c.tx_count, table.c.enc_version)
+        .where(_key_filter(table, key)).with_for_update()
+    ).first()
+
+
+def _insert_empty(conn, table, key: RollupKey) -> None:
+    """INSERT de la fila en cero que no falla si otra transacción ya creó la clave."""
+    version = get_active_enc_version()
+    values = {**_key_values(key), 'total_enc': encrypt_cents(0, ROLLUP_FIELD, version), 'tx_count': 0,
+              'enc_version': version, 'updated_at': datetime.utcnow()}
+    dialect = conn.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        conn.execute(dialect_insert(table).values(**values)
+                     .on_conflict_do_nothing(index_elements=list(_key_values(key))))
+    elif dialect in ('mysql', 'mariadb'):
+        conn.execute(insert(table).values(**values).prefix_with('IGNORE'))
+    else:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table).values(**values))
+        except IntegrityError:
+            pass
+
+
+def _key_values(key: RollupKey) -> Dict[str, Any]:
+    user_id, year, month, category, tx_type, is_card_payment = key
+    return {'user_id': user_id, 'year': year, 'month': month, 'category': category,
+            'transaction_type': tx_type, 'is_card_payment': is_card_payment}
+
+
+def _key_filter(table, key: RollupKey):
+    return and_(*(table.c[column] == value for column, value in _key_values(key).items()))
+
+
+def _period_filter(table, start: Tuple[int, int], end: Tuple[int, int]):
+    """Meses ``start <= (year, month) < end``."""
+    (sy, sm), (ey, em) = start, end
+    return and_(
+        or_(table.c.year > sy, and_(table.c.year == sy, table.c.month >= sm)),
+        or_(table.c.year < ey, and_(table.c.year == ey, table.c.month < em)),
+    )
+
+
+def read_rollups(session, user_id: int, start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple]:
+    """Rollups del usuario para los meses ``[start, end)`` (tuplas ``(año, mes)``).
+
+    Devuelve ``(year, month, category, transaction_type, is_card_payment, centavos, conteo)``.
+    """
+    from app.models.monthly_rollup import MonthlyRollup
+
+    table = MonthlyRollup.__table__
+    rows = session.execute(
+        select(table.c.year, table.c.month, table.c.category, table.c.transaction_type,
+               table.c.is_card_payment, table.c.total_enc, table.c.enc_version, table.c.tx_count)
+        .where(table.c.user_id == user_id, _period_filter(table, start, end))
+    ).all()
+    totals = decrypt_column(rows, 5, ROLLUP_FIELD, version_index=6, kind='cents')
+    return [(r.year, r.month, r.category, r.transaction_type, bool(r.is_card_payment), cents, r.tx_count)
+            for r, cents in zip(rows, totals)]
+
+
+def ledger_rollups(session, user_id: int) -> Dict[RollupKey, Tuple[int, int]]:
+    """Rollups calculados desde el ledger (una consulta + descifrado en bloque)."""
+    from app.models.transaction import Transaction
+
+    table = Transaction.__table__
+    rows = session.execute(
+        select(table.c.date, table.c.category, table.c.transaction_type, table.c.credit_card_id,
+               table.c.amount_enc, table.c.enc_version).where(table.c.user_id == user_id)
+    ).all()
+    amounts = decrypt_column(rows, 4, 'amount', version_index=5, kind='cents', parallel=True)
+    out: Dict[RollupKey, List[int]] = defaultdict(lambda: [0, 0])
+    for row, cents in zip(rows, amounts):
+        bucket = out[rollup_key(user_id, row.date, row.category, row.transaction_type, row.credit_card_id)]
+        bucket[0] += cents
+        bucket[1] += 1
+    return {key: (cents, count) for key, (cents, count) in out.items()}
+
+
+def stored_rollups(session, user_id: int) -> Dict[RollupKey, Tuple[int, int]]:
+    from app.models.monthly_rollup import MonthlyRollup
+
+    table = MonthlyRollup.__table__
+    rows = session.execute(
+        select(table.c.year, table.c.month, table.c.category, table.c.transaction_type,
+               table.c.is_card_payment, table.c.total_enc, table.c.enc_version, table.c.tx_count)
+        .where(table.c.user_id == user_id)
+    ).all()
+    totals = decrypt_column(rows, 5, ROLLUP_FIELD, version_index=6, kind='cents')
+    return {(user_id, r.year, r.month, r.category, r.transaction_type, bool(r.is_card_payment)): (cents, r.tx_count)
+            for r, cents in zip(rows, totals)}
+
+
+def check_rollups(session, user_id: int) -> List[Dict[str, Any]]:
+    """Comparar rollups guardados contra el ledger. Devuelve las claves que difieren
+    (``{'key', 'stored': (centavos, conteo) | None, 'ledger': ... | None}``)."""
+    stored = stored_rollups(session, user_id)
+    ledger = ledger_rollups(session, user_id)
+    return [
+        {'key': key, 'stored': stored.get(key), 'ledger': ledger.get(key)}
+        for key in sorted(set(stored) | set(ledger))
+        if stored.get(key) != ledger.get(key)
+    ]
+
+
+def rebuild_rollups(session, user_id: int) -> int:
+    """Reparación/backfill: borrar y regenerar los rollups del usuario. Devuelve filas escritas (sin commit)."""
+    from app.models.monthly_rollup import MonthlyRollup
+
+    table = MonthlyRollup.__table__
+    ledger = ledger_rollups(session, user_id)
+    session.execute(delete(table).where(table.c.user_id == user_id))
+    if not ledger:
+        return 0
+    version = get_active_enc_version()
+    now = datetime.utcnow()
+    session.execute(insert(table), [
+        {**_key_values(key), 'total_enc': encrypt_cents(cents, ROLLUP_FIELD, version), 'tx_count': count,
+         'enc_version': version, 'updated_at': now}
+        for key, (cents, count) in sorted(ledger.items())
+    ])
+    return len(ledger)
@@ -0,0 +1,231 @@
+"""Rotación de llaves online: job del scheduler con cursor persistente y throttling.
+
+Complementa al script offline (``scripts/rotate_transaction_keys.py``). Cada
+ejecución del job avanza la rotación ``KEY_ROTATION_FROM_VERSION`` ->
+``KEY_ROTATION_TO_VERSION`` unos cuantos lotes pequeños y se detiene:
+
+- El cursor (último id por tabla) vive en ``key_rotation_state`` y se confirma
+  en la misma transacción que el lote re-cifrado, así que un reinicio reanuda
+  exactamente donde quedó.
+- Presupuesto de filas/segundo (``KEY_ROTATION_ROWS_PER_SEC``): tras cada lote se
+  duerme lo necesario para no superarlo.
+- Latencia máxima por lote (``KEY_ROTATION_MAX_BATCH_MS``): el tamaño del lote se
+  ajusta (AIMD) para mantener cada transacción corta; en PostgreSQL además se fija
+  ``lock_timeout`` para no quedar esperando locks de escrituras de usuarios.
+- Pausa automática si la latencia de requests (EWMA medida en before/after_request)
+  o la latencia de un ping a la DB superan sus umbrales; se reintenta en la
+  siguiente ejecución del job.
+- Corre mientras la app sigue escribiendo: ``write_batch`` no pisa filas que
+  cambiaron tras su lectura y sube ``version_id``, así que un request que cargó
+  una transacción/cuenta/tarjeta antes del lote falla con ``StaleDataError``
+  (y hace rollback) en vez de guardar blobs de la versión anterior.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from flask import current_app, g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.key_rotation_state import KeyRotationState
+from app.services.key_rotation import ROTATION_TABLES, fetch_batch, reencrypt_rows, write_batch
+
+logger = logging.getLogger(__name__)
+
+MIN_BATCH_SIZE = 10
+
+
+class RequestLatencyMonitor:
+    """EWMA de la duración de requests HTTP (ms), alimentada por hooks de Flask."""
+
+    def __init__(self, alpha: float = 0.2, stale_after: float = 60.0):
+        self.alpha = alpha
+        self.stale_after = stale_after  # sin tráfico reciente => se considera sin carga
+        self._lock = threading.Lock()
+        self._ewma_ms = 0.0
+        self._last_sample = 0.0
+
+    def record(self, elapsed_ms: float) -> None:
+        with self._lock:
+            if not self._last_sample:
+                self._ewma_ms = elapsed_ms
+            else:
+                self._ewma_ms += self.alpha * (elapsed_ms - self._ewma_ms)
+            self._last_sample = time.monotonic()
+
+    def current_ms(self) -> float:
+        with self._lock:
+            if not self._last_sample or time.monotonic() - self._last_sample > self.stale_after:
+                return 0.0
+            return self._ewma_ms
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ewma_ms = 0.0
+            self._last_sample = 0.0
+
+
+request_latency = RequestLatencyMonitor()
+
+
+def init_request_timing(app):
+    """Registrar hooks que alimentan ``request_latency``."""
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_latency(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            request_latency.record((time.perf_counter() - started) * 1000.0)
+        return response
+
+
+def _db_ping_ms() -> float:
+    started = time.perf_counter()
+    db.session.execute(text('SELECT 1'))
+    return (time.perf_counter() - started) * 1000.0
+
+
+class OnlineKeyRotationService:
+    """Avance incremental y throttled de la rotación de llaves."""
+
+    @staticmethod
+    def settings() -> Dict[str, Any]:
+        cfg = current_app.config
+        return {
+            'from_version': cfg.get('KEY_ROTATION_FROM_VERSION', 1),
+            'to_version': cfg.get('KEY_ROTATION_TO_VERSION', 1),
+            'tick_seconds': cfg.get('KEY_ROTATION_TICK_SECONDS', 20.0),
+            'rows_per_sec': cfg.get('KEY_ROTATION_ROWS_PER_SEC', 200.0),
+            'batch_size': cfg.get('KEY_ROTATION_BATCH_SIZE', 200),
+            'max_batch_ms': cfg.get('KEY_ROTATION_MAX_BATCH_MS', 250.0),
+            'max_request_ms': cfg.get('KEY_ROTATION_MAX_REQUEST_MS', 500.0),
+            'max_db_ms': cfg.get('KEY_ROTATION_MAX_DB_MS', 100.0),
+        }
+
+    @staticmethod
+    def get_state(table: str, from_version: int, to_version: int) -> KeyRotationState:
+        """Obtener (o crear) el cursor de una tabla; se reinicia si cambian las versiones."""
+        state = KeyRotationState.query.filter_by(table_name=table).first()
+        if state is None:
+            state = KeyRotationState(table_name=table)
+            state.reset(from_version, to_version)
+            db.session.add(state)
+            db.session.commit()
+        elif (state.from_version, state.to_version) != (from_version, to_version):
+            state.reset(from_version, to_version)
+            db.session.commit()
+        return state
+
+    @staticmethod
+    def pause_reason(opts: Dict[str, Any]) -> Optional[str]:
+        """Motivo para pausar por carga, o None si se puede continuar."""
+        req_ms = request_latency.current_ms()
+        if req_ms > opts['max_request_ms']:
+            return f'latencia de requests {req_ms:.0f}ms > {opts["max_request_ms"]:.0f}ms'
+        db_ms = _db_ping_ms()
+        if db_ms > opts['max_db_ms']:
+            return f'latencia de DB {db_ms:.0f}ms > {opts["max_db_ms"]:.0f}ms'
+        return None
+
+    @staticmethod
+    def _set_lock_timeout(max_batch_ms: float) -> None:
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text(f"SET LOCAL lock_timeout = '{int(max_batch_ms)}ms'"))
+
+    @staticmethod
+    def run_tick(opts: Optional[Dict[str, Any]] = None, sleep=time.sleep) -> Dict[str, Any]:
+        """Procesar lotes hasta agotar ``tick_seconds``, terminar o pausar.
+
+        Devuelve un resumen: filas migradas, lotes, estado final y motivo de pausa.
+        """
+        opts = {**OnlineKeyRotationService.settings(), **(opts or {})}
+        from_v, to_v = opts['from_version'], opts['to_version']
+        summary = {'rows': 0, 'batches': 0, 'status': 'done', 'paused': None}
+        if from_v == to_v:
+            summary['status'] = 'idle'
+            return summary
+
+        deadline = time.monotonic() + opts['tick_seconds']
+        max_batch = max(int(opts['batch_size']), MIN_BATCH_SIZE)
+        batch = max_batch
+        for table in ROTATION_TABLES:
+            state = OnlineKeyRotationService.get_state(table, from_v, to_v)
+            if state.status == 'done':
+                continue
+            while True:
+                if time.monotonic() >= deadline:
+                    state.status = 'running'
+                    db.session.commit()
+                    summary['status'] = 'running'
+                    return summary
+                reason = OnlineKeyRotationService.pause_reason(opts)
+                if reason:
+                    state.status = 'paused'
+                    state.pause_reason = reason
+                    db.session.commit()
+                    logger.info('[rotate-online] pausa en %s: %s', table, reason)
+                    summary.update(status='paused', paused=reason)
+                    return summary
+
+                started = time.monotonic()
+                try:
+                    OnlineKeyRotationService._set_lock_timeout(opts['max_batch_ms'])
+                    rows = fetch_batch(table, from_v, state.last_id, batch)
+                    if not rows:
+                        state.status = 'done'
+                        state.pause_reason = None
+                        state.finished_at = datetime.utcnow()
+                        db.session.commit()
+                        logger.info('[rotate-online] %s completada (%s filas)', table, state.rows_done)
+                        break
+                    params, failed = reencrypt_rows(table, rows, from_v, to_v)
+                    written = write_batch(table, params, from_v, to_v, commit=False)
+                    state.last_id = rows[-1][0]
+                    state.rows_done = (state.rows_done or 0) + written
+                    state.status = 'running'
+                    state.pause_reason = None
+                    db.session.commit()  # lote + cursor en la misma transacción
+                    if failed:
+                        logger.warning('[rotate-online] %s: %s filas no se pudieron descifrar', table, failed)
+                except OperationalError as exc:
+                    # lock_timeout / contención: deshacer, reducir lote y reintentar en el próximo tick
+                    db.session.rollback()
+                    state = OnlineKeyRotationService.get_state(table, from_v, to_v)
+                    state.status = 'paused'
+                    state.pause_reason = f'contención: {exc.orig.__class__.__name__}'[:200]
+                    db.session.commit()
+                    summary.update(status='paused', paused=state.pause_reason)
+                    return summary
+
+                elapsed = time.monotonic() - started
+                summary['rows'] += written
+                summary['batches'] += 1
+                # AIMD sobre el tamaño de lote para respetar la latencia máxima
+                if elapsed * 1000.0 > opts['max_batch_ms']:
+                    batch = max(MIN_BATCH_SIZE, batch // 2)
+                elif elapsed * 1000.0 < opts['max_batch_ms'] / 2:
+                    batch = min(max_batch, batch + max(MIN_BATCH_SIZE, batch // 4))
+                # Presupuesto de filas/segundo
+                if opts['rows_per_sec'] > 0:
+                    wait = len(rows) / opts['rows_per_sec'] - elapsed
+                    if wait > 0:
+                        sleep(min(wait, max(deadline - time.monotonic(), 0)))
+        return summary
+
+    @staticmethod
+    def run_scheduled():
+        """Entrada del job del scheduler."""
+        summary = OnlineKeyRotationService.run_tick()
+        if summary['rows'] or summary['paused']:
+            logger.info('[rotate-online] tick: %s', summary)
+        return summary
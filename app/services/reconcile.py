@@ -0,0 +1,198 @@
+"""Auditoría de balances: recalcula desde el ledger y reporta (o repara) la deriva.
+
+Uso:
+    python -m app.services.reconcile                  # sólo reporte
+    python -m app.services.reconcile --repair --workers 8 --shard-size 200 --json
+
+Recorre los usuarios por páginas de ``--shard-size`` ids (keyset sobre
+``users.id``) y reparte cada página (shard) en un pool de procesos. Cada worker
+recalcula las cuentas y tarjetas del shard con ``recompute_balances`` (una
+consulta al ledger por lote de ids + descifrado en bloque) y devuelve sólo un
+resumen, así que la memoria queda acotada por el tamaño del shard y el número de
+shards en vuelo, no por el total de transacciones.
+
+Reporte: cuentas/tarjetas revisadas, filas con deriva, delta máximo (centavos) e
+ids afectados (hasta ``max_ids`` por tipo). Con ``--repair`` las filas con
+deriva se reescriben con el valor del ledger.
+
+Job opcional del scheduler: ``RECONCILE_ENABLED=1`` (ver ``config.py``).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from app import db
+from app.services.balance_service import recompute_balances
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 200
+DEFAULT_MAX_IDS = 1000
+
+
+def iter_user_shards(shard_size: int = DEFAULT_SHARD_SIZE) -> Iterator[List[int]]:
+    """Ids de usuarios en páginas de ``shard_size`` (keyset, memoria acotada)."""
+    from app.models.user import User
+
+    table = User.__table__
+    last_id = 0
+    while True:
+        ids = [r[0] for r in db.session.execute(
+            select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(shard_size)
+        )]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def reconcile_shard(user_ids: List[int], repair: bool = False) -> Dict[str, Any]:
+    """Recalcular cuentas y tarjetas de un shard de usuarios y resumir la deriva."""
+    from app.models.account import Account
+    from app.models.credit_card import CreditCard
+
+    account_ids = [r[0] for r in db.session.execute(
+        select(Account.__table__.c.id).where(Account.__table__.c.user_id.in_(user_ids)))]
+    card_ids = [r[0] for r in db.session.execute(
+        select(CreditCard.__table__.c.id).where(CreditCard.__table__.c.user_id.in_(user_ids)))]
+    result = recompute_balances(account_ids=account_ids, card_ids=card_ids, write=repair)
+    if repair:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return {
+        'users': len(user_ids),
+        'accounts': result['accounts'],
+        'cards': result['cards'],
+        'transactions': result['transactions'],
+        'repaired': result['written'] if repair else 0,
+        'drift': [(d['kind'], d['id'], (d['computed'] or 0) - (d['stored'] or 0)) for d in result['drift']],
+    }
+
+
+def _reconcile_shard_task(args):
+    # Punto de entrada picklable para ProcessPoolExecutor
+    from app import app
+    with app.app_context():
+        return reconcile_shard(*args)
+
+
+def _init_worker():
+    # Con fork el worker hereda conexiones abiertas del padre: descartarlas sin cerrarlas
+    from app import app
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+class DriftReport:
+    """Acumulador del reporte de deriva (los ids se truncan a ``max_ids`` por tipo)."""
+
+    def __init__(self, max_ids: int = DEFAULT_MAX_IDS):
+        self.max_ids = max_ids
+        self.totals = {'users': 0, 'accounts': 0, 'cards': 0, 'transactions': 0, 'repaired': 0}
+        self.drift_count = 0
+        self.max_delta = 0
+        self.affected: Dict[str, List[int]] = {'account': [], 'card': []}
+
+    def add(self, shard: Dict[str, Any]) -> None:
+        for key in self.totals:
+            self.totals[key] += shard[key]
+        for kind, entity_id, delta in shard['drift']:
+            self.drift_count += 1
+            self.max_delta = max(self.max_delta, abs(delta))
+            if len(self.affected[kind]) < self.max_ids:
+                self.affected[kind].append(entity_id)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**self.totals, 'drift_count': self.drift_count, 'max_delta_cents': self.max_delta,
+                'affected': {k: sorted(v) for k, v in self.affected.items()}}
+
+
+def run_reconcile(
+    repair: bool = False,
+    workers: int = 0,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_ids: int = DEFAULT_MAX_IDS,
+) -> Dict[str, Any]:
+    """Auditar todos los usuarios. ``workers`` > 1 usa un pool de procesos (requiere app context)."""
+    started = time.monotonic()
+    report = DriftReport(max_ids)
+    shards = iter_user_shards(shard_size)
+    if not workers or workers <= 1:
+        for user_ids in shards:
+            report.add(reconcile_shard(user_ids, repair))
+    else:
+        # Los workers importan la app: no deben arrancar su propio scheduler
+        previous = os.environ.get('DISABLE_SCHEDULER')
+        os.environ['DISABLE_SCHEDULER'] = '1'
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                pending = set()
+                for user_ids in shards:
+                    pending.add(executor.submit(_reconcile_shard_task, (user_ids, repair)))
+                    if len(pending) >= workers * 2:  # shards en vuelo acotados
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for fut in done:
+                            report.add(fut.result())
+                for fut in pending:
+                    report.add(fut.result())
+        finally:
+            if previous is None:
+                os.environ.pop('DISABLE_SCHEDULER', None)
+            else:
+                os.environ['DISABLE_SCHEDULER'] = previous
+    result = report.as_dict()
+    result['seconds'] = time.monotonic() - started
+    return result
+
+
+def run_scheduled():
+    """Entrada del job del scheduler."""
+    from flask import current_app
+
+    cfg = current_app.config
+    result = run_reconcile(repair=cfg.get('RECONCILE_REPAIR', False), workers=cfg.get('RECONCILE_WORKERS', 0),
+                           shard_size=cfg.get('RECONCILE_SHARD_SIZE', DEFAULT_SHARD_SIZE))
+    if result['drift_count']:
+        logger.warning('[reconcile] deriva en %s filas (máx %s centavos): %s', result['drift_count'],
+                       result['max_delta_cents'], result['affected'])
+    else:
+        logger.info('[reconcile] sin deriva (%s cuentas, %s tarjetas)', result['accounts'], result['cards'])
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Auditar balances contra el ledger de transacciones')
+    parser.add_argument('--repair', action='store_true', help='Reescribir los balances con deriva')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='Usuarios por shard')
+    parser.add_argument('--max-ids', type=int, default=DEFAULT_MAX_IDS, help='Ids afectados a listar por tipo')
+    parser.add_argument('--json', action='store_true', help='Salida JSON')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        result = run_reconcile(repair=args.repair, workers=args.workers, shard_size=args.shard_size,
+                               max_ids=args.max_ids)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"usuarios={result['users']} cuentas={result['accounts']} tarjetas={result['cards']} "
+          f"transacciones={result['transactions']} ({result['seconds']:.1f}s)")
+    print(f"deriva={result['drift_count']} delta máx={result['max_delta_cents'] / 100:.2f} "
+          f"reparadas={result['repaired']}")
+    for kind, ids in result['affected'].items():
+        if ids:
+            print(f"  {kind}: {', '.join(str(i) for i in ids)}")
+
+
+if __name__ == '__main__':  # pragma: no cover (CLI)
+    main()
@@ -0,0 +1,211 @@
+"""Renderizado de las gráficas de reportes a PNG (base64).
+
+``ReportService`` calcula los datos de cada gráfica (``*_chart_data``) como un
+dict serializable (la *spec*: etiquetas, valores, títulos) y este módulo la
+dibuja. Separar datos y dibujo permite cachear el PNG por contenido
+(``app.utils.chart_cache``): si la spec no cambió no se llama a matplotlib.
+
+Se usa la API orientada a objetos (``Figure`` + ``FigureCanvasAgg``), sin el
+estado global de ``pyplot``: cada llamada a ``render`` tiene su propia figura,
+así que es segura con workers ``gthread`` y dentro de ``app.services.chart_pool``.
+
+``CHART_SIZES`` fija tamaño y DPI por tipo de gráfica; forman parte de la clave
+de caché.
+"""
+from __future__ import annotations
+
+import base64
+import functools
+import io
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from matplotlib.artist import setp
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# tipo -> (figsize, dpi); dpi None = el por defecto de matplotlib
+CHART_SIZES: Dict[str, Tuple[Tuple[int, int], Optional[int]]] = {
+    'expense_pie': ((10, 8), None),
+    'income_expense_trend': ((12, 6), None),
+    'assets_liabilities_pie': ((8, 8), 100),
+    'debt_breakdown_pie': ((8, 8), 100),
+    'monthly_flow': ((10, 6), 100),
+    'account_balances': ((12, 8), 100),
+    'income_by_account_pie': ((10, 8), 100),
+    'income_by_account_bar': ((12, 8), 100),
+}
+
+
+def _to_base64(fig: Figure, dpi: Optional[int]) -> str:
+    img_buffer = io.BytesIO()
+    if dpi is None:
+        fig.savefig(img_buffer, format='png', bbox_inches='tight')
+    else:
+        fig.savefig(img_buffer, format='png', bbox_inches='tight', dpi=dpi)
+    return base64.b64encode(img_buffer.getvalue()).decode()
+
+
+def _expense_pie(fig, spec):
+    ax = fig.add_subplot()
+    ax.pie(spec['values'], labels=spec['labels'], autopct='%1.1f%%', startangle=90)
+    ax.set_title(spec['title'])
+
+
+def _income_expense_trend(fig, spec):
+    ax = fig.add_subplot()
+    x = np.arange(1, len(spec['labels']) + 1)
+    incomes = np.array(spec['income'], dtype=float)
+    expenses = np.array(spec['expenses'], dtype=float)
+
+    # Series originales
+    ax.plot(x, incomes, marker='o', label='Ingresos', linewidth=2)
+    ax.plot(x, expenses, marker='s', label='Gastos', linewidth=2)
+
+    # Regresión lineal: y = m*x + b (coeficientes calculados con los datos)
+    m_inc, b_inc = spec['income_trend']
+    ax.plot(x, m_inc * x + b_inc, linestyle='--', alpha=0.7, label='Regresión ingresos')
+    m_exp, b_exp = spec['expense_trend']
+    ax.plot(x, m_exp * x + b_exp, linestyle='--', alpha=0.7, label='Regresión gastos')
+
+    ax.set_title(spec['title'])
+    ax.set_xlabel('Mes')
+    ax.set_ylabel('Monto ($)')
+    ax.grid(True, alpha=0.3)
+    ax.set_xticks(x)
+    ax.set_xticklabels(spec['labels'], rotation=45)
+    ax.legend()
+
+
+def _assets_liabilities_pie(fig, spec):
+    ax = fig.add_subplot()
+    labels, sizes = spec['labels'], spec['values']
+    ax.pie(sizes, explode=(0.05, 0), labels=labels, colors=spec['colors'],
+           autopct='%1.1f%%', shadow=True, startangle=90)
+    ax.set_title('Distribución de Patrimonio\nActivos vs Pasivos', fontsize=14, fontweight='bold')
+
+    # Agregar leyenda con valores
+    total = sum(sizes)
+    legend_labels = [f'{label}: ${size:,.2f} ({size/total*100:.1f}%)' for label, size in zip(labels, sizes)]
+    ax.legend(legend_labels, loc="best")
+
+
+def _debt_breakdown_pie(fig, spec):
+    ax = fig.add_subplot()
+    labels, sizes = spec['labels'], spec['values']
+    ax.pie(sizes, labels=labels, colors=spec['colors'], autopct='%1.1f%%', shadow=True, startangle=45)
+    ax.set_title('Desglose de Deudas por Tipo', fontsize=14, fontweight='bold')
+
+    # Agregar leyenda con valores
+    legend_labels = [f'{label}: ${size:,.2f}' for label, size in zip(labels, sizes)]
+    ax.legend(legend_labels, loc="best")
+
+
+def _monthly_flow(fig, spec):
+    ax = fig.add_subplot()
+    values = spec['values']
+    bars = ax.bar(spec['labels'], values, color=spec['colors'], alpha=0.8)
+
+    # Agregar valores sobre las barras
+    for bar, value in zip(bars, values):
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + (max(values) * 0.01),
+                f'${value:,.2f}', ha='center', va='bottom', fontweight='bold')
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_ylabel('Monto ($)')
+    ax.grid(True, alpha=0.3, axis='y')
+
+    # Ajustar límites del eje Y
+    max_val = max(abs(min(values)), max(values))
+    ax.set_ylim(-max_val * 0.1, max_val * 1.2)
+
+
+def _account_balances(fig, spec):
+    ax = fig.add_subplot()
+    balances = spec['values']
+    bars = ax.barh(spec['labels'], balances, color=spec['colors'], alpha=0.8)
+
+    # Agregar valores en las barras
+    for bar, balance in zip(bars, balances):
+        width = bar.get_width()
+        label_x = width + (max(balances) * 0.01) if width >= 0 else width - (max(balances) * 0.01)
+        ha = 'left' if width >= 0 else 'right'
+        ax.text(label_x, bar.get_y() + bar.get_height()/2,
+                f'${abs(balance):,.2f}', ha=ha, va='center', fontweight='bold')
+
+    ax.set_title('Balance por Cuenta', fontsize=14, fontweight='bold')
+    ax.set_xlabel('Balance ($)')
+    ax.grid(True, alpha=0.3, axis='x')
+
+    # Línea vertical en x=0
+    ax.axvline(x=0, color='black', linestyle='-', alpha=0.3)
+    fig.tight_layout()
+
+
+def _income_by_account_pie(fig, spec):
+    ax = fig.add_subplot()
+    labels, sizes = spec['labels'], spec['values']
+    wedges, texts, autotexts = ax.pie(sizes, labels=labels, colors=spec['colors'],
+                                      autopct='%1.1f%%', shadow=True, startangle=45)
+
+    # Mejorar el texto
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+
+    # Agregar leyenda con valores
+    legend_labels = [f'{label}: ${size:,.2f}' for label, size in zip(labels, sizes)]
+    ax.legend(legend_labels, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
+
+
+def _income_by_account_bar(fig, spec):
+    ax = fig.add_subplot()
+    income_amounts = spec['values']
+    bars = ax.bar(spec['labels'], income_amounts, color='#28a745', alpha=0.8)
+
+    # Agregar valores sobre las barras
+    for bar, amount in zip(bars, income_amounts):
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + (max(income_amounts) * 0.01),
+                f'${amount:,.2f}', ha='center', va='bottom', fontweight='bold')
+
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    ax.set_ylabel('Ingresos ($)')
+    ax.set_xlabel('Cuentas')
+    setp(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.grid(True, alpha=0.3, axis='y')
+    fig.tight_layout()
+
+
+RENDERERS: Dict[str, Callable[[Figure, Dict[str, Any]], None]] = {
+    'expense_pie': _expense_pie,
+    'income_expense_trend': _income_expense_trend,
+    'assets_liabilities_pie': _assets_liabilities_pie,
+    'debt_breakdown_pie': _debt_breakdown_pie,
+    'monthly_flow': _monthly_flow,
+    'account_balances': _account_balances,
+    'income_by_account_pie': _income_by_account_pie,
+    'income_by_account_bar': _income_by_account_bar,
+}
+
+
+def render(kind: str, spec: Dict[str, Any]) -> str:
+    """Dibujar la gráfica ``kind`` con los datos ``spec`` y devolver el PNG en base64."""
+    figsize, dpi = CHART_SIZES[kind]
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    RENDERERS[kind](fig, spec)
+    return _to_base64(fig, dpi)
+
+
+@functools.lru_cache(maxsize=1)
+def placeholder() -> str:
+    """PNG que reemplaza a una gráfica que no se pudo dibujar a tiempo (no se cachea en disco)."""
+    fig = Figure(figsize=(6, 3))
+    FigureCanvasAgg(fig)
+    fig.text(0.5, 0.5, 'Gráfica no disponible por el momento.\nRecarga la página en unos segundos.',
+             ha='center', va='center', fontsize=12, color='#6c757d')
+    return _to_base64(fig, 100)
@@ -0,0 +1,95 @@
+"""Memoización por request de los métodos de ``ReportService``.
+
+Una sola página de reportes llama varias veces a los mismos cálculos: el reporte
+mensual pide ``get_monthly_summary`` directamente y otra vez desde cada gráfica,
+y las gráficas de pastel vuelven a pedir ``get_net_worth`` / ``get_debt_summary``.
+Con ``@request_memo`` el primer resultado se guarda en ``flask.g`` con clave
+``(método, user_id, args)`` y las llamadas siguientes del mismo request lo
+reutilizan.
+
+Invalidación: un listener ``after_flush`` descarta la caché del usuario dueño de
+cualquier fila escrita (atributo ``user_id``; un ``User`` invalida la suya).
+Filas sin dueño identificable vacían la caché completa. Escrituras que no pasan
+por la sesión (``recompute_balances`` usa UPDATE de Core) deben llamar a
+``invalidate_report_memo``.
+
+Sin app context (scripts, scheduler) o con ``REPORT_MEMO_ENABLED=False`` las
+llamadas pasan directo. Los resultados se comparten: quien los reciba no debe
+mutarlos.
+"""
+from __future__ import annotations
+
+import functools
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_G_KEY = '_report_memo'
+
+
+def _store() -> Optional[Dict[Any, Dict[tuple, Any]]]:
+    if not has_app_context() or not current_app.config.get('REPORT_MEMO_ENABLED', True):
+        return None
+    store = g.get(_G_KEY)
+    if store is None:
+        store = {}
+        setattr(g, _G_KEY, store)
+    return store
+
+
+def request_memo(fn: Callable) -> Callable:
+    """Memoizar ``fn(user_id, *args, **kwargs)`` en ``flask.g`` durante el request."""
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(user_id, *args, **kwargs):
+        store = _store()
+        if store is None:
+            return fn(user_id, *args, **kwargs)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        cache = store.setdefault(user_id, {})
+        if key in cache:
+            return cache[key]
+        value = fn(user_id, *args, **kwargs)
+        cache[key] = value
+        return value
+
+    wrapper.uncached = fn
+    return wrapper
+
+
+def invalidate_report_memo(user_id: Optional[int] = None) -> None:
+    """Descartar la caché de ``user_id`` (o toda si es None)."""
+    if not has_app_context():
+        return
+    store = g.get(_G_KEY)
+    if not store:
+        return
+    if user_id is None:
+        store.clear()
+    else:
+        store.pop(user_id, None)
+
+
+def _owner(obj) -> Optional[int]:
+    from app.models.user import User
+
+    if isinstance(obj, User):
+        return obj.id
+    return getattr(obj, 'user_id', None)
+
+
+def _after_flush(session, flush_context):
+    if not has_app_context() or not g.get(_G_KEY):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        user_id = _owner(obj)
+        if user_id is None:
+            invalidate_report_memo()
+            return
+        invalidate_report_memo(user_id)
+
+
+event.listen(Session, 'after_flush', _after_flush)
@@ -1,81 +1,240 @@
 from datetime import datetime, timedelta
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Para generar gráficos sin GUI
-import io
-import base64
-import numpy as np
+from flask import current_app, has_app_context
+from app import db
 from app.models.transaction import Transaction
 from app.models.account import Account
 from app.models.credit_card import CreditCard
+from app.services import chart_pool, report_charts, report_vectorized
+from app.services.monthly_rollup import read_rollups
+from app.services.report_memo import request_memo
+from app.utils.chart_cache import chart_key, get_chart_cache
+from app.utils.crypto_fields import decrypt_column
+
+
+def _next_month(value):
+    return datetime(value.year + 1, 1, 1) if value.month == 12 else datetime(value.year, value.month + 1, 1)
+
+
+class _Totals:
+    """Acumulador en centavos de un período (mes, trimestre, año).
+
+    Los pagos a tarjetas de crédito se registran como 'income' con
+    ``credit_card_id`` (reducen la deuda de la tarjeta), pero no son ingreso
+    real en los reportes: se excluyen del ingreso (siguen contando en
+    ``transaction_count``).
+    """
+    __slots__ = ('income', 'expense', 'categories', 'count')
+
+    def __init__(self):
+        self.income = 0
+        self.expense = 0
+        self.categories = {}
+        self.count = 0
+
+    def add(self, tx_type, is_card, category, cents, count=1):
+        self.count += count
+        if tx_type == 'income' and not is_card:
+            self.income += cents
+        elif tx_type == 'expense':
+            self.expense += cents
+            label = Transaction.category_label(category)
+            self.categories[label] = self.categories.get(label, 0) + cents
+
+    def merge(self, other):
+        self.income += other.income
+        self.expense += other.expense
+        self.count += other.count
+        for label, cents in other.categories.items():
+            self.categories[label] = self.categories.get(label, 0) + cents
+
+    def as_summary(self):
+        return {
+            'total_income': self.income / 100,
+            'total_expenses': self.expense / 100,
+            'net_income': (self.income - self.expense) / 100,
+            'expenses_by_category': {label: cents / 100 for label, cents in self.categories.items()},
+            'transaction_count': self.count
+        }
+
 
 class ReportService:
-    """Servicio para generar reportes financieros"""
+    """Servicio para generar reportes financieros
+
+    Los métodos públicos se memoizan por request (``app.services.report_memo``):
+    dentro de un mismo request cada cálculo se hace una vez por usuario y argumentos.
+    """
     
     @staticmethod
-    def get_monthly_summary(user_id, year, month):
-        """Obtener resumen mensual de finanzas"""
-        # Fechas del mes
-        start_date = datetime(year, month, 1)
-        if month == 12:
-            end_date = datetime(year + 1, 1, 1)
-        else:
-            end_date = datetime(year, month + 1, 1)
-        
-        # Transacciones del mes
-        transactions = Transaction.query.filter(
+    def _fetch_amount_rows(user_id, start_date, end_date, parallel=True):
+        """Filas (date, transaction_type, credit_card_id, category) + centavos descifrados del período.
+
+        Sólo se leen las columnas necesarias y los montos se descifran en bloque;
+        ``parallel`` reparte lotes grandes entre hilos (ver ``decrypt_many``).
+        """
+        rows = db.session.query(
+            Transaction.amount_enc,
+            Transaction.enc_version,
+            Transaction.date,
+            Transaction.transaction_type,
+            Transaction.credit_card_id,
+            Transaction.category
+        ).filter(
             Transaction.user_id == user_id,
             Transaction.date >= start_date,
             Transaction.date < end_date
         ).all()
-        
-        # Calcular totales
-        # Nota: Los pagos a tarjetas de crédito se registran como 'income' en la entidad
-        # Transaction cuando están asociados a una tarjeta (credit_card_id != None),
-        # ya que reducen la deuda de la tarjeta. Sin embargo, eso no debe contarse
-        # como ingreso real en los reportes (dashboard). Por eso se excluyen.
-        total_income = sum(
-            t.amount for t in transactions
-            if t.transaction_type == 'income' and t.credit_card_id is None
-        )
-        total_expenses = sum(t.amount for t in transactions if t.transaction_type == 'expense')
-        net_income = total_income - total_expenses
-        
-        # Gastos por categoría
-        expenses_by_category = {}
-        for transaction in transactions:
-            if transaction.transaction_type == 'expense':
-                category = transaction.get_category_display()
-                expenses_by_category[category] = expenses_by_category.get(category, 0) + transaction.amount
-        
+        amounts = decrypt_column(rows, 0, 'amount', version_index=1, kind='cents', parallel=parallel)
+        return [r[2:] for r in rows], amounts
+
+    @staticmethod
+    def _backend():
+        """'python' (acumulación por fila) o 'numpy' (``REPORT_BACKEND``)"""
+        if not has_app_context():
+            return 'python'
+        return current_app.config.get('REPORT_BACKEND', 'python')
+
+    @staticmethod
+    def _use_rollups(start_date, end_date):
+        """Los rollups sólo cubren meses completos"""
+        if not has_app_context() or not current_app.config.get('REPORT_ROLLUPS_ENABLED', False):
+            return False
+        return all(d == datetime(d.year, d.month, 1) for d in (start_date, end_date))
+
+    @staticmethod
+    @request_memo
+    def aggregate(user_id, start_date, end_date):
+        """Totales del período en un solo escaneo (fin exclusivo).
+
+        Una consulta trae las transacciones del rango, los montos se descifran en
+        bloque y una sola pasada acumula centavos por mes. Trimestres, años y el
+        total del rango se obtienen combinando los meses (sin volver a leer filas).
+
+        Con ``REPORT_ROLLUPS_ENABLED`` y un rango de meses completos se leen los
+        rollups mensuales (``monthly_rollups``) en lugar de las transacciones.
+
+        Con ``REPORT_BACKEND=numpy`` el escaneo se agrupa con NumPy
+        (``app.services.report_vectorized``), con el mismo resultado.
+
+        Devuelve ``{'months': {(año, mes): resumen}, 'quarters': {(año, trimestre): resumen},
+        'years': {año: resumen}, 'total': resumen}`` con el formato de
+        ``get_monthly_summary``. Todos los meses del rango aparecen (en cero si no hay datos).
+        """
+        use_rollups = ReportService._use_rollups(start_date, end_date)
+        if not use_rollups and ReportService._backend() == 'numpy':
+            frame = report_vectorized.load_frame(db.session, user_id, start_date, end_date)
+            return report_vectorized.aggregate_frame(frame, start_date, end_date)
+        if use_rollups:
+            months = ReportService._empty_months(start_date, end_date)
+            for year, month, category, tx_type, is_card, cents, count in read_rollups(
+                    db.session, user_id, (start_date.year, start_date.month), (end_date.year, end_date.month)):
+                months[(year, month)].add(tx_type, is_card, category, cents, count)
+            return ReportService._rollup_periods(months)
+        rows, amounts = ReportService._fetch_amount_rows(user_id, start_date, end_date)
+        return ReportService._aggregate_rows(rows, amounts, start_date, end_date)
+
+    @staticmethod
+    def _empty_months(start_date, end_date):
+        months = {}
+        period = datetime(start_date.year, start_date.month, 1)
+        while period < end_date:
+            months[(period.year, period.month)] = _Totals()
+            period = _next_month(period)
+        return months
+
+    @staticmethod
+    def _aggregate_rows(rows, amounts, start_date, end_date):
+        """Backend de Python: filas ``(date, tipo, credit_card_id, categoría)`` + centavos"""
+        months = ReportService._empty_months(start_date, end_date)
+        for (date, tx_type, card_id, category), cents in zip(rows, amounts):
+            months[(date.year, date.month)].add(tx_type, card_id is not None, category, cents)
+        return ReportService._rollup_periods(months)
+
+    @staticmethod
+    def _rollup_periods(months):
+        quarters, years, total = {}, {}, _Totals()
+        for (year, month), totals in months.items():
+            quarters.setdefault((year, (month - 1) // 3 + 1), _Totals()).merge(totals)
+            years.setdefault(year, _Totals()).merge(totals)
+            total.merge(totals)
         return {
-            'total_income': total_income,
-            'total_expenses': total_expenses,
-            'net_income': net_income,
-            'expenses_by_category': expenses_by_category,
-            'transaction_count': len(transactions)
+            'months': {key: t.as_summary() for key, t in months.items()},
+            'quarters': {key: t.as_summary() for key, t in quarters.items()},
+            'years': {key: t.as_summary() for key, t in years.items()},
+            'total': total.as_summary()
         }
+
+    @staticmethod
+    @request_memo
+    def get_monthly_summary(user_id, year, month):
+        """Obtener resumen mensual de finanzas"""
+        start_date = datetime(year, month, 1)
+        return ReportService.aggregate(user_id, start_date, _next_month(start_date))['months'][(year, month)]
+
+    @staticmethod
+    @request_memo
+    def get_monthly_summaries_for_year(user_id, year):
+        """Resúmenes de los 12 meses del año (un escaneo anual, ver ``aggregate``)"""
+        months = ReportService.aggregate(user_id, datetime(year, 1, 1), datetime(year + 1, 1, 1))['months']
+        return [months[(year, month)] for month in range(1, 13)]
     
     @staticmethod
+    @request_memo
     def get_quarterly_report(user_id, year, quarter):
-        """Obtener reporte trimestral"""
-        # Calcular meses del trimestre
+        """Obtener reporte trimestral (sale del escaneo anual, que la página de
+        trimestre también usa para la gráfica de tendencia)"""
+        return ReportService.get_quarterly_reports_for_year(user_id, year)[quarter - 1]
+
+    @staticmethod
+    @request_memo
+    def get_quarterly_reports_for_year(user_id, year):
+        """Los 4 reportes trimestrales del año a partir de un único escaneo anual"""
+        data = ReportService.aggregate(user_id, datetime(year, 1, 1), datetime(year + 1, 1, 1))
+        return [
+            ReportService._build_quarterly_report(
+                year, quarter,
+                [data['months'][(year, month)] for month in range((quarter - 1) * 3 + 1, quarter * 3 + 1)],
+                data['quarters'][(year, quarter)]
+            )
+            for quarter in range(1, 5)
+        ]
+
+    @staticmethod
+    @request_memo
+    def get_annual_summary(user_id, year):
+        """Resumen anual: trimestres, totales, promedios mensuales y tasa de ahorro"""
+        data = ReportService.aggregate(user_id, datetime(year, 1, 1), datetime(year + 1, 1, 1))
+        totals = data['years'][year]
+        savings_rate = 0
+        if totals['total_income'] > 0:
+            savings_rate = (totals['net_income'] / totals['total_income']) * 100
+        return {
+            'year': year,
+            'quarters': ReportService.get_quarterly_reports_for_year(user_id, year),
+            'total_income': totals['total_income'],
+            'total_expenses': totals['total_expenses'],
+            'net_income': totals['net_income'],
+            'expenses_by_category': totals['expenses_by_category'],
+            'transaction_count': totals['transaction_count'],
+            'avg_monthly_income': totals['total_income'] / 12,
+            'avg_monthly_expenses': totals['total_expenses'] / 12,
+            'savings_rate': savings_rate
+        }
+
+    @staticmethod
+    def _build_quarterly_report(year, quarter, monthly_summaries, quarter_totals):
         start_month = (quarter - 1) * 3 + 1
-        end_month = start_month + 2
-        
-        # Obtener datos de cada mes del trimestre
         monthly_data = []
-        for month in range(start_month, end_month + 1):
-            monthly_summary = ReportService.get_monthly_summary(user_id, year, month)
+        for offset, summary in enumerate(monthly_summaries):
+            month = start_month + offset
+            monthly_summary = dict(summary)
             monthly_summary['month'] = month
             monthly_summary['month_name'] = datetime(year, month, 1).strftime('%B')
             monthly_data.append(monthly_summary)
         
-        # Calcular totales del trimestre
-        total_income = sum(data['total_income'] for data in monthly_data)
-        total_expenses = sum(data['total_expenses'] for data in monthly_data)
-        net_income = total_income - total_expenses
+        # Totales del trimestre (acumulados en centavos por ``aggregate``)
+        total_income = quarter_totals['total_income']
+        total_expenses = quarter_totals['total_expenses']
+        net_income = quarter_totals['net_income']
         
         # Promedio mensual
         avg_monthly_income = total_income / 3
@@ -96,6 +255,7 @@ class ReportService:
             'total_income': total_income,
             'total_expenses': total_expenses,
             'net_income': net_income,
+            'expenses_by_category': quarter_totals['expenses_by_category'],
             'avg_monthly_income': avg_monthly_income,
             'avg_monthly_expenses': avg_monthly_expenses,
             'income_trend': income_trend,
@@ -103,6 +263,7 @@ class ReportService:
         }
     
     @staticmethod
+    @request_memo
     def get_debt_summary(user_id):
         """Obtener resumen completo de deudas (tarjetas + cuentas de deuda)"""
         # Tarjetas de crédito
@@ -213,6 +374,7 @@ class ReportService:
         }
     
     @staticmethod
+    @request_memo
     def get_net_worth(user_id):
         """Calcular patrimonio neto incluyendo cuentas de deuda"""
         # Activos (saldos positivos de cuentas normales)
@@ -251,126 +413,123 @@ class ReportService:
         }
     
     @staticmethod
-    def generate_expense_chart(user_id, year, month):
-        """Generar gráfico de gastos por categoría"""
+    def render_charts(charts):
+        """``{nombre: (tipo, spec)}`` -> ``{nombre: PNG base64 | None}``.
+
+        Las que ya están en caché no se dibujan; el resto se dibuja en paralelo en
+        ``chart_pool``. Una que no termina a tiempo se reemplaza por un aviso que no
+        se cachea.
+        """
+        cache = get_chart_cache()
+        results, keys, jobs = {}, {}, {}
+        for name, (kind, spec) in charts.items():
+            if spec is None:
+                results[name] = None
+                continue
+            figsize, dpi = report_charts.CHART_SIZES[kind]
+            keys[name] = chart_key(kind, spec, figsize, dpi)
+            cached = cache.get(keys[name]) if cache is not None else None
+            if cached is not None:
+                results[name] = cached
+            else:
+                jobs[name] = (kind, spec)
+        for name, image in chart_pool.render_many(jobs).items():
+            if image is None:
+                results[name] = report_charts.placeholder()
+                continue
+            if cache is not None:
+                cache.put(keys[name], image)
+            results[name] = image
+        return results
+
+    @staticmethod
+    def _render_chart(kind, spec):
+        """PNG base64 de la gráfica; se reutiliza de la caché si la spec no cambió"""
+        return ReportService.render_charts({kind: (kind, spec)})[kind]
+
+    @staticmethod
+    def chart_data(kind, user_id, year, month):
+        """Spec JSON de la gráfica ``kind`` (la misma que se dibuja en el servidor). KeyError si no existe"""
+        return _CHART_DATA[kind](user_id, year, month)
+
+    @staticmethod
+    def monthly_charts_data(user_id, year, month):
+        """Specs de todas las gráficas del reporte mensual (None = sin datos)"""
+        return {kind: ReportService.chart_data(kind, user_id, year, month) for kind in MONTHLY_CHARTS}
+
+    @staticmethod
+    def monthly_charts(user_id, year, month):
+        """PNG de todas las gráficas del reporte mensual, dibujadas en paralelo"""
+        specs = ReportService.monthly_charts_data(user_id, year, month)
+        return ReportService.render_charts({kind: (kind, spec) for kind, spec in specs.items()})
+
+    @staticmethod
+    @request_memo
+    def expense_chart_data(user_id, year, month):
+        """Datos del pastel de gastos por categoría (None si no hay gastos)"""
         monthly_summary = ReportService.get_monthly_summary(user_id, year, month)
         expenses_by_category = monthly_summary['expenses_by_category']
         
         if not expenses_by_category:
             return None
         
-        # Crear gráfico de pastel
-        plt.figure(figsize=(10, 8))
-        categories = list(expenses_by_category.keys())
-        amounts = list(expenses_by_category.values())
-        
-        plt.pie(amounts, labels=categories, autopct='%1.1f%%', startangle=90)
-        plt.title(f'Gastos por Categoría - {datetime(year, month, 1).strftime("%B %Y")}')
-        
-        # Convertir a base64 para mostrar en HTML
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight')
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return {
+            'title': f'Gastos por Categoría - {datetime(year, month, 1).strftime("%B %Y")}',
+            'labels': list(expenses_by_category.keys()),
+            'values': list(expenses_by_category.values())
+        }
+
+    @staticmethod
+    @request_memo
+    def generate_expense_chart(user_id, year, month):
+        """Generar gráfico de gastos por categoría"""
+        return ReportService._render_chart('expense_pie', ReportService.expense_chart_data(user_id, year, month))
     
     @staticmethod
+    @request_memo
+    def income_expense_trend_data(user_id, year):
+        """Series mensuales de ingresos/gastos del año y su regresión lineal ``(m, b)``"""
+        summaries = ReportService.get_monthly_summaries_for_year(user_id, year)
+        incomes = [summary['total_income'] for summary in summaries]
+        expenses = [summary['total_expenses'] for summary in summaries]
+        return {
+            'title': f'Tendencia de Ingresos y Gastos - {year}',
+            'labels': [datetime(year, month, 1).strftime('%b') for month in range(1, 13)],
+            'income': incomes,
+            'expenses': expenses,
+            'income_trend': list(report_vectorized.linear_trend(incomes)),
+            'expense_trend': list(report_vectorized.linear_trend(expenses))
+        }
+
+    @staticmethod
+    @request_memo
     def generate_income_expense_trend(user_id, year):
         """Generar gráfico de tendencia de ingresos y gastos"""
-        monthly_data = []
-        
-        for month in range(1, 13):
-            summary = ReportService.get_monthly_summary(user_id, year, month)
-            monthly_data.append({
-                'month': month,
-                'month_name': datetime(year, month, 1).strftime('%b'),
-                'income': summary['total_income'],
-                'expenses': summary['total_expenses']
-            })
-        
-        # Crear gráfico de líneas con regresión lineal (x numérico y etiquetas de mes)
-        plt.figure(figsize=(12, 6))
-        month_labels = [data['month_name'] for data in monthly_data]
-        x = np.arange(1, 13)
-        incomes = np.array([data['income'] for data in monthly_data], dtype=float)
-        expenses = np.array([data['expenses'] for data in monthly_data], dtype=float)
-
-        # Series originales
-        plt.plot(x, incomes, marker='o', label='Ingresos', linewidth=2)
-        plt.plot(x, expenses, marker='s', label='Gastos', linewidth=2)
-
-        # Regresión lineal: y = m*x + b
-        try:
-            m_inc, b_inc = np.polyfit(x, incomes, 1)
-            y_inc_fit = m_inc * x + b_inc
-            plt.plot(x, y_inc_fit, linestyle='--', alpha=0.7, label='Regresión ingresos')
-        except Exception:
-            pass
-
-        try:
-            m_exp, b_exp = np.polyfit(x, expenses, 1)
-            y_exp_fit = m_exp * x + b_exp
-            plt.plot(x, y_exp_fit, linestyle='--', alpha=0.7, label='Regresión gastos')
-        except Exception:
-            pass
-
-        plt.title(f'Tendencia de Ingresos y Gastos - {year}')
-        plt.xlabel('Mes')
-        plt.ylabel('Monto ($)')
-        plt.grid(True, alpha=0.3)
-        plt.xticks(x, month_labels, rotation=45)
-        plt.legend()
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight')
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return ReportService._render_chart('income_expense_trend',
+                                           ReportService.income_expense_trend_data(user_id, year))
 
     @staticmethod
-    def generate_assets_liabilities_pie(user_id):
-        """Generar gráfico de pastel de activos vs pasivos"""
+    @request_memo
+    def assets_liabilities_data(user_id):
+        """Datos del pastel de activos vs pasivos (None si ambos son 0)"""
         net_worth_data = ReportService.get_net_worth(user_id)
-        
-        # Datos para el gráfico
-        labels = ['Activos', 'Pasivos']
         sizes = [net_worth_data['total_assets'], net_worth_data['total_liabilities']]
-        colors = ['#28a745', '#dc3545']
-        explode = (0.05, 0)  # Explotar la primera rebanada
-        
         if sum(sizes) == 0:
             return None
-        
-        plt.figure(figsize=(8, 8))
-        plt.pie(sizes, explode=explode, labels=labels, colors=colors,
-                autopct='%1.1f%%', shadow=True, startangle=90)
-        plt.title('Distribución de Patrimonio\nActivos vs Pasivos', fontsize=14, fontweight='bold')
-        
-        # Agregar leyenda con valores
-        total = sum(sizes)
-        legend_labels = [f'{label}: ${size:,.2f} ({size/total*100:.1f}%)' for label, size in zip(labels, sizes)]
-        plt.legend(legend_labels, loc="best")
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return {'labels': ['Activos', 'Pasivos'], 'values': sizes, 'colors': ['#28a745', '#dc3545']}
 
     @staticmethod
-    def generate_debt_breakdown_pie(user_id):
-        """Generar gráfico de pastel del desglose de deudas"""
+    @request_memo
+    def generate_assets_liabilities_pie(user_id):
+        """Generar gráfico de pastel de activos vs pasivos"""
+        return ReportService._render_chart('assets_liabilities_pie', ReportService.assets_liabilities_data(user_id))
+
+    @staticmethod
+    @request_memo
+    def debt_breakdown_data(user_id):
+        """Datos del pastel de deudas por tipo (None si no hay deuda)"""
         debt_summary = ReportService.get_debt_summary(user_id)
         
-        # Preparar datos
         labels = []
         sizes = []
         
@@ -387,72 +546,41 @@ class ReportService:
         
         # Colores para diferentes tipos de deuda
         colors = ['#ff6b6b', '#feca57', '#48dbfb', '#ff9ff3', '#54a0ff']
-        
-        plt.figure(figsize=(8, 8))
-        plt.pie(sizes, labels=labels, colors=colors[:len(sizes)],
-                autopct='%1.1f%%', shadow=True, startangle=45)
-        plt.title('Desglose de Deudas por Tipo', fontsize=14, fontweight='bold')
-        
-        # Agregar leyenda con valores
-        total = sum(sizes)
-        legend_labels = [f'{label}: ${size:,.2f}' for label, size in zip(labels, sizes)]
-        plt.legend(legend_labels, loc="best")
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return {'labels': labels, 'values': sizes, 'colors': colors[:len(sizes)]}
 
     @staticmethod
-    def generate_monthly_flow_chart(user_id, year, month):
-        """Generar gráfico de flujo mensual (ingresos vs gastos vs ahorro)"""
+    @request_memo
+    def generate_debt_breakdown_pie(user_id):
+        """Generar gráfico de pastel del desglose de deudas"""
+        return ReportService._render_chart('debt_breakdown_pie', ReportService.debt_breakdown_data(user_id))
+
+    @staticmethod
+    @request_memo
+    def monthly_flow_data(user_id, year, month):
+        """Datos de barras del flujo mensual (ingresos vs gastos vs ahorro)"""
         monthly_summary = ReportService.get_monthly_summary(user_id, year, month)
-        
-        categories = ['Ingresos', 'Gastos', 'Ahorro/Pérdida']
         values = [
             monthly_summary['total_income'],
             monthly_summary['total_expenses'],
             monthly_summary['net_income']
         ]
-        
-        # Colores
-        colors = ['#28a745', '#dc3545', '#17a2b8' if values[2] >= 0 else '#ffc107']
-        
-        plt.figure(figsize=(10, 6))
-        bars = plt.bar(categories, values, color=colors, alpha=0.8)
-        
-        # Agregar valores sobre las barras
-        for bar, value in zip(bars, values):
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height + (max(values) * 0.01),
-                    f'${value:,.2f}', ha='center', va='bottom', fontweight='bold')
-        
-        plt.title(f'Flujo Financiero - {datetime(year, month, 1).strftime("%B %Y")}', 
-                 fontsize=14, fontweight='bold')
-        plt.ylabel('Monto ($)')
-        plt.grid(True, alpha=0.3, axis='y')
-        
-        # Ajustar límites del eje Y
-        max_val = max(abs(min(values)), max(values))
-        plt.ylim(-max_val * 0.1, max_val * 1.2)
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return {
+            'title': f'Flujo Financiero - {datetime(year, month, 1).strftime("%B %Y")}',
+            'labels': ['Ingresos', 'Gastos', 'Ahorro/Pérdida'],
+            'values': values,
+            'colors': ['#28a745', '#dc3545', '#17a2b8' if values[2] >= 0 else '#ffc107']
+        }
 
     @staticmethod
-    def generate_account_balances_chart(user_id):
-        """Generar gráfico de barras de balances por cuenta"""
-        # Obtener todas las cuentas activas
+    @request_memo
+    def generate_monthly_flow_chart(user_id, year, month):
+        """Generar gráfico de flujo mensual (ingresos vs gastos vs ahorro)"""
+        return ReportService._render_chart('monthly_flow', ReportService.monthly_flow_data(user_id, year, month))
+
+    @staticmethod
+    @request_memo
+    def account_balances_data(user_id):
+        """Balances por cuenta: activos positivos, deudas en negativo (None sin cuentas)"""
         accounts = Account.query.filter_by(user_id=user_id, is_active=True).all()
         
         if not accounts:
@@ -478,37 +606,78 @@ class ReportService:
             balances.append(-abs(acc.balance))  # Mostrar como negativo
             colors.append('#dc3545')  # Rojo para deudas
         
-        plt.figure(figsize=(12, 8))
-        bars = plt.barh(account_names, balances, color=colors, alpha=0.8)
-        
-        # Agregar valores en las barras
-        for i, (bar, balance) in enumerate(zip(bars, balances)):
-            width = bar.get_width()
-            label_x = width + (max(balances) * 0.01) if width >= 0 else width - (max(balances) * 0.01)
-            ha = 'left' if width >= 0 else 'right'
-            plt.text(label_x, bar.get_y() + bar.get_height()/2,
-                    f'${abs(balance):,.2f}', ha=ha, va='center', fontweight='bold')
-        
-        plt.title('Balance por Cuenta', fontsize=14, fontweight='bold')
-        plt.xlabel('Balance ($)')
-        plt.grid(True, alpha=0.3, axis='x')
-        
-        # Línea vertical en x=0
-        plt.axvline(x=0, color='black', linestyle='-', alpha=0.3)
-        
-        # Ajustar espaciado
-        plt.tight_layout()
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        return {'labels': account_names, 'values': balances, 'colors': colors}
+
+    @staticmethod
+    @request_memo
+    def generate_account_balances_chart(user_id):
+        """Generar gráfico de barras de balances por cuenta"""
+        return ReportService._render_chart('account_balances', ReportService.account_balances_data(user_id))
+
+    @staticmethod
+    def _income_transactions(user_id, account_ids, start_date, end_date):
+        return Transaction.query.options(*Transaction.profile('list')).filter(
+            Transaction.user_id == user_id,
+            Transaction.account_id.in_(account_ids),
+            Transaction.transaction_type == 'income',
+            # Excluir abonos que provienen de pagos a tarjetas (no son ingreso real)
+            Transaction.credit_card_id.is_(None),
+            Transaction.date >= start_date,
+            Transaction.date < end_date
+        ).all()
+
+    @staticmethod
+    def _income_entry(account, total_income, transactions):
+        return {
+            'account_id': account.id,
+            'account_name': account.name,
+            'total_income': total_income,
+            'transaction_count': len(transactions),
+            'transactions': transactions,
+            'current_balance': account.balance
+        }
+
+    @staticmethod
+    def _income_by_account_loop(user_id, accounts, start_date, end_date):
+        income_by_account = {}
+        total_income = 0
+        for account in accounts:
+            # Obtener ingresos del período para esta cuenta
+            income_transactions = ReportService._income_transactions(user_id, [account.id], start_date, end_date)
+            account_income = sum(t.amount for t in income_transactions)
+            if account_income > 0:
+                income_by_account[account.name] = ReportService._income_entry(
+                    account, account_income, income_transactions)
+                total_income += account_income
+        return income_by_account, total_income
 
     @staticmethod
+    def _income_by_account_numpy(user_id, accounts, start_date, end_date):
+        """Una consulta para todas las cuentas; totales por cuenta con ``bincount``"""
+        transactions = ReportService._income_transactions(
+            user_id, [a.id for a in accounts], start_date, end_date)
+        cents = decrypt_column([(t.amount_enc, t.enc_version) for t in transactions], 0, 'amount',
+                               version_index=1, kind='cents')
+        frame = report_vectorized.frame_from_columns(
+            cents, [t.transaction_type for t in transactions], [t.category for t in transactions],
+            [report_vectorized.month_index(t.date.year, t.date.month) for t in transactions],
+            [t.account_id for t in transactions], [t.credit_card_id for t in transactions])
+        totals = report_vectorized.income_by_account(frame, [a.id for a in accounts])
+        by_account = {}
+        for t in transactions:
+            by_account.setdefault(t.account_id, []).append(t)
+        income_by_account = {}
+        total_cents = 0
+        for account in accounts:
+            account_cents, _ = totals.get(account.id, (0, 0))
+            if account_cents > 0:
+                income_by_account[account.name] = ReportService._income_entry(
+                    account, account_cents / 100, by_account.get(account.id, []))
+                total_cents += account_cents
+        return income_by_account, total_cents / 100
+
+    @staticmethod
+    @request_memo
     def get_income_by_account_summary(user_id, year=None, month=None):
         """Obtener resumen de ingresos por cuenta"""
         # Si no se especifica año/mes, usar el actual
@@ -531,33 +700,12 @@ class ReportService:
             is_debt_account=False
         ).all()
         
-        income_by_account = {}
-        total_income = 0
-        
-        for account in accounts:
-            # Obtener ingresos del período para esta cuenta
-            income_transactions = Transaction.query.filter(
-                Transaction.user_id == user_id,
-                Transaction.account_id == account.id,
-                Transaction.transaction_type == 'income',
-                # Excluir abonos que provienen de pagos a tarjetas (no son ingreso real)
-                Transaction.credit_card_id.is_(None),
-                Transaction.date >= start_date,
-                Transaction.date < end_date
-            ).all()
-            
-            account_income = sum(t.amount for t in income_transactions)
-            
-            if account_income > 0:
-                income_by_account[account.name] = {
-                    'account_id': account.id,
-                    'account_name': account.name,
-                    'total_income': account_income,
-                    'transaction_count': len(income_transactions),
-                    'transactions': income_transactions,
-                    'current_balance': account.balance
-                }
-                total_income += account_income
+        if ReportService._backend() == 'numpy':
+            income_by_account, total_income = ReportService._income_by_account_numpy(
+                user_id, accounts, start_date, end_date)
+        else:
+            income_by_account, total_income = ReportService._income_by_account_loop(
+                user_id, accounts, start_date, end_date)
         
         # Calcular porcentajes
         for account_data in income_by_account.values():
@@ -574,87 +722,69 @@ class ReportService:
         }
 
     @staticmethod
-    def generate_income_by_account_pie(user_id, year=None, month=None):
-        """Generar gráfico de pastel de ingresos por cuenta"""
+    @request_memo
+    def income_by_account_data(user_id, year=None, month=None):
+        """Datos del pastel de ingresos por cuenta (None si no hay ingresos)"""
         income_data = ReportService.get_income_by_account_summary(user_id, year, month)
         
         if not income_data['income_by_account']:
             return None
         
-        # Preparar datos para el gráfico
-        labels = []
-        sizes = []
         colors = ['#28a745', '#17a2b8', '#ffc107', '#dc3545', '#6f42c1', '#fd7e14', '#20c997', '#e83e8c']
-        
-        for account_name, data in income_data['income_by_account'].items():
-            labels.append(account_name)
-            sizes.append(data['total_income'])
-        
-        plt.figure(figsize=(10, 8))
-        wedges, texts, autotexts = plt.pie(sizes, labels=labels, colors=colors[:len(sizes)],
-                                          autopct='%1.1f%%', shadow=True, startangle=45)
-        
-        # Mejorar el texto
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontweight('bold')
-        
-        plt.title(f'Distribución de Ingresos por Cuenta\n{income_data["period"]}', 
-                 fontsize=14, fontweight='bold')
-        
-        # Agregar leyenda con valores
-        legend_labels = [f'{label}: ${size:,.2f}' for label, size in zip(labels, sizes)]
-        plt.legend(legend_labels, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        labels = list(income_data['income_by_account'].keys())
+        return {
+            'title': f'Distribución de Ingresos por Cuenta\n{income_data["period"]}',
+            'labels': labels,
+            'values': [data['total_income'] for data in income_data['income_by_account'].values()],
+            'colors': colors[:len(labels)]
+        }
 
     @staticmethod
-    def generate_income_by_account_bar(user_id, year=None, month=None):
-        """Generar gráfico de barras de ingresos por cuenta"""
+    @request_memo
+    def generate_income_by_account_pie(user_id, year=None, month=None):
+        """Generar gráfico de pastel de ingresos por cuenta"""
+        return ReportService._render_chart('income_by_account_pie',
+                                           ReportService.income_by_account_data(user_id, year, month))
+
+    @staticmethod
+    @request_memo
+    def income_by_account_bar_data(user_id, year=None, month=None):
+        """Datos de barras de ingresos por cuenta, ordenados por monto descendente"""
         income_data = ReportService.get_income_by_account_summary(user_id, year, month)
         
         if not income_data['income_by_account']:
             return None
         
-        # Preparar datos
-        account_names = list(income_data['income_by_account'].keys())
-        income_amounts = [data['total_income'] for data in income_data['income_by_account'].values()]
-        
         # Ordenar por monto descendente
-        sorted_data = sorted(zip(account_names, income_amounts), key=lambda x: x[1], reverse=True)
-        account_names, income_amounts = zip(*sorted_data)
-        
-        plt.figure(figsize=(12, 8))
-        bars = plt.bar(account_names, income_amounts, color='#28a745', alpha=0.8)
-        
-        # Agregar valores sobre las barras
-        for bar, amount in zip(bars, income_amounts):
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height + (max(income_amounts) * 0.01),
-                    f'${amount:,.2f}', ha='center', va='bottom', fontweight='bold')
-        
-        plt.title(f'Ingresos por Cuenta - {income_data["period"]}', 
-                 fontsize=14, fontweight='bold')
-        plt.ylabel('Ingresos ($)')
-        plt.xlabel('Cuentas')
-        plt.xticks(rotation=45, ha='right')
-        plt.grid(True, alpha=0.3, axis='y')
-        
-        # Ajustar layout
-        plt.tight_layout()
-        
-        # Convertir a base64
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
-        
-        return img_data
+        sorted_data = sorted(((name, data['total_income']) for name, data in income_data['income_by_account'].items()),
+                             key=lambda x: x[1], reverse=True)
+        return {
+            'title': f'Ingresos por Cuenta - {income_data["period"]}',
+            'labels': [name for name, _ in sorted_data],
+            'values': [amount for _, amount in sorted_data]
+        }
+
+    @staticmethod
+    @request_memo
+    def generate_income_by_account_bar(user_id, year=None, month=None):
+        """Generar gráfico de barras de ingresos por cuenta"""
+        return ReportService._render_chart('income_by_account_bar',
+                                           ReportService.income_by_account_bar_data(user_id, year, month))
+
+
+# Gráficas del reporte mensual, en el orden de la página
+MONTHLY_CHARTS = ('monthly_flow', 'expense_pie', 'assets_liabilities_pie', 'debt_breakdown_pie',
+                  'account_balances', 'income_expense_trend')
+
+# tipo de gráfica -> spec para (user_id, year, month); las que no dependen del período lo ignoran
+_CHART_DATA = {
+    'expense_pie': lambda user_id, year, month: ReportService.expense_chart_data(user_id, year, month),
+    'income_expense_trend': lambda user_id, year, month: ReportService.income_expense_trend_data(user_id, year),
+    'assets_liabilities_pie': lambda user_id, year, month: ReportService.assets_liabilities_data(user_id),
+    'debt_breakdown_pie': lambda user_id, year, month: ReportService.debt_breakdown_data(user_id),
+    'monthly_flow': lambda user_id, year, month: ReportService.monthly_flow_data(user_id, year, month),
+    'account_balances': lambda user_id, year, month: ReportService.account_balances_data(user_id),
+    'income_by_account_pie': lambda user_id, year, month: ReportService.income_by_account_data(user_id, year, month),
+    'income_by_account_bar': lambda user_id, year, month: ReportService.income_by_account_bar_data(
+        user_id, year, month),
+}
@@ -0,0 +1,145 @@
+"""Saldo acumulado cifrado por transacción ("saldo después de esta transacción").
+
+Cada transacción guarda en ``running_balance_enc`` el saldo de su ámbito tras
+aplicarla: la cuenta (``account_id``) o, si no tiene cuenta, la tarjeta
+(``credit_card_id``). El orden del ámbito es ``(date, id)``. Así un estado de
+cuenta paginado muestra el saldo por fila descifrando sólo la página.
+
+Mantenimiento (lo invoca ``app.services.balance_service`` en ``after_flush``):
+
+- Alta al final del ámbito (caso normal): saldo del predecesor + efecto, O(1).
+- Alta retroactiva, edición o borrado: se reescribe el sufijo del ámbito desde la
+  clave ``(date, id)`` más antigua afectada en adelante.
+- Si el predecesor aún no tiene saldo (filas previas a la migración) se
+  reescribe el ámbito completo una vez.
+
+Reglas de signo: las de ``account_effect`` / ``card_effect``. Las cuentas de
+deuda parten de ``original_debt_amount``. En tarjetas el acumulado no se recorta
+en 0 (el balance guardado sí).
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.utils.crypto_fields import decrypt_cents, decrypt_column, encrypt_cents, to_cents
+
+RUNNING_FIELD = 'running_balance'
+
+Key = Tuple[Optional[datetime], int]
+
+
+def scope_of(account_id, credit_card_id) -> Optional[Tuple[str, int]]:
+    """Ámbito del saldo acumulado de una transacción."""
+    if account_id:
+        return ('account', account_id)
+    if credit_card_id:
+        return ('card', credit_card_id)
+    return None
+
+
+def _key_sort(key: Key):
+    return (key[0] or datetime.min, key[1] or 0)
+
+
+def _scope_filter(table, kind: str, scope_id: int):
+    if kind == 'account':
+        return table.c.account_id == scope_id
+    # Tarjeta: sólo transacciones sin cuenta (las que tienen cuenta pertenecen a ella)
+    return and_(table.c.credit_card_id == scope_id, table.c.account_id.is_(None))
+
+
+def _base_and_effect(conn, kind: str, scope_id: int):
+    from app.models.account import Account
+    from app.services.balance_service import account_effect, card_effect  # import diferido (ciclo)
+
+    if kind == 'card':
+        return 0, card_effect
+    table = Account.__table__
+    row = conn.execute(
+        select(table.c.is_debt_account, table.c.original_debt_amount).where(table.c.id == scope_id)
+    ).first()
+    is_debt = bool(row and row.is_debt_account)
+    base = to_cents(row.original_debt_amount or 0) if is_debt else 0
+    return base, (lambda tx_type, cents: account_effect(tx_type, cents, is_debt))
+
+
+def rewrite_suffix(session, conn, kind: str, scope_id: int, from_key: Optional[Key] = None) -> int:
+    """Reescribir ``running_balance_enc`` del ámbito desde ``from_key`` (inclusive).
+
+    ``from_key=None`` reescribe el ámbito completo. Devuelve filas escritas.
+    """
+    from app.models.transaction import Transaction
+
+    table = Transaction.__table__
+    scope = _scope_filter(table, kind, scope_id)
+    base, effect = _base_and_effect(conn, kind, scope_id)
+    running = base
+    suffix = scope
+    if from_key is not None:
+        date, tx_id = from_key
+        after = or_(table.c.date > date, and_(table.c.date == date, table.c.id >= tx_id))
+        before = or_(table.c.date < date, and_(table.c.date == date, table.c.id < tx_id))
+        prev = conn.execute(
+            select(table.c.running_balance_enc, table.c.enc_version)
+            .where(scope, before).order_by(table.c.date.desc(), table.c.id.desc()).limit(1)
+        ).first()
+        if prev is not None:
+            prev_cents = decrypt_cents(prev.running_balance_enc, RUNNING_FIELD, prev.enc_version or 1)
+            if prev_cents is None:
+                return rewrite_suffix(session, conn, kind, scope_id, None)
+            running = prev_cents
+        suffix = and_(scope, after)
+    rows = conn.execute(
+        select(table.c.id, table.c.transaction_type, table.c.amount_enc, table.c.enc_version)
+        .where(suffix).order_by(table.c.date, table.c.id)
+    ).all()
+    if not rows:
+        return 0
+    amounts = decrypt_column(rows, 2, 'amount', version_index=3, kind='cents')
+    params = []
+    for row, cents in zip(rows, amounts):
+        running += effect(row.transaction_type, cents)
+        params.append({'b_id': row.id, 'running_balance_enc': encrypt_cents(running, RUNNING_FIELD, row.enc_version or 1)})
+    conn.execute(update(table).where(table.c.id == bindparam('b_id'))
+                 .values(running_balance_enc=bindparam('running_balance_enc')), params)
+    for p in params:
+        tx = session.identity_map.get(session.identity_key(Transaction, p['b_id']))
+        if tx is not None:
+            set_committed_value(tx, 'running_balance_enc', p['running_balance_enc'])
+    return len(params)
+
+
+def apply_changes(session, conn, changes: Iterable[Tuple[str, int, Key]]) -> int:
+    """Reescribir los sufijos afectados: ``changes`` = (ámbito, id, clave (date, id))."""
+    earliest: Dict[Tuple[str, int], Key] = {}
+    for kind, scope_id, key in changes:
+        current = earliest.get((kind, scope_id))
+        if current is None or _key_sort(key) < _key_sort(current):
+            earliest[(kind, scope_id)] = key
+    written = 0
+    for (kind, scope_id) in sorted(earliest):
+        key = earliest[(kind, scope_id)]
+        written += rewrite_suffix(session, conn, kind, scope_id, key if key[0] is not None else None)
+    return written
+
+
+def rebuild_running_balances(session, account_ids: Iterable[int] = (), card_ids: Iterable[int] = ()) -> int:
+    """Reparación/backfill: reescribir el saldo acumulado completo de cuentas y tarjetas."""
+    conn = session.connection()
+    written = 0
+    for account_id in account_ids:
+        written += rewrite_suffix(session, conn, 'account', account_id, None)
+    for card_id in card_ids:
+        written += rewrite_suffix(session, conn, 'card', card_id, None)
+    return written
+
+
+def running_balances(transactions: List[Any]) -> Dict[int, Optional[float]]:
+    """Saldo acumulado descifrado en bloque para una página de transacciones (id -> saldo)."""
+    rows = [(t.id, t.running_balance_enc, t.enc_version) for t in transactions]
+    values = decrypt_column(rows, 1, RUNNING_FIELD, version_index=2, kind='cents')
+    return {r[0]: (v / 100 if r[1] is not None else None) for r, v in zip(rows, values)}
@@ -2,6 +2,7 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from app.services.payment_reminder_service import PaymentReminderService
 from app.services.daily_maintenance_service import DailyMaintenanceService
 import atexit
+import os
 from zoneinfo import ZoneInfo  # Python 3.11 stdlib
 
 # Nota: El scheduler se inicializa con la zona horaria configurada en app.config['TIMEZONE'].
@@ -13,6 +14,10 @@ scheduler = None
 def init_scheduler(app):
     """Inicializar el scheduler para tareas programadas"""
     global scheduler
+
+    # Procesos auxiliares (p.ej. workers de reconciliación) importan la app sin scheduler
+    if os.environ.get('DISABLE_SCHEDULER') == '1':
+        return
     
     if scheduler is None:
         # Obtener timezone desde configuración (fallback a UTC si inválida)
@@ -53,6 +58,31 @@ def init_scheduler(app):
             minute=0,
             id='daily_maintenance'
         )
+
+        # Rotación de llaves online (opcional): lotes pequeños y throttled cada N segundos
+        if app.config.get('KEY_ROTATION_ENABLED'):
+            from app.services.online_key_rotation import OnlineKeyRotationService
+            scheduler.add_job(
+                func=with_app_context(OnlineKeyRotationService.run_scheduled),
+                trigger="interval",
+                seconds=app.config.get('KEY_ROTATION_INTERVAL_SECONDS', 60),
+                id='online_key_rotation',
+                max_instances=1,
+                coalesce=True
+            )
+
+        # Auditoría de balances contra el ledger (opcional), diaria
+        if app.config.get('RECONCILE_ENABLED'):
+            from app.services.reconcile import run_scheduled as run_reconcile
+            scheduler.add_job(
+                func=with_app_context(run_reconcile),
+                trigger="cron",
+                hour=app.config.get('RECONCILE_HOUR', 4),
+                minute=0,
+                id='reconcile_balances',
+                max_instances=1,
+                coalesce=True
+            )
         
         scheduler.start()
         
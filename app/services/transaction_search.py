@@ -1,14 +1,35 @@
-"""Helpers de búsqueda sobre campos cifrados de Transaction usando blind indexes.
+"""Helpers de búsqueda sobre campos cifrados de Transaction.
+
+- Igualdad exacta vía blind indexes (``find_by_description`` / ``find_by_notes`` /
+  ``find_by_creditor``).
+- Substring (multi-término, AND) vía ``transaction_search_tokens``: el texto de
+  búsqueda se convierte en tokens HMAC y se resuelve con un join indexado, sin
+  descifrar descripciones en Python.
+- Rango de monto vía ``amount_bucket_bidx``: SQL descarta los buckets fuera del
+  rango y sólo se descifran las filas de los buckets de borde.
+- Listados paginados: ``verified_ids`` confirma texto y monto sobre los candidatos
+  que ya cumplen los demás filtros (descifrando sólo las columnas necesarias) y
+  ``paginate_ids`` carga únicamente la página pedida.
 
 Uso:
-    from app.services.transaction_search import find_by_description
+    from app.services.transaction_search import find_by_description, search_transactions
     results = find_by_description(user_id, "Compra super")
+    results = search_transactions(user_id, "uber eats")
 """
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import func, or_, text
+from app import db
 from app.models.transaction import Transaction
-from app.utils.crypto_fields import blind_index
+from app.models.transaction_search_token import TransactionSearchToken
+from app.utils.crypto_fields import (
+    amount_bucket_hashes, amount_bucket_range, blind_index, decrypt_column, known_enc_versions,
+    query_terms, search_token, search_words, to_cents,
+)
+
+SEARCH_FIELDS = ('description', 'notes')
 
 
 def _normalize(value: str) -> str:
@@ -34,3 +55,210 @@ def find_by_creditor(user_id: int, creditor: str) -> List[Transaction]:
     if not h:
         return []
     return Transaction.query.filter_by(user_id=user_id, creditor_name_bidx=h).all()
+
+
+def matching_ids_subquery(user_id: int, text: str, fields: Sequence[str] = SEARCH_FIELDS):
+    """Subconsulta de ids de transacciones que contienen todos los términos de ``text``.
+
+    Cada fila tiene tokens de una sola versión de cifrado, así que se buscan los
+    hashes de todas las versiones conocidas y se exige ``COUNT(DISTINCT) == n``.
+    Devuelve None si ``text`` no produce términos.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return None
+    hashes = [search_token(term, version) for version in known_enc_versions() for term in terms]
+    tok = TransactionSearchToken
+    return (
+        db.session.query(tok.transaction_id)
+        .filter(tok.user_id == user_id, tok.field.in_(list(fields)), tok.token_hash.in_(hashes))
+        .group_by(tok.transaction_id)
+        .having(func.count(func.distinct(tok.token_hash)) == len(terms))
+    )
+
+
+def filter_by_text(query, user_id: int, text: str, fields: Sequence[str] = SEARCH_FIELDS):
+    """Aplicar búsqueda por substring a una query de Transaction.
+
+    Sin verificación exacta: puede incluir falsos positivos de trigramas. Para
+    listados que se muestran al usuario usar ``verified_ids`` + ``paginate_ids``.
+    """
+    sub = matching_ids_subquery(user_id, text, fields)
+    if sub is None:
+        return query
+    return query.filter(Transaction.id.in_(sub))
+
+
+def search_transactions(user_id: int, text: str, fields: Sequence[str] = SEARCH_FIELDS,
+                        verify: bool = True) -> List[Transaction]:
+    """Transacciones cuyo description/notes contiene todas las palabras de ``text``.
+
+    Los trigramas pueden dar falsos positivos ("tube berry" para "uber"); con
+    ``verify`` se descifran sólo los candidatos y se confirma el substring.
+    """
+    sub = matching_ids_subquery(user_id, text, fields)
+    if sub is None:
+        return []
+    candidates = (Transaction.query.filter(Transaction.user_id == user_id, Transaction.id.in_(sub))
+                  .order_by(Transaction.date.desc()).all())
+    if not verify:
+        return candidates
+    words = search_words(text)
+    return [t for t in candidates if _contains_all(words, [getattr(t, f) for f in fields])]
+
+
+def _contains_all(words: Sequence[str], values: Sequence[Optional[str]]) -> bool:
+    haystack = ' '.join(' '.join(search_words(v)) for v in values)
+    return all(w in haystack for w in words)
+
+
+def verified_ids(query, user_id: int, text: Optional[str] = None, min_amount=None, max_amount=None,
+                 fields: Sequence[str] = SEARCH_FIELDS, stats: Optional[Dict[str, Any]] = None) -> Optional[List[int]]:
+    """Ids de ``query`` que cumplen de verdad el texto y el rango de monto, en su orden.
+
+    ``query`` debe traer ya el resto de filtros (usuario, cuenta, categoría...):
+    SQL reduce los candidatos con los tokens de texto y los buckets de monto y
+    sólo se descifran las columnas necesarias de esos candidatos: los blobs de
+    ``fields`` si hay texto y ``amount_enc`` de las filas en buckets de borde.
+    ``stats`` (opcional) recibe el número de montos descifrados.
+    Devuelve None si no hay texto con términos ni límites de monto.
+    """
+    sub = matching_ids_subquery(user_id, text, fields) if text else None
+    bounds = _amount_bounds(min_amount, max_amount)
+    if sub is None and bounds is None:
+        return None
+    columns = [Transaction.id, Transaction.enc_version]
+    if sub is not None:
+        query = query.filter(Transaction.id.in_(sub))
+        columns += [getattr(Transaction, f'{f}_enc') for f in fields]
+    if bounds is not None:
+        query = query.filter(_amount_candidates(bounds))
+        columns += [Transaction.amount_bucket_bidx, Transaction.amount_enc]
+    rows = query.with_entities(*columns).all()
+
+    keep = [True] * len(rows)
+    if sub is not None:
+        words = search_words(text)
+        plain = [decrypt_column(rows, 2 + i, f, version_index=1) for i, f in enumerate(fields)]
+        keep = [_contains_all(words, values) for values in zip(*plain)]
+    if bounds is not None:
+        min_c, max_c, interior_hashes, _ = bounds
+        interior = set(interior_hashes)
+        # Sólo las filas de buckets de borde (o sin bucket) que siguen en pie
+        border = [row for row, ok in zip(rows, keep) if ok and row[-2] not in interior]
+        cents = decrypt_column(border, len(columns) - 1, 'amount', version_index=1, kind='cents', parallel=True)
+        outside = {row[0] for row, c in zip(border, cents) if not _in_range(c, min_c, max_c)}
+        keep = [ok and row[0] not in outside for row, ok in zip(rows, keep)]
+        if stats is not None:
+            stats['decrypted'] = len(border)
+    return [row[0] for row, ok in zip(rows, keep) if ok]
+
+
+class IdPagination(Pagination):
+    """Paginación sobre ids ya verificados: sólo se cargan las filas de la página."""
+
+    def _query_items(self) -> List[Transaction]:
+        ids = self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]
+        if not ids:
+            return []
+        by_id = {t.id: t for t in self._query_args['query'].filter(Transaction.id.in_(ids))}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def _query_count(self) -> int:
+        return len(self._query_args['ids'])
+
+
+def paginate_ids(query, ids: Sequence[int], page: int, per_page: int, error_out: bool = False) -> IdPagination:
+    """Paginar ``ids`` (p.ej. de ``verified_ids``) cargando las filas con ``query`` (opciones de carga)."""
+    return IdPagination(page=page, per_page=per_page, error_out=error_out, query=query, ids=list(ids))
+
+
+def replace_search_tokens(items: Iterable[Tuple[int, str, int, Sequence[str]]]) -> int:
+    """Reescribir tokens vía Core (backfill / rotación), sin confirmar la transacción.
+
+    ``items``: (transaction_id, field, enc_version, hashes). Borra los tokens previos
+    del campo e inserta los nuevos tomando ``user_id`` de la transacción.
+    Devuelve el número de tokens insertados.
+    """
+    items = list(items)
+    if not items:
+        return 0
+    db.session.execute(
+        text("DELETE FROM transaction_search_tokens WHERE transaction_id = :tid AND field = :field"),
+        [{'tid': tid, 'field': field} for tid, field, _, _ in items],
+    )
+    inserts = [
+        {'tid': tid, 'field': field, 'h': h, 'v': version}
+        for tid, field, version, hashes in items for h in hashes
+    ]
+    if inserts:
+        db.session.execute(
+            text(
+                "INSERT INTO transaction_search_tokens (transaction_id, user_id, field, token_hash, enc_version) "
+                "SELECT :tid, user_id, :field, :h, :v FROM transactions WHERE id = :tid"
+            ),
+            inserts,
+        )
+    return len(inserts)
+
+
+def _amount_bounds(min_amount=None, max_amount=None):
+    """(min_c, max_c, hashes interiores, hashes de borde) o None si no hay límites."""
+    if min_amount is None and max_amount is None:
+        return None
+    min_c = to_cents(min_amount) if min_amount is not None else None
+    max_c = to_cents(max_amount) if max_amount is not None else None
+    interior, boundary = amount_bucket_range(min_c, max_c)
+    return min_c, max_c, amount_bucket_hashes(interior), amount_bucket_hashes(boundary)
+
+
+def _amount_candidates(bounds):
+    """Criterio SQL de filas que pueden estar en el rango (bucket interior, de borde o sin bucket)."""
+    _, _, interior_hashes, boundary_hashes = bounds
+    return or_(Transaction.amount_bucket_bidx.in_(interior_hashes + boundary_hashes),
+               Transaction.amount_bucket_bidx.is_(None))
+
+
+def _in_range(cents: int, min_c: Optional[int], max_c: Optional[int]) -> bool:
+    return (min_c is None or cents >= min_c) and (max_c is None or cents <= max_c)
+
+
+def amount_range_criterion(user_id: int, min_amount=None, max_amount=None,
+                           stats: Optional[Dict[str, Any]] = None, within=None):
+    """Criterio SQL equivalente a ``min_amount <= amount <= max_amount`` para un usuario.
+
+    Filas en buckets interiores se aceptan sólo con el blind index; las de buckets de
+    borde (o sin bucket, p.ej. previas a la columna) se descifran para decidir y se
+    incluyen por id. ``within`` (query de Transaction con el resto de filtros ya
+    aplicados) limita ese descifrado y la lista de ids a las filas que los cumplen;
+    sin ella se recorre todo el historial del usuario. Los listados paginados usan
+    ``verified_ids``, que no arma la lista de ids.
+    ``stats`` (opcional) recibe el número de filas descifradas.
+    Devuelve None si no hay límites.
+    """
+    bounds = _amount_bounds(min_amount, max_amount)
+    if bounds is None:
+        return None
+    min_c, max_c, interior_hashes, boundary_hashes = bounds
+    rows = db.session.query(Transaction.id, Transaction.amount_enc, Transaction.enc_version).filter(
+        Transaction.user_id == user_id,
+        or_(Transaction.amount_bucket_bidx.in_(boundary_hashes), Transaction.amount_bucket_bidx.is_(None)),
+    )
+    if within is not None:
+        rows = rows.filter(Transaction.id.in_(within.order_by(None).with_entities(Transaction.id)))
+    rows = rows.all()
+    cents = decrypt_column(rows, 1, 'amount', version_index=2, kind='cents', parallel=True)
+    boundary_ids = [row[0] for row, c in zip(rows, cents) if _in_range(c, min_c, max_c)]
+    if stats is not None:
+        stats['decrypted'] = len(rows)
+        stats['boundary_matches'] = len(boundary_ids)
+    return or_(Transaction.amount_bucket_bidx.in_(interior_hashes), Transaction.id.in_(boundary_ids))
+
+
+def filter_by_amount(query, user_id: int, min_amount=None, max_amount=None):
+    """Aplicar filtro de rango de monto a una query de Transaction (aplicarlo al final:
+    sólo se descifran las filas de borde que ya cumplen los demás filtros)."""
+    criterion = amount_range_criterion(user_id, min_amount, max_amount, within=query)
+    if criterion is None:
+        return query
+    return query.filter(criterion)
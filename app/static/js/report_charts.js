@@ -0,0 +1,128 @@
+/*
+ * Gráficas de reportes dibujadas en el navegador (REPORT_CHART_MODE=client o ?render=client).
+ *
+ * Lee las series de /api/reports/monthly (las mismas specs que dibuja el servidor
+ * con matplotlib, ver app/services/report_charts.py) y llena cada
+ * <div class="report-chart" data-chart="tipo"> con Chart.js. Una spec null
+ * muestra el mensaje de "sin datos" del template.
+ */
+(function () {
+    'use strict';
+
+    var PALETTE = ['#28a745', '#dc3545', '#17a2b8', '#ffc107', '#6f42c1', '#fd7e14', '#20c997', '#e83e8c'];
+
+    function money(value) {
+        return '$' + Number(value).toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    function title(text) {
+        return text ? {display: true, text: String(text).split('\n'), font: {size: 14, weight: 'bold'}} : {display: false};
+    }
+
+    function moneyTooltip(horizontal) {
+        return {
+            callbacks: {
+                label: function (ctx) {
+                    var value = horizontal ? ctx.parsed.x : (ctx.parsed.y !== undefined ? ctx.parsed.y : ctx.parsed);
+                    return (ctx.dataset.label || ctx.label) + ': ' + money(value);
+                }
+            }
+        };
+    }
+
+    function pie(spec, defaultTitle) {
+        return {
+            type: 'pie',
+            data: {
+                labels: spec.labels,
+                datasets: [{data: spec.values, backgroundColor: spec.colors || PALETTE.slice(0, spec.values.length)}]
+            },
+            options: {plugins: {title: title(spec.title || defaultTitle), tooltip: moneyTooltip(false)}}
+        };
+    }
+
+    function bar(spec, yLabel, horizontal, color) {
+        return {
+            type: 'bar',
+            data: {
+                labels: spec.labels,
+                datasets: [{label: yLabel, data: spec.values, backgroundColor: spec.colors || color}]
+            },
+            options: {
+                indexAxis: horizontal ? 'y' : 'x',
+                plugins: {title: title(spec.title), legend: {display: false}, tooltip: moneyTooltip(horizontal)}
+            }
+        };
+    }
+
+    // Recta y = m*x + b evaluada en x = 1..n (coeficientes calculados en el servidor)
+    function regression(coefficients, n) {
+        var points = [];
+        for (var x = 1; x <= n; x++) {
+            points.push(coefficients[0] * x + coefficients[1]);
+        }
+        return points;
+    }
+
+    function trend(spec) {
+        var n = spec.labels.length;
+        return {
+            type: 'line',
+            data: {
+                labels: spec.labels,
+                datasets: [
+                    {label: 'Ingresos', data: spec.income, borderColor: '#1f77b4', pointStyle: 'circle'},
+                    {label: 'Gastos', data: spec.expenses, borderColor: '#ff7f0e', pointStyle: 'rect'},
+                    {label: 'Regresión ingresos', data: regression(spec.income_trend, n), borderColor: '#1f77b4',
+                     borderDash: [6, 4], pointRadius: 0},
+                    {label: 'Regresión gastos', data: regression(spec.expense_trend, n), borderColor: '#ff7f0e',
+                     borderDash: [6, 4], pointRadius: 0}
+                ]
+            },
+            options: {plugins: {title: title(spec.title), tooltip: moneyTooltip(false)}}
+        };
+    }
+
+    var BUILDERS = {
+        expense_pie: function (spec) { return pie(spec); },
+        assets_liabilities_pie: function (spec) { return pie(spec, 'Distribución de Patrimonio\nActivos vs Pasivos'); },
+        debt_breakdown_pie: function (spec) { return pie(spec, 'Desglose de Deudas por Tipo'); },
+        income_by_account_pie: function (spec) { return pie(spec); },
+        monthly_flow: function (spec) { return bar(spec, 'Monto ($)', false); },
+        account_balances: function (spec) { return bar(spec, 'Balance ($)', true); },
+        income_by_account_bar: function (spec) { return bar(spec, 'Ingresos ($)', false, '#28a745'); },
+        income_expense_trend: trend
+    };
+
+    function showEmpty(slot) {
+        slot.querySelector('canvas').classList.add('d-none');
+        slot.querySelector('.chart-empty').classList.remove('d-none');
+    }
+
+    window.renderReportCharts = function (url) {
+        var slots = document.querySelectorAll('.report-chart[data-chart]');
+        // Sin `cache: no-store`: el navegador revalida con If-None-Match y recibe 304 si nada cambió
+        return fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.json();
+            })
+            .then(function (payload) {
+                slots.forEach(function (slot) {
+                    var spec = payload.charts[slot.dataset.chart];
+                    var build = BUILDERS[slot.dataset.chart];
+                    if (!spec || !build || typeof Chart === 'undefined') {
+                        showEmpty(slot);
+                        return;
+                    }
+                    new Chart(slot.querySelector('canvas'), build(spec));
+                });
+            })
+            .catch(function (error) {
+                console.error('No se pudieron cargar las gráficas del reporte', error);
+                slots.forEach(showEmpty);
+            });
+    };
+})();
@@ -0,0 +1,189 @@
+"""Caché de gráficas renderizadas, direccionada por contenido.
+
+La clave es el SHA-256 de ``(tipo, spec, figsize, dpi, CHART_CACHE_VERSION)``:
+mismos datos producen la misma imagen, así que una gráfica sin cambios no vuelve
+a pasar por matplotlib. No hace falta invalidar: datos nuevos producen otra clave
+y las entradas viejas salen por tamaño.
+
+Dos niveles:
+
+- Memoria: LRU por proceso (``CHART_CACHE_MEMORY_ITEMS`` entradas).
+- Disco (opcional, sólo si se define ``CHART_CACHE_DIR``): un archivo por clave,
+  compartido entre workers de gunicorn. Se escribe de forma atómica (archivo
+  temporal + ``os.replace``); un acierto actualiza el mtime y, cada
+  ``EVICT_EVERY`` escrituras, se borran los archivos menos recientes hasta quedar
+  bajo ``CHART_CACHE_MAX_MB``. Los PNG muestran balances, ingresos y gastos ya
+  descifrados y se guardan sin cifrar: usar sólo un directorio privado en un
+  volumen cifrado. Por defecto la caché vive sólo en memoria.
+
+Desactivar: ``CHART_CACHE_ENABLED=0``. Sin app context se usa sólo memoria.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_VERSION = 2  # incrementar al cambiar el dibujo de las gráficas
+EVICT_EVERY = 32
+_SUFFIX = '.b64'
+
+
+def chart_key(kind: str, spec: Dict[str, Any], figsize, dpi) -> str:
+    payload = json.dumps([CHART_CACHE_VERSION, kind, spec, list(figsize), dpi],
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ChartCache:
+    """LRU en memoria + directorio compartido con desalojo por tamaño."""
+
+    def __init__(self, memory_items: int = 128, disk_dir: Optional[str] = None, max_bytes: int = 64 << 20):
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir
+        self.max_bytes = max_bytes
+        self._memory: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    # -- memoria ---------------------------------------------------------
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: str) -> None:
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # -- disco -----------------------------------------------------------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key + _SUFFIX)
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='ascii') as fh:
+                value = fh.read()
+            os.utime(path)  # desalojo por antigüedad de uso
+            return value or None
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, value: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='ascii') as fh:
+                fh.write(value)
+            os.replace(tmp, path)
+        except OSError as exc:  # la caché nunca debe romper el reporte
+            logger.warning('[chart-cache] no se pudo escribir %s: %s', path, exc)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Borrar los archivos menos recientes hasta quedar bajo ``max_bytes``. Devuelve borrados."""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    # -- API -------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats['memory_hits'] += 1
+            return value
+        value = self._disk_get(key)
+        if value is not None:
+            self.stats['disk_hits'] += 1
+            self._memory_put(key, value)
+            return value
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def get_or_render(self, key: str, render: Callable[[], Optional[str]]) -> Optional[str]:
+        value = self.get(key)
+        if value is None:
+            value = render()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+_caches: Dict[tuple, ChartCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_chart_cache() -> Optional[ChartCache]:
+    """Caché del proceso según la config de la app (None si está desactivada)."""
+    from flask import current_app, has_app_context
+
+    if has_app_context():
+        cfg = current_app.config
+        if not cfg.get('CHART_CACHE_ENABLED', True):
+            return None
+        settings = (cfg.get('CHART_CACHE_MEMORY_ITEMS', 128), cfg.get('CHART_CACHE_DIR'),
+                    int(cfg.get('CHART_CACHE_MAX_MB', 64)) << 20)
+    else:
+        settings = (128, None, 0)
+    with _caches_lock:
+        cache = _caches.get(settings)
+        if cache is None:
+            cache = _caches[settings] = ChartCache(*settings)
+        return cache
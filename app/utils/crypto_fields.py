@@ -11,15 +11,39 @@ consultas. Se genera también un blind index (HMAC) para búsquedas exactas.
 from __future__ import annotations
 
 import base64
+import bisect
 import os
 import hmac
 import hashlib
-from typing import Optional
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import re
+import struct
+import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, AESGCMSIV, ChaCha20Poly1305
 
 _MASTER_KEY_ENV = "APP_MASTER_KEY"  # Versión legacy (v1)
 _MIN_KEY_LEN = 32
 
+# Formato binario para campos numéricos (montos/balances): el texto plano cifrado
+# es ``<formato:1 byte><centavos: int64 big-endian con signo>``. Los blobs legacy
+# cifran un string decimal (ASCII: dígitos, '-', '.'), que nunca empieza con 0x01,
+# así que ambos formatos se distinguen sin ambigüedad tras descifrar.
+NUMERIC_FMT_CENTS = 0x01
+_CENTS_PAYLOAD = struct.Struct('>Bq')
+NUMERIC_BLOB_SIZE = 12 + _CENTS_PAYLOAD.size + 16  # nonce | payload | tag
+
+# Descifrado masivo en paralelo: los AEAD de cryptography liberan el GIL, así que lotes grandes se
+# reparten entre hilos. Sólo aplica cuando el llamador lo pide (parallel=True)
+# y el lote supera el umbral.
+_PARALLEL_THRESHOLD = int(os.environ.get('APP_DECRYPT_PARALLEL_THRESHOLD', '2000'))
+_PARALLEL_WORKERS = int(os.environ.get('APP_DECRYPT_WORKERS', str(min(8, os.cpu_count() or 1))))
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
 
 def _load_master_key(version: int = 1) -> bytes:
     """Cargar llave maestra para una versión.
@@ -50,42 +74,345 @@ def _load_master_key(version: int = 1) -> bytes:
     return raw
 
 
+# Suites AEAD por versión de cifrado (APP_ENC_SUITE_<n>, default aesgcm). Todas
+# usan llave de 32 bytes, nonce de 12 y tag de 16, así que el layout del blob
+# (nonce|ciphertext|tag) no cambia. La suite de una versión NO debe cambiar una
+# vez que existan filas con ella: para migrar de suite, definir una versión nueva
+# y rotar (ver scripts/rotate_transaction_keys.py). Medir con
+# ``python -m app.utils.crypto_bench``.
+CIPHER_SUITES: Dict[str, Any] = {
+    'aesgcm': AESGCM,
+    'chacha20poly1305': ChaCha20Poly1305,
+    'aesgcmsiv': AESGCMSIV,
+}
+DEFAULT_CIPHER_SUITE = 'aesgcm'
+
+
+def normalize_suite_name(name: str) -> str:
+    """'AES-256-GCM' -> 'aesgcm', 'ChaCha20-Poly1305' -> 'chacha20poly1305', ..."""
+    norm = re.sub(r'[^a-z0-9]', '', name.lower()).replace('aes256', 'aes')
+    if norm not in CIPHER_SUITES:
+        raise RuntimeError(f"Suite de cifrado desconocida: {name} (opciones: {', '.join(CIPHER_SUITES)})")
+    return norm
+
+
+def cipher_suite_for_version(version: int = 1) -> str:
+    """Suite configurada para una versión (env APP_ENC_SUITE_<version>)."""
+    return normalize_suite_name(os.environ.get(f'APP_ENC_SUITE_{version}', DEFAULT_CIPHER_SUITE))
+
+
+def suite_supported(name: str) -> bool:
+    """False si la build de OpenSSL no implementa la suite (p.ej. AES-GCM-SIV)."""
+    try:
+        CIPHER_SUITES[normalize_suite_name(name)](b'\x00' * 32)
+        return True
+    except UnsupportedAlgorithm:
+        return False
+
+
+class KeyRing:
+    """Caché de proceso para llaves maestras, subllaves derivadas y cifradores.
+
+    Cada versión de llave maestra se lee del entorno una sola vez; las subllaves
+    se derivan una vez por (purpose, field, version) y los objetos AEAD (según la
+    suite de la versión) se reutilizan por (field, version). Tras una rotación (nuevas variables de
+    entorno) llamar a ``reload()`` para descartar lo cacheado.
+
+    Los contadores ``hits``/``misses`` permiten verificar la eficacia de la caché
+    en reportes y scripts masivos (ver ``stats()``).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._master: Dict[int, bytes] = {}
+        self._subkeys: Dict[Tuple[str, str, int], bytes] = {}
+        self._ciphers: Dict[Tuple[str, int], Any] = {}
+        self._suites: Dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def master_key(self, version: int = 1) -> bytes:
+        mk = self._master.get(version)
+        if mk is None:
+            with self._lock:
+                mk = self._master.get(version)
+                if mk is None:
+                    mk = _load_master_key(version)
+                    self._master[version] = mk
+        return mk
+
+    def subkey(self, purpose: str, field: str, version: int = 1) -> bytes:
+        cache_key = (purpose, field, version)
+        key = self._subkeys.get(cache_key)
+        if key is not None:
+            self.hits += 1
+            return key
+        with self._lock:
+            key = self._subkeys.get(cache_key)
+            if key is None:
+                self.misses += 1
+                msg = f"{purpose}:{field}:v{version}".encode()
+                key = hmac.new(self.master_key(version), msg, hashlib.sha256).digest()
+                self._subkeys[cache_key] = key
+            else:
+                self.hits += 1
+        return key
+
+    def suite(self, version: int = 1) -> str:
+        name = self._suites.get(version)
+        if name is None:
+            with self._lock:
+                name = self._suites.get(version)
+                if name is None:
+                    name = cipher_suite_for_version(version)
+                    self._suites[version] = name
+        return name
+
+    def cipher(self, field: str, version: int = 1):
+        """AEAD (suite de la versión) listo para usar con la subllave 'enc' del campo/versión."""
+        cache_key = (field, version)
+        aead = self._ciphers.get(cache_key)
+        if aead is not None:
+            self.hits += 1
+            return aead
+        key = self.subkey("enc", field, version)
+        with self._lock:
+            aead = self._ciphers.get(cache_key)
+            if aead is None:
+                aead = CIPHER_SUITES[self.suite(version)](key)
+                self._ciphers[cache_key] = aead
+        return aead
+
+    def reload(self, version: Optional[int] = None) -> None:
+        """Descartar material cacheado (todas las versiones o sólo una).
+
+        Usar tras cambiar APP_MASTER_KEY_<n> en el entorno (rotación).
+        """
+        with self._lock:
+            if version is None:
+                self._master.clear()
+                self._subkeys.clear()
+                self._ciphers.clear()
+                self._suites.clear()
+                return
+            self._master.pop(version, None)
+            self._suites.pop(version, None)
+            for k in [k for k in self._subkeys if k[2] == version]:
+                del self._subkeys[k]
+            for k in [k for k in self._ciphers if k[1] == version]:
+                del self._ciphers[k]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'versions': len(self._master),
+            'subkeys': len(self._subkeys),
+            'ciphers': len(self._ciphers),
+            'suites': dict(self._suites),
+        }
+
+
+_KEYRING = KeyRing()
+
+
+def get_keyring() -> KeyRing:
+    """KeyRing compartido por el proceso."""
+    return _KEYRING
+
+
+def reload_keys(version: Optional[int] = None) -> None:
+    """Atajo para ``get_keyring().reload(version)`` (rotación de llaves)."""
+    _KEYRING.reload(version)
+
+
 def _derive_subkey(purpose: str, field: str, version: int = 1) -> bytes:
-    mk = _load_master_key(version)
-    msg = f"{purpose}:{field}:v{version}".encode()
-    return hmac.new(mk, msg, hashlib.sha256).digest()
+    return _KEYRING.subkey(purpose, field, version)
 
 
 def encrypt_field(value: Optional[str], field: str, version: int = 1) -> Optional[bytes]:
     """Cifrar un valor de texto. Devuelve bytes: nonce|ciphertext|tag.
 
-    Se usa AES-256-GCM con subllave derivada. Si value es None/"" -> None.
+    Se usa la suite AEAD de la versión (AES-256-GCM por defecto) con subllave
+    derivada. Si value es None/"" -> None.
     """
     if value is None:
         return None
     value = value.strip()
     if value == "":
         return None
-    key = _derive_subkey("enc", field, version)
-    aes = AESGCM(key)
+    aead = _KEYRING.cipher(field, version)
     nonce = os.urandom(12)
-    ct = aes.encrypt(nonce, value.encode(), None)  # incluye tag al final
+    ct = aead.encrypt(nonce, value.encode(), None)  # incluye tag al final
     return nonce + ct
 
 
 def decrypt_field(blob: Optional[bytes], field: str, version: int = 1) -> Optional[str]:
     if not blob:
         return None
-    key = _derive_subkey("enc", field, version)
-    aes = AESGCM(key)
+    aead = _KEYRING.cipher(field, version)
     nonce, ct = blob[:12], blob[12:]
     try:
-        pt = aes.decrypt(nonce, ct, None)
+        pt = aead.decrypt(nonce, ct, None)
         return pt.decode()
     except Exception:  # pragma: no cover - corrupción / llave distinta
         return None
 
 
+def to_cents(value) -> int:
+    """Convertir un monto (float/int/str/Decimal) a centavos enteros (redondeo HALF_UP)."""
+    dec = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return int(dec.scaleb(2))
+
+
+def _plain_to_cents(pt: bytes) -> int:
+    if len(pt) == _CENTS_PAYLOAD.size and pt[0] == NUMERIC_FMT_CENTS:
+        return _CENTS_PAYLOAD.unpack(pt)[1]
+    # Legacy: string decimal
+    return to_cents(pt.decode())
+
+
+def encrypt_cents(cents: int, field: str, version: int = 1) -> bytes:
+    """Cifrar un entero de centavos en formato binario de tamaño fijo."""
+    aead = _KEYRING.cipher(field, version)
+    nonce = os.urandom(12)
+    return nonce + aead.encrypt(nonce, _CENTS_PAYLOAD.pack(NUMERIC_FMT_CENTS, int(cents)), None)
+
+
+def encrypt_amount(value, field: str, version: int = 1) -> bytes:
+    """Cifrar un monto numérico (se normaliza a centavos)."""
+    return encrypt_cents(to_cents(value), field, version)
+
+
+def decrypt_cents(blob: Optional[bytes], field: str, version: int = 1) -> Optional[int]:
+    """Descifrar un campo numérico a centavos. Entiende formato binario y legacy string."""
+    if not blob:
+        return None
+    aead = _KEYRING.cipher(field, version)
+    try:
+        return _plain_to_cents(aead.decrypt(blob[:12], blob[12:], None))
+    except Exception:  # pragma: no cover - corrupción / llave distinta
+        return None
+
+
+def is_legacy_numeric_blob(blob: Optional[bytes], field: str, version: int = 1) -> bool:
+    """True si el blob numérico todavía usa el formato string (candidato a conversión)."""
+    if not blob:
+        return False
+    if len(blob) != NUMERIC_BLOB_SIZE:
+        return True
+    aead = _KEYRING.cipher(field, version)
+    try:
+        pt = aead.decrypt(blob[:12], blob[12:], None)
+    except Exception:  # pragma: no cover
+        return False
+    return pt[0] != NUMERIC_FMT_CENTS
+
+
+def _decode_plain(pt: bytes, kind: str):
+    if kind == 'text':
+        return pt.decode()
+    cents = _plain_to_cents(pt)
+    if kind == 'cents':
+        return cents
+    return cents / 100 if kind == 'float' else Decimal(cents).scaleb(-2)
+
+
+def decrypt_many(
+    blobs: Sequence[Optional[bytes]],
+    field: str,
+    versions: Union[int, Sequence[Optional[int]]] = 1,
+    kind: str = 'text',
+    parallel: bool = False,
+) -> List[Any]:
+    """Descifrar una columna completa en una sola llamada.
+
+    ``versions`` puede ser un entero (misma versión para todas las filas) o una
+    secuencia paralela a ``blobs`` (columna enc_version). Las filas se agrupan por
+    versión para obtener el cifrador una sola vez por grupo.
+
+    ``kind``: 'text' -> str, 'cents' -> int, 'decimal' -> Decimal, 'float' -> float.
+    Para campos numéricos un blob vacío o ilegible devuelve 0 (misma semántica que
+    las propiedades ``amount``/``balance`` de los modelos); para texto devuelve None.
+    Los numéricos aceptan tanto el formato binario de centavos como el legacy.
+
+    ``parallel=True`` reparte lotes grandes (>= APP_DECRYPT_PARALLEL_THRESHOLD,
+    default 2000 filas) entre APP_DECRYPT_WORKERS hilos. Pensado para rutas
+    masivas (reportes anuales, exportación, mantenimiento, rotación).
+    """
+    if kind not in ('text', 'cents', 'decimal', 'float'):
+        raise ValueError(f"kind inválido: {kind}")
+    n = len(blobs)
+    empty = {'text': None, 'cents': 0, 'float': 0.0, 'decimal': Decimal('0')}[kind]
+    out: List[Any] = [empty] * n
+    if isinstance(versions, int):
+        groups: Dict[int, List[int]] = {versions: list(range(n))}
+    else:
+        groups = {}
+        for i, ver in enumerate(versions):
+            # Filas legacy sin enc_version se cifraron con la versión 1
+            groups.setdefault(ver or 1, []).append(i)
+    use_pool = parallel and n >= _PARALLEL_THRESHOLD and _PARALLEL_WORKERS > 1
+    tasks = []
+    for ver, idxs in groups.items():
+        aead = _KEYRING.cipher(field, ver)
+        if not use_pool:
+            _decrypt_into(out, blobs, idxs, aead, kind)
+            continue
+        chunk = max(len(idxs) // _PARALLEL_WORKERS + 1, 256)
+        for start in range(0, len(idxs), chunk):
+            tasks.append((idxs[start:start + chunk], aead))
+    if tasks:
+        pool = _get_pool()
+        futures = [pool.submit(_decrypt_into, out, blobs, part, aead, kind) for part, aead in tasks]
+        for fut in futures:
+            fut.result()
+    return out
+
+
+def _decrypt_into(out, blobs, idxs, aead, kind) -> None:
+    # Cada tarea escribe índices disjuntos de ``out``
+    for i in idxs:
+        blob = blobs[i]
+        if not blob:
+            continue
+        try:
+            out[i] = _decode_plain(aead.decrypt(blob[:12], blob[12:], None), kind)
+        except Exception:  # pragma: no cover - corrupción / llave distinta
+            pass
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=_PARALLEL_WORKERS, thread_name_prefix='decrypt')
+    return _pool
+
+
+def decrypt_column(
+    rows: Sequence[Sequence[Any]],
+    blob_index: int,
+    field: str,
+    version_index: Optional[int] = None,
+    version: int = 1,
+    kind: str = 'text',
+    parallel: bool = False,
+) -> List[Any]:
+    """Variante de ``decrypt_many`` para tuplas de resultados de consulta.
+
+    Ejemplo::
+
+        rows = db.session.query(Transaction.amount_enc, Transaction.enc_version,
+                                Transaction.transaction_type).all()
+        amounts = decrypt_column(rows, 0, 'amount', version_index=1, kind='float')
+    """
+    blobs = [r[blob_index] for r in rows]
+    versions = [r[version_index] for r in rows] if version_index is not None else version
+    return decrypt_many(blobs, field, versions, kind, parallel)
+
+
 def blind_index(value: Optional[str], field: str, version: int = 1) -> Optional[str]:
     """Blind index (HMAC-SHA256) para búsquedas exactas por igualdad.
 
@@ -107,6 +434,141 @@ def dual_encrypt(value: Optional[str], field: str, version: int = 1):
     return enc, bidx
 
 
+# ---- Tokens de búsqueda por substring ----
+# Cada palabra del texto normalizado (minúsculas, sin acentos) genera un token de
+# palabra completa ("w:uber") y sus trigramas ("g:ube", "g:ber"). Se guardan como
+# HMAC con una subllave propia ("tok"), compartida por description/notes para que
+# una búsqueda pueda combinar coincidencias de ambos campos.
+SEARCH_NGRAM = 3
+MAX_SEARCH_TOKENS = 256
+_SEARCH_TOKEN_FIELD = 'search'
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_words(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    norm = unicodedata.normalize('NFKD', value.lower())
+    norm = ''.join(ch for ch in norm if not unicodedata.combining(ch))
+    return _WORD_RE.findall(norm)
+
+
+def _word_terms(word: str) -> List[str]:
+    terms = [f'w:{word}']
+    if len(word) >= SEARCH_NGRAM:
+        terms.extend(f'g:{word[i:i + SEARCH_NGRAM]}' for i in range(len(word) - SEARCH_NGRAM + 1))
+    return terms
+
+
+def search_terms(value: Optional[str]) -> List[str]:
+    """Términos (en claro) a indexar para un texto; sin duplicados, máximo MAX_SEARCH_TOKENS."""
+    seen: Dict[str, None] = {}
+    for word in search_words(value):
+        for term in _word_terms(word):
+            seen.setdefault(term, None)
+    return list(seen)[:MAX_SEARCH_TOKENS]
+
+
+def query_terms(text: Optional[str]) -> List[str]:
+    """Términos que deben aparecer TODOS para que un texto contenga ``text``.
+
+    Palabras de 3+ letras se buscan por trigramas (coinciden como substring);
+    las más cortas como palabra completa.
+    """
+    seen: Dict[str, None] = {}
+    for word in search_words(text):
+        if len(word) >= SEARCH_NGRAM:
+            terms = _word_terms(word)[1:]
+        else:
+            terms = [f'w:{word}']
+        for term in terms:
+            seen.setdefault(term, None)
+    return list(seen)
+
+
+def search_token(term: str, version: int = 1) -> str:
+    key = _derive_subkey("tok", _SEARCH_TOKEN_FIELD, version)
+    return hmac.new(key, term.encode(), hashlib.sha256).hexdigest()
+
+
+def search_tokens(value: Optional[str], version: int = 1) -> List[str]:
+    """Tokens HMAC (hex) a almacenar en transaction_search_tokens para ``value``."""
+    return [search_token(t, version) for t in search_terms(value)]
+
+
+def known_enc_versions() -> List[int]:
+    """Versiones con llave maestra configurada (v1 siempre existe)."""
+    versions = {1, get_active_enc_version()}
+    prefix = f"{_MASTER_KEY_ENV}_"
+    for name in os.environ:
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            versions.add(int(name[len(prefix):]))
+    return sorted(versions)
+
+
+# ---- Blind index por rango de monto (buckets log-escala) ----
+# Cada monto cae en un bucket logarítmico (4 por década: $1, $1.78, $3.16, $5.62,
+# $10, ...). Se guarda HMAC(bucket) en ``amount_bucket_bidx`` para que un filtro
+# por rango descarte en SQL los buckets fuera del rango y sólo descifre los de
+# borde. Revela únicamente el orden de magnitud aproximado (igualdad de bucket).
+AMOUNT_BUCKETS_PER_DECADE = 4
+_AMOUNT_BUCKET_BOUNDS = [int(round(10 ** (k / AMOUNT_BUCKETS_PER_DECADE) * 100))
+                         for k in range(AMOUNT_BUCKETS_PER_DECADE * 12)]  # centavos, hasta $10^12
+_NEGATIVE_BUCKET = 'neg'
+_SMALL_BUCKET = 'lt1'
+
+
+def amount_bucket(cents: int) -> str:
+    """Identificador (en claro) del bucket de un monto en centavos."""
+    if cents < 0:
+        return _NEGATIVE_BUCKET
+    idx = bisect.bisect_right(_AMOUNT_BUCKET_BOUNDS, cents) - 1
+    return _SMALL_BUCKET if idx < 0 else f'b{idx}'
+
+
+def amount_bucket_index(cents: Optional[int], version: int = 1) -> Optional[str]:
+    """HMAC hex del bucket de ``cents`` (None si no hay monto)."""
+    if cents is None:
+        return None
+    key = _derive_subkey("bucket", "amount", version)
+    return hmac.new(key, amount_bucket(cents).encode(), hashlib.sha256).hexdigest()
+
+
+def amount_bucket_range(min_cents: Optional[int], max_cents: Optional[int]) -> Tuple[List[str], List[str]]:
+    """Buckets que intersectan [min_cents, max_cents] (inclusive).
+
+    Devuelve (interiores, borde): los interiores caen completos dentro del rango
+    (no requieren descifrar); los de borde lo cubren parcialmente.
+    """
+    lo = -1 if min_cents is None else min_cents
+    hi = max_cents
+    interior: List[str] = []
+    boundary: List[str] = []
+    if lo < 0:
+        boundary.append(_NEGATIVE_BUCKET)
+    spans = [(_SMALL_BUCKET, 0, _AMOUNT_BUCKET_BOUNDS[0] - 1)]
+    for k, start in enumerate(_AMOUNT_BUCKET_BOUNDS):
+        end = _AMOUNT_BUCKET_BOUNDS[k + 1] - 1 if k + 1 < len(_AMOUNT_BUCKET_BOUNDS) else None
+        spans.append((f'b{k}', start, end))
+    for name, start, end in spans:
+        if end is not None and end < lo:
+            continue
+        if hi is not None and start > hi:
+            break
+        inside = start >= lo and (hi is None or (end is not None and end <= hi))
+        (interior if inside else boundary).append(name)
+    return interior, boundary
+
+
+def amount_bucket_hashes(buckets: Sequence[str], versions: Optional[Sequence[int]] = None) -> List[str]:
+    """HMACs de ``buckets`` para todas las versiones de llave indicadas (o conocidas)."""
+    out = []
+    for version in versions or known_enc_versions():
+        key = _derive_subkey("bucket", "amount", version)
+        out.extend(hmac.new(key, b.encode(), hashlib.sha256).hexdigest() for b in buckets)
+    return out
+
+
 def get_active_enc_version() -> int:
     """Versión de cifrado activa para nuevas filas (env APP_ENC_ACTIVE_VERSION)."""
     try:
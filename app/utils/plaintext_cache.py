@@ -0,0 +1,76 @@
+"""Caché por instancia del texto plano de columnas cifradas.
+
+Las propiedades cifradas de los modelos (``Transaction.amount``,
+``Account.balance``, ...) descifran en cada lectura. Plantillas y servicios
+leen la misma propiedad varias veces por fila, así que cada instancia guarda el
+último valor descifrado junto al blob de origen. La entrada sólo es válida
+mientras el atributo ``*_enc`` siga apuntando al *mismo* objeto bytes
+(identidad), por lo que cualquier reasignación del ciphertext la invalida.
+
+Además se limpia explícitamente en los setters y en los eventos
+``refresh``/``expire`` de SQLAlchemy.
+
+Desactivar (por ejemplo en tests): ``APP_PLAINTEXT_CACHE=0`` o
+``set_plaintext_cache_enabled(False)``.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Optional
+
+from sqlalchemy import event
+
+_enabled = os.environ.get('APP_PLAINTEXT_CACHE', '1') != '0'
+
+
+def plaintext_cache_enabled() -> bool:
+    return _enabled
+
+
+def set_plaintext_cache_enabled(enabled: bool) -> None:
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class PlaintextCacheMixin:
+    """Mixin para modelos con propiedades cifradas."""
+
+    def _cached_plain(self, attr: str, decode: Callable[[Optional[bytes]], Any]) -> Any:
+        """Devolver ``decode(getattr(self, attr))`` memoizado por identidad del blob."""
+        blob = getattr(self, attr)
+        if not _enabled:
+            return decode(blob)
+        cache = self.__dict__.get('_plain_cache')
+        if cache is None:
+            cache = {}
+            self.__dict__['_plain_cache'] = cache
+        hit = cache.get(attr)
+        if hit is not None and hit[0] is blob:
+            return hit[1]
+        value = decode(blob)
+        cache[attr] = (blob, value)
+        return value
+
+    def _reset_plain(self, attr: Optional[str] = None) -> None:
+        cache = self.__dict__.get('_plain_cache')
+        if not cache:
+            return
+        if attr is None:
+            cache.clear()
+        else:
+            cache.pop(attr, None)
+
+
+def _on_refresh(target, context, attrs):
+    if target is not None:
+        target._reset_plain()
+
+
+def _on_expire(target, attrs):
+    # expire_all() puede alcanzar estados cuyo objeto ya fue recolectado
+    if target is not None:
+        target._reset_plain()
+
+
+event.listen(PlaintextCacheMixin, 'refresh', _on_refresh, propagate=True)
+event.listen(PlaintextCacheMixin, 'expire', _on_expire, propagate=True)
@@ -63,10 +63,48 @@ class Config:
 
     # Reports
     REPORT_FREQUENCY_DAYS = int(os.environ.get('REPORT_FREQUENCY_DAYS', '90'))  # quarterly
+    # Memoización por request de ReportService (ver app/services/report_memo.py)
+    REPORT_MEMO_ENABLED = os.environ.get('REPORT_MEMO_ENABLED', '1') == '1'
+    # Leer totales de monthly_rollups (ejecutar antes scripts/rebuild_monthly_rollups.py)
+    REPORT_ROLLUPS_ENABLED = os.environ.get('REPORT_ROLLUPS_ENABLED', '0') == '1'
+    # Backend de cálculo de reportes: 'python' o 'numpy' (ver app/services/report_vectorized.py)
+    REPORT_BACKEND = os.environ.get('REPORT_BACKEND', 'python')
+    # Caché de gráficas por contenido (ver app/utils/chart_cache.py): LRU en memoria y, opcional,
+    # disco compartido. Los PNG muestran montos descifrados en claro: el disco sólo se activa
+    # definiendo CHART_CACHE_DIR (p.ej. un volumen privado y cifrado)
+    CHART_CACHE_ENABLED = os.environ.get('CHART_CACHE_ENABLED', '1') == '1'
+    CHART_CACHE_MEMORY_ITEMS = int(os.environ.get('CHART_CACHE_MEMORY_ITEMS', '128'))
+    CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR') or None
+    CHART_CACHE_MAX_MB = int(os.environ.get('CHART_CACHE_MAX_MB', '64'))
+    # Pool de procesos para dibujar gráficas (ver app/services/chart_pool.py); 0 = en el propio worker
+    CHART_RENDER_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', '2'))
+    CHART_RENDER_MAX_PENDING = int(os.environ.get('CHART_RENDER_MAX_PENDING', '16'))
+    CHART_RENDER_TIMEOUT = float(os.environ.get('CHART_RENDER_TIMEOUT', '10'))  # segundos por página
+    # Gráficas del reporte mensual: 'server' (PNG base64) o 'client' (JSON de /api/reports + Chart.js)
+    REPORT_CHART_MODE = os.environ.get('REPORT_CHART_MODE', 'server')
 
     # Reminders
     REMINDER_ADVANCE_DAYS = int(os.environ.get('REMINDER_ADVANCE_DAYS', '3'))  # days before due
 
+    # Rotación de llaves online (job del scheduler, ver app/services/online_key_rotation.py)
+    KEY_ROTATION_ENABLED = os.environ.get('KEY_ROTATION_ENABLED', '0') == '1'
+    KEY_ROTATION_FROM_VERSION = int(os.environ.get('KEY_ROTATION_FROM_VERSION', '1'))
+    KEY_ROTATION_TO_VERSION = int(os.environ.get('KEY_ROTATION_TO_VERSION', os.environ.get('APP_ENC_ACTIVE_VERSION', '1')))
+    KEY_ROTATION_INTERVAL_SECONDS = int(os.environ.get('KEY_ROTATION_INTERVAL_SECONDS', '60'))
+    KEY_ROTATION_TICK_SECONDS = float(os.environ.get('KEY_ROTATION_TICK_SECONDS', '20'))  # tiempo máx. por ejecución
+    KEY_ROTATION_ROWS_PER_SEC = float(os.environ.get('KEY_ROTATION_ROWS_PER_SEC', '200'))
+    KEY_ROTATION_BATCH_SIZE = int(os.environ.get('KEY_ROTATION_BATCH_SIZE', '200'))  # tope de filas por lote
+    KEY_ROTATION_MAX_BATCH_MS = float(os.environ.get('KEY_ROTATION_MAX_BATCH_MS', '250'))
+    KEY_ROTATION_MAX_REQUEST_MS = float(os.environ.get('KEY_ROTATION_MAX_REQUEST_MS', '500'))  # pausa si EWMA de requests lo supera
+    KEY_ROTATION_MAX_DB_MS = float(os.environ.get('KEY_ROTATION_MAX_DB_MS', '100'))  # pausa si el ping a la DB lo supera
+
+    # Auditoría de balances (job del scheduler, ver app/services/reconcile.py)
+    RECONCILE_ENABLED = os.environ.get('RECONCILE_ENABLED', '0') == '1'
+    RECONCILE_HOUR = int(os.environ.get('RECONCILE_HOUR', '4'))
+    RECONCILE_REPAIR = os.environ.get('RECONCILE_REPAIR', '0') == '1'  # sólo reporte por defecto
+    RECONCILE_WORKERS = int(os.environ.get('RECONCILE_WORKERS', '0'))  # 0 = en el proceso del scheduler
+    RECONCILE_SHARD_SIZE = int(os.environ.get('RECONCILE_SHARD_SIZE', '200'))
+
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=int(os.environ.get('SESSION_HOURS', '24')))
     SESSION_COOKIE_HTTPONLY = True
@@ -0,0 +1,35 @@
+"""Create balance_checkpoints (balance de cierre mensual cifrado por cuenta).
+
+Revision ID: 10_balance_checkpoints
+Revises: 9_amount_bucket_bidx
+Create Date: 2025-09-27
+
+La tabla se llena con el mantenimiento diario (``BalanceCheckpointService.refresh_account``);
+mientras tanto ``Account.get_monthly_balance`` cae al escaneo completo.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '10_balance_checkpoints'
+down_revision = '9_amount_bucket_bidx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'balance_checkpoints',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('account_id', sa.Integer(), sa.ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('period', sa.Date(), nullable=False),
+        sa.Column('balance_enc', sa.LargeBinary(), nullable=False),
+        sa.Column('enc_version', sa.SmallInteger(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('account_id', 'period', name='uq_balance_checkpoints_account_period'),
+    )
+    op.create_index('ix_balance_checkpoints_account_id', 'balance_checkpoints', ['account_id'])
+
+
+def downgrade():
+    op.drop_index('ix_balance_checkpoints_account_id', table_name='balance_checkpoints')
+    op.drop_table('balance_checkpoints')
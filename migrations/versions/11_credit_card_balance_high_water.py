@@ -0,0 +1,24 @@
+"""Add credit_cards.balance_applied_tx_id (marca de agua del saldo incremental).
+
+Revision ID: 11_credit_card_balance_high_water
+Revises: 10_balance_checkpoints
+Create Date: 2025-09-28
+
+Mayor id de transacción cuyo delta ya está aplicado en ``current_balance_enc``.
+Filas existentes quedan en 0; el mantenimiento diario la fija al verificar/reparar.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '11_credit_card_balance_high_water'
+down_revision = '10_balance_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('credit_cards', sa.Column('balance_applied_tx_id', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('credit_cards', 'balance_applied_tx_id')
@@ -0,0 +1,29 @@
+"""Add transactions.running_balance_enc (saldo acumulado cifrado por transacción).
+
+Revision ID: 12_transaction_running_balance
+Revises: 11_credit_card_balance_high_water
+Create Date: 2025-09-30
+
+Índices (ámbito, date, id) para el orden del estado de cuenta. Filas existentes
+quedan en NULL: la primera escritura en cada cuenta/tarjeta reescribe su ámbito
+completo, o ejecutar ``python -m scripts.backfill_running_balances``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '12_transaction_running_balance'
+down_revision = '11_credit_card_balance_high_water'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('running_balance_enc', sa.LargeBinary(), nullable=True))
+    op.create_index('ix_transactions_account_date_id', 'transactions', ['account_id', 'date', 'id'])
+    op.create_index('ix_transactions_card_date_id', 'transactions', ['credit_card_id', 'date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_transactions_card_date_id', table_name='transactions')
+    op.drop_index('ix_transactions_account_date_id', table_name='transactions')
+    op.drop_column('transactions', 'running_balance_enc')
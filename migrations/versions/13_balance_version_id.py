@@ -0,0 +1,26 @@
+"""Add version_id to accounts and credit_cards (control optimista de concurrencia).
+
+Revision ID: 13_balance_version_id
+Revises: 12_transaction_running_balance
+Create Date: 2025-10-01
+
+Columna ``version_id_col`` del mapper: cada UPDATE exige la versión leída y la
+incrementa. Filas existentes parten en 1.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '13_balance_version_id'
+down_revision = '12_transaction_running_balance'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('accounts', sa.Column('version_id', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('credit_cards', sa.Column('version_id', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('credit_cards', 'version_id')
+    op.drop_column('accounts', 'version_id')
@@ -0,0 +1,42 @@
+"""Create monthly_rollups (totales mensuales cifrados para reportes).
+
+Revision ID: 14_monthly_rollups
+Revises: 13_balance_version_id
+Create Date: 2025-10-03
+
+La tabla se mantiene en cada flush de transacciones. Para el historial existente
+ejecutar ``python -m scripts.rebuild_monthly_rollups`` antes de activar
+``REPORT_ROLLUPS_ENABLED``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '14_monthly_rollups'
+down_revision = '13_balance_version_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'monthly_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('year', sa.SmallInteger(), nullable=False),
+        sa.Column('month', sa.SmallInteger(), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=False),
+        sa.Column('transaction_type', sa.String(length=20), nullable=False),
+        sa.Column('is_card_payment', sa.Boolean(), nullable=False),
+        sa.Column('total_enc', sa.LargeBinary(), nullable=False),
+        sa.Column('tx_count', sa.Integer(), nullable=False),
+        sa.Column('enc_version', sa.SmallInteger(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('user_id', 'year', 'month', 'category', 'transaction_type', 'is_card_payment',
+                            name='uq_monthly_rollups_key'),
+    )
+    op.create_index('ix_monthly_rollups_user_period', 'monthly_rollups', ['user_id', 'year', 'month'])
+
+
+def downgrade():
+    op.drop_index('ix_monthly_rollups_user_period', table_name='monthly_rollups')
+    op.drop_table('monthly_rollups')
@@ -0,0 +1,25 @@
+"""Add version_id to transactions (control optimista de concurrencia).
+
+Revision ID: 15_transaction_version_id
+Revises: 14_monthly_rollups
+Create Date: 2025-10-06
+
+La rotación de llaves incrementa ``version_id`` al re-cifrar una fila; un flush
+ORM de un objeto cargado con la versión de cifrado anterior falla en vez de
+escribir blobs de esa versión. Filas existentes parten en 1.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '15_transaction_version_id'
+down_revision = '14_monthly_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('version_id', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('transactions', 'version_id')
@@ -0,0 +1,35 @@
+"""Create key_rotation_state table for online (scheduled) key rotation.
+
+Revision ID: 7_key_rotation_state
+Revises: 6_drop_plain_numeric_columns
+Create Date: 2025-09-20
+
+Una fila por tabla cifrada con el cursor keyset (last_id) de la rotación en curso.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '7_key_rotation_state'
+down_revision = '6_drop_plain_numeric_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'key_rotation_state',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('table_name', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('from_version', sa.SmallInteger(), nullable=False),
+        sa.Column('to_version', sa.SmallInteger(), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('rows_done', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('pause_reason', sa.String(length=200)),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('finished_at', sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table('key_rotation_state')
@@ -0,0 +1,36 @@
+"""Create transaction_search_tokens for encrypted substring search.
+
+Revision ID: 8_transaction_search_tokens
+Revises: 7_key_rotation_state
+Create Date: 2025-09-22
+
+Tokens HMAC (palabras y trigramas) de description/notes. Poblar con:
+    python -m scripts.backfill_search_tokens
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '8_transaction_search_tokens'
+down_revision = '7_key_rotation_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'transaction_search_tokens',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('transaction_id', sa.Integer(), sa.ForeignKey('transactions.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('field', sa.String(length=20), nullable=False),
+        sa.Column('token_hash', sa.String(length=64), nullable=False),
+        sa.Column('enc_version', sa.SmallInteger(), nullable=False, server_default='1'),
+    )
+    op.create_index('ix_transaction_search_tokens_transaction_id', 'transaction_search_tokens', ['transaction_id'])
+    op.create_index('ix_search_tokens_user_token', 'transaction_search_tokens', ['user_id', 'token_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_search_tokens_user_token', table_name='transaction_search_tokens')
+    op.drop_index('ix_transaction_search_tokens_transaction_id', table_name='transaction_search_tokens')
+    op.drop_table('transaction_search_tokens')
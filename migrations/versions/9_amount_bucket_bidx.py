@@ -0,0 +1,26 @@
+"""Add transactions.amount_bucket_bidx (blind index de bucket de monto).
+
+Revision ID: 9_amount_bucket_bidx
+Revises: 8_transaction_search_tokens
+Create Date: 2025-09-24
+
+Filas existentes quedan en NULL y se tratan como "borde" (se descifran) hasta
+ejecutar ``make backfill-search-tokens`` (o una rotación de llaves).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '9_amount_bucket_bidx'
+down_revision = '8_transaction_search_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('amount_bucket_bidx', sa.String(length=64), nullable=True))
+    op.create_index('ix_transactions_amount_bucket_bidx', 'transactions', ['amount_bucket_bidx'])
+
+
+def downgrade():
+    op.drop_index('ix_transactions_amount_bucket_bidx', table_name='transactions')
+    op.drop_column('transactions', 'amount_bucket_bidx')
@@ -0,0 +1,62 @@
+"""Calcular (o recalcular) el saldo acumulado cifrado por transacción.
+
+Uso:
+  APP_MASTER_KEY=... FLASK_APP=run.py python -m scripts.backfill_running_balances
+
+Argumentos:
+  --user-id ID      Limitar a un usuario
+  --only-missing    Sólo ámbitos con alguna transacción sin running_balance_enc
+
+Reescribe ``transactions.running_balance_enc`` de cada cuenta y de cada tarjeta
+(transacciones sin cuenta) en orden (date, id), con un commit por ámbito.
+Idempotente: puede ejecutarse varias veces.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.services.running_balance import rebuild_running_balances
+
+
+def _scope_ids(column: str, table: str, user_id: Optional[int], only_missing: bool):
+    if only_missing:
+        extra = " AND account_id IS NULL" if column == 'credit_card_id' else ""
+        sql = (f"SELECT DISTINCT {column} FROM transactions WHERE {column} IS NOT NULL{extra} "
+               f"AND running_balance_enc IS NULL" + (" AND user_id = :user_id" if user_id else ""))
+    else:
+        sql = f"SELECT id FROM {table}" + (" WHERE user_id = :user_id" if user_id else "")
+    return sorted(r[0] for r in db.session.execute(text(sql), {"user_id": user_id}))
+
+
+def backfill(user_id: Optional[int] = None, only_missing: bool = False) -> Tuple[int, int, int]:
+    """Devuelve (cuentas, tarjetas, transacciones escritas)."""
+    account_ids = _scope_ids('account_id', 'accounts', user_id, only_missing)
+    card_ids = _scope_ids('credit_card_id', 'credit_cards', user_id, only_missing)
+    written = 0
+    for account_id in account_ids:
+        written += rebuild_running_balances(db.session, account_ids=[account_id])
+        db.session.commit()
+    for card_id in card_ids:
+        written += rebuild_running_balances(db.session, card_ids=[card_id])
+        db.session.commit()
+    return len(account_ids), len(card_ids), written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--only-missing", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        accounts, cards, written = backfill(args.user_id, args.only_missing)
+        print(f"[running-balance] cuentas={accounts} tarjetas={cards} transacciones={written}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,115 @@
+"""Generar (o regenerar) los índices de búsqueda cifrada de transacciones.
+
+- Tokens de substring (transaction_search_tokens) para description/notes.
+- Blind index de bucket de monto (transactions.amount_bucket_bidx).
+
+Uso:
+  APP_MASTER_KEY=... FLASK_APP=run.py python -m scripts.backfill_search_tokens \
+      --batch-size 1000
+
+Argumentos:
+  --batch-size N    Transacciones por lote (default 1000)
+  --user-id ID      Limitar a un usuario
+  --dry-run         No escribe cambios, sólo cuenta tokens
+  --only {tokens,buckets}  Ejecutar sólo uno de los dos pasos
+
+Recorre transactions paginando por id (keyset), descifra description/notes con
+la enc_version de cada fila y reemplaza sus filas en transaction_search_tokens;
+para los buckets descifra amount_enc y actualiza amount_bucket_bidx.
+Idempotente: puede ejecutarse varias veces.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Optional, Tuple
+from sqlalchemy import text
+from app import create_app, db
+from app.services.transaction_search import SEARCH_FIELDS, replace_search_tokens
+from app.utils.crypto_fields import amount_bucket_index, decrypt_column, search_tokens
+
+
+def backfill(batch_size: int = 1000, user_id: Optional[int] = None, dry_run: bool = False) -> Tuple[int, int]:
+    """Devuelve (transacciones procesadas, tokens escritos)."""
+    last_id = 0
+    processed = 0
+    written = 0
+    user_filter = "AND user_id = :user_id " if user_id else ""
+    select_sql = text(
+        f"SELECT id, enc_version, {', '.join(f + '_enc' for f in SEARCH_FIELDS)} FROM transactions "
+        f"WHERE id > :last_id {user_filter}ORDER BY id ASC LIMIT :batch"
+    )
+    while True:
+        rows = db.session.execute(select_sql, {"last_id": last_id, "batch": batch_size, "user_id": user_id}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        processed += len(rows)
+        items = []
+        for pos, field in enumerate(SEARCH_FIELDS, start=2):
+            plains = decrypt_column(rows, pos, field, version_index=1, parallel=True)
+            for row, plain in zip(rows, plains):
+                version = row[1] or 1
+                items.append((row[0], field, version, search_tokens(plain, version)))
+        if dry_run:
+            written += sum(len(hashes) for _, _, _, hashes in items)
+            continue
+        written += replace_search_tokens(items)
+        db.session.commit()
+    return processed, written
+
+
+def backfill_amount_buckets(batch_size: int = 1000, user_id: Optional[int] = None, dry_run: bool = False) -> int:
+    """Recalcular amount_bucket_bidx. Devuelve filas actualizadas.
+
+    El UPDATE exige que ``amount_enc`` siga siendo el blob leído: si el monto
+    cambió entre la lectura y la escritura no se guarda un bucket viejo (el
+    setter de ``Transaction.amount`` ya escribió el correcto).
+    """
+    last_id = 0
+    updated = 0
+    user_filter = "AND user_id = :user_id " if user_id else ""
+    select_sql = text(
+        "SELECT id, enc_version, amount_enc FROM transactions "
+        f"WHERE id > :last_id {user_filter}ORDER BY id ASC LIMIT :batch"
+    )
+    update_sql = text("UPDATE transactions SET amount_bucket_bidx = :bidx WHERE id = :id AND amount_enc = :old_blob")
+    while True:
+        rows = db.session.execute(select_sql, {"last_id": last_id, "batch": batch_size, "user_id": user_id}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        cents = decrypt_column(rows, 2, 'amount', version_index=1, kind='cents', parallel=True)
+        params = [
+            {"id": row[0], "bidx": amount_bucket_index(c, row[1] or 1), "old_blob": row[2]}
+            for row, c in zip(rows, cents) if row[2] is not None
+        ]
+        if params and not dry_run:
+            result = db.session.execute(update_sql, params)  # executemany
+            db.session.commit()
+            updated += result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(params)
+        else:
+            updated += len(params)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="No escribir cambios")
+    parser.add_argument("--only", choices=["tokens", "buckets"], default=None)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        suffix = ' (dry-run)' if args.dry_run else ''
+        if args.only in (None, "tokens"):
+            processed, written = backfill(args.batch_size, args.user_id, args.dry_run)
+            print(f"[search-tokens] transacciones={processed} tokens={written}{suffix}")
+        if args.only in (None, "buckets"):
+            updated = backfill_amount_buckets(args.batch_size, args.user_id, args.dry_run)
+            print(f"[amount-buckets] transacciones={updated}{suffix}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: filtro por rango de monto con buckets vs. descifrar todo el historial.
+
+Uso:
+  python -m scripts.bench_amount_range --rows 20000 --min 500
+  python -m scripts.bench_amount_range --rows 50000 --min 100 --max 250
+
+Crea un usuario sintético en una base SQLite temporal (salvo que se defina
+DATABASE_URL), inserta ``--rows`` transacciones con montos log-normales y compara:
+
+  full    : descifrar amount_enc de todas las filas del usuario y filtrar en Python
+  buckets : ``amount_range_criterion`` (SQL por bucket + descifrado sólo de bordes)
+
+Imprime filas descifradas (tamaño del conjunto candidato), tiempo y coincidencias.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import os
+import random
+import tempfile
+import time
+
+
+def _prepare_env():
+    # Base desechable y llaves efímeras: nunca usar contra datos reales sin DATABASE_URL explícita
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix='bench_amount_'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SECRET_KEY', base64.b64encode(os.urandom(24)).decode())
+    os.environ.setdefault('APP_MASTER_KEY', base64.b64encode(os.urandom(32)).decode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--min', dest='min_amount', type=float, default=500.0)
+    parser.add_argument('--max', dest='max_amount', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    _prepare_env()
+    from app import create_app, db
+    from app.models.user import User
+    from app.models.transaction import Transaction
+    from app.services.transaction_search import amount_range_criterion
+    from app.utils.crypto_fields import decrypt_column, to_cents
+
+    app = create_app()
+    rnd = random.Random(args.seed)
+    with app.app_context():
+        user = User(username=f'bench{rnd.randint(0, 10**9)}', email=f'bench{rnd.randint(0, 10**9)}@example.com',
+                    first_name='Bench', last_name='User', monthly_income=0, password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        for i in range(args.rows):
+            amount = round(min(rnd.lognormvariate(4.0, 1.3), 10**6), 2)
+            db.session.add(Transaction(user_id=user.id, amount=amount, category='other',
+                                       transaction_type='expense'))
+            if i % 5000 == 4999:
+                db.session.commit()
+        db.session.commit()
+
+        min_c = to_cents(args.min_amount) if args.min_amount is not None else None
+        max_c = to_cents(args.max_amount) if args.max_amount is not None else None
+
+        started = time.perf_counter()
+        rows = db.session.query(Transaction.id, Transaction.amount_enc, Transaction.enc_version) \
+            .filter(Transaction.user_id == user.id).all()
+        cents = decrypt_column(rows, 1, 'amount', version_index=2, kind='cents')
+        full_ids = {r[0] for r, c in zip(rows, cents)
+                    if (min_c is None or c >= min_c) and (max_c is None or c <= max_c)}
+        full_secs = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stats = {}
+        criterion = amount_range_criterion(user.id, args.min_amount, args.max_amount, stats=stats)
+        bucket_ids = {r[0] for r in db.session.query(Transaction.id)
+                      .filter(Transaction.user_id == user.id, criterion).all()}
+        bucket_secs = time.perf_counter() - started
+
+        assert bucket_ids == full_ids, 'resultados distintos entre estrategias'
+        print(f"rango=[{args.min_amount}, {args.max_amount}] filas={len(rows)} coincidencias={len(full_ids)}")
+        print(f"full    : descifradas={len(rows):>8} tiempo={full_secs * 1000:8.1f} ms")
+        print(f"buckets : descifradas={stats['decrypted']:>8} tiempo={bucket_secs * 1000:8.1f} ms "
+              f"(reducción candidatos {100 * (1 - stats['decrypted'] / max(len(rows), 1)):.1f}%)")
+
+
+if __name__ == '__main__':  # pragma: no cover (benchmark manual)
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark: backend de reportes de Python (acumulación por fila) vs. NumPy.
+
+Uso:
+  python -m scripts.bench_report_backends
+  python -m scripts.bench_report_backends --rows 1000 100000 1000000 --repeat 3
+
+Genera en memoria ``--rows`` transacciones sintéticas de un año (montos ya
+descifrados: el descifrado es común a ambos backends y no se mide) y compara:
+
+  python : ``ReportService._aggregate_rows`` (``_Totals`` fila por fila)
+  frame  : ``frame_from_columns`` (pasar las columnas de la consulta a arrays)
+  numpy  : ``aggregate_frame`` sobre el marco ya construido
+
+Verifica que ambos resultados sean idénticos e imprime el mejor tiempo de
+``--repeat`` ejecuciones.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+CATEGORIES = ('food', 'transport', 'salary', 'entertainment', 'utilities', 'health', 'other')
+TYPES = ('expense', 'expense', 'expense', 'income', 'transfer')
+
+
+def _prepare_env():
+    # El import de la app exige SECRET_KEY; no se toca ninguna base de datos ni se arranca el scheduler
+    os.environ.setdefault('DISABLE_SCHEDULER', '1')
+    os.environ.setdefault('SECRET_KEY', base64.b64encode(os.urandom(24)).decode())
+    os.environ.setdefault('APP_MASTER_KEY', base64.b64encode(os.urandom(32)).decode())
+
+
+def _synthetic(rows: int, year: int, rnd: random.Random):
+    start = datetime(year, 1, 1)
+    data = []
+    for _ in range(rows):
+        data.append((
+            start + timedelta(minutes=rnd.randrange(365 * 24 * 60)),
+            rnd.choice(TYPES),
+            rnd.choice(CATEGORIES),
+            rnd.randrange(1, 50) if rnd.random() < 0.8 else None,  # account_id
+            rnd.randrange(1, 5) if rnd.random() < 0.2 else None,  # credit_card_id
+            int(min(rnd.lognormvariate(7.5, 1.3), 10**8)),  # centavos
+        ))
+    return data
+
+
+def _best(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    _prepare_env()
+    from app.services.report_service import ReportService
+    from app.services.report_vectorized import aggregate_frame, frame_from_columns, month_index
+
+    year = 2024
+    start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    rnd = random.Random(args.seed)
+    print(f"{'filas':>9} {'python ms':>10} {'frame ms':>9} {'numpy ms':>9} {'speedup':>8} {'total':>7}")
+    for rows in args.rows:
+        data = _synthetic(rows, year, rnd)
+        loop_rows = [(d, t, card, cat) for d, t, cat, _, card, _ in data]
+        cents = [c for *_, c in data]
+        months = [month_index(r[0].year, r[0].month) for r in data]  # en load_frame lo calcula la base
+
+        def run_python():
+            return ReportService._aggregate_rows(loop_rows, cents, start, end)
+
+        def build_frame():
+            return frame_from_columns(cents, [r[1] for r in data], [r[2] for r in data], months,
+                                      [r[3] for r in data], [r[4] for r in data])
+
+        python_secs, expected = _best(run_python, args.repeat)
+        frame_secs, frame = _best(build_frame, args.repeat)
+        numpy_secs, result = _best(lambda: aggregate_frame(frame, start, end), args.repeat)
+        assert result == expected, 'resultados distintos entre backends'
+        print(f"{rows:>9} {python_secs * 1000:>10.1f} {frame_secs * 1000:>9.1f} {numpy_secs * 1000:>9.1f} "
+              f"{python_secs / numpy_secs:>7.1f}x {python_secs / (frame_secs + numpy_secs):>6.1f}x")
+
+
+if __name__ == '__main__':  # pragma: no cover (benchmark manual)
+    main()
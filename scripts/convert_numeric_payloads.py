@@ -0,0 +1,94 @@
+"""Convertir blobs numéricos legacy (string decimal cifrado) al formato binario de centavos.
+
+Uso:
+  APP_MASTER_KEY=... FLASK_APP=run.py python -m scripts.convert_numeric_payloads \
+      --batch-size 1000
+
+Argumentos:
+  --batch-size N    Filas leídas por lote (default 1000)
+  --dry-run         No escribe cambios, sólo cuenta filas legacy
+
+Columnas procesadas:
+  - transactions.amount_enc         (campo 'amount')
+  - accounts.balance_enc            (campo 'account_balance')
+  - credit_cards.current_balance_enc (campo 'cc_current_balance')
+
+Recorre cada tabla paginando por id (keyset), descifra, y re-cifra con
+``encrypt_cents`` sólo las filas que siguen en formato string. Conserva la
+enc_version de cada fila. Reentrante: puede ejecutarse varias veces o en
+segundo plano mientras la app sirve tráfico (las filas ya convertidas se omiten).
+El UPDATE exige que la columna siga con el blob leído, así que no pisa una
+escritura concurrente (la app ya escribe en formato binario); en ``accounts`` y
+``credit_cards`` además incrementa ``version_id`` para que un flush ORM con la
+versión anterior lo detecte.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Tuple
+from sqlalchemy import text
+from app import create_app, db
+from app.utils.crypto_fields import decrypt_cents, encrypt_cents, is_legacy_numeric_blob
+
+NUMERIC_COLUMNS = [
+    # (tabla, columna cifrada, nombre de campo para derivación)
+    ("transactions", "amount_enc", "amount"),
+    ("accounts", "balance_enc", "account_balance"),
+    ("credit_cards", "current_balance_enc", "cc_current_balance"),
+]
+# Tablas con control optimista de concurrencia (version_id_col del ORM)
+VERSIONED_TABLES = {"transactions", "accounts", "credit_cards"}
+
+
+def convert_table(table: str, column: str, field: str, batch_size: int, dry_run: bool) -> Tuple[int, int]:
+    """Convertir una columna. Devuelve (filas_revisadas, filas_convertidas)."""
+    last_id = 0
+    scanned = 0
+    converted = 0
+    select_sql = text(
+        f"SELECT id, {column}, enc_version FROM {table} "
+        f"WHERE id > :last_id AND {column} IS NOT NULL ORDER BY id ASC LIMIT :batch"
+    )
+    bump = ", version_id = version_id + 1" if table in VERSIONED_TABLES else ""
+    update_sql = text(f"UPDATE {table} SET {column} = :blob{bump} WHERE id = :id AND {column} = :old_blob")
+    while True:
+        rows = db.session.execute(select_sql, {"last_id": last_id, "batch": batch_size}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        scanned += len(rows)
+        params = []
+        for rid, blob, version in rows:
+            version = version or 1
+            if not is_legacy_numeric_blob(blob, field, version):
+                continue
+            cents = decrypt_cents(blob, field, version)
+            if cents is None:
+                continue
+            params.append({"id": rid, "blob": encrypt_cents(cents, field, version), "old_blob": blob})
+        if params and not dry_run:
+            result = db.session.execute(update_sql, params)  # executemany
+            db.session.commit()
+            # Las filas que cambiaron tras la lectura no se escriben (rowcount las excluye)
+            converted += result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(params)
+        else:
+            converted += len(params)
+    return scanned, converted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="No escribir cambios")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        for table, column, field in NUMERIC_COLUMNS:
+            scanned, converted = convert_table(table, column, field, args.batch_size, args.dry_run)
+            print(f"[convert-numeric] {table}.{column}: revisadas={scanned} legacy={converted}"
+                  f"{' (dry-run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,70 @@
+"""Reconstruir (o verificar) los rollups mensuales de reportes.
+
+Uso:
+  APP_MASTER_KEY=... FLASK_APP=run.py python -m scripts.rebuild_monthly_rollups
+
+Argumentos:
+  --user-id ID      Limitar a un usuario
+  --check           Sólo comparar contra el ledger (no escribe); sale con código 1 si hay diferencias
+
+Por cada usuario descifra sus transacciones en bloque, agrupa por
+(año, mes, categoría, tipo, tarjeta) y reemplaza sus filas de
+``monthly_rollups``, con un commit por usuario. Idempotente.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.services.monthly_rollup import check_rollups, rebuild_rollups
+
+
+def _user_ids(user_id: Optional[int]):
+    if user_id:
+        return [user_id]
+    return [r[0] for r in db.session.execute(text("SELECT id FROM users ORDER BY id"))]
+
+
+def rebuild(user_id: Optional[int] = None) -> Tuple[int, int]:
+    """Devuelve (usuarios, filas escritas)."""
+    users = _user_ids(user_id)
+    written = 0
+    for uid in users:
+        written += rebuild_rollups(db.session, uid)
+        db.session.commit()
+    return len(users), written
+
+
+def check(user_id: Optional[int] = None) -> int:
+    """Imprime las claves que difieren del ledger; devuelve cuántas son."""
+    mismatches = 0
+    for uid in _user_ids(user_id):
+        for diff in check_rollups(db.session, uid):
+            mismatches += 1
+            print(f"[rollups] usuario={uid} clave={diff['key'][1:]} guardado={diff['stored']} ledger={diff['ledger']}")
+    db.session.rollback()
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.check:
+            mismatches = check(args.user_id)
+            print(f"[rollups] diferencias={mismatches}")
+            sys.exit(1 if mismatches else 0)
+        users, written = rebuild(args.user_id)
+        print(f"[rollups] usuarios={users} filas={written}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,452 @@
+import base64
+import os
+
+from app import app, db
+from app.models.user import User
+from app.models.account import Account
+from app.models.credit_card import CreditCard
+from app.models.transaction import Transaction
+from werkzeug.security import generate_password_hash
+
+
+def _setup():
+    if 'APP_MASTER_KEY' not in os.environ:
+        os.environ['APP_MASTER_KEY'] = base64.b64encode(b'A' * 32).decode()
+    app.config['TESTING'] = True
+    db.drop_all()
+    db.create_all()
+    u = User(username='baluser', email='bal@example.com', first_name='B', last_name='User', monthly_income=0)
+    u.password_hash = generate_password_hash('pass')
+    db.session.add(u)
+    db.session.commit()
+    return u
+
+
+def _fresh(model, obj_id):
+    db.session.expire_all()
+    return db.session.get(model, obj_id)
+
+
+def test_account_balance_follows_deltas():
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        other = Account(user_id=u.id, name='Otra', account_type='savings', balance=0)
+        db.session.add_all([acc, other])
+        db.session.commit()
+
+        # Alta: cuenta nueva + transacción en el mismo flush
+        t1 = Transaction(user_id=u.id, account_id=acc.id, amount=100.10, category='other', transaction_type='income')
+        t2 = Transaction(user_id=u.id, account_id=acc.id, amount=30.05, category='other', transaction_type='expense')
+        db.session.add_all([t1, t2])
+        db.session.commit()
+        assert acc.balance == 70.05  # objeto en memoria sincronizado
+        assert _fresh(Account, acc.id).balance == 70.05
+
+        # Edición: monto, tipo y cuenta
+        t2 = db.session.get(Transaction, t2.id)
+        t2.amount = 10
+        db.session.commit()
+        assert _fresh(Account, acc.id).balance == 90.10
+        t2 = db.session.get(Transaction, t2.id)
+        t2.account_id = other.id
+        t2.transaction_type = 'income'
+        db.session.commit()
+        assert _fresh(Account, acc.id).balance == 100.10
+        assert _fresh(Account, other.id).balance == 10.0
+
+        # Borrado
+        db.session.get(Transaction, t1.id).delete_with_cascade_update()
+        db.session.commit()
+        acc = _fresh(Account, acc.id)
+        assert acc.balance == 0.0
+        # El recálculo completo (reparación) coincide con el incremental
+        assert acc.calculate_current_balance() == acc.balance
+        assert _fresh(Account, other.id).calculate_current_balance() == 10.0
+
+
+def test_card_balance_clamps_and_updates_minimum():
+    with app.app_context():
+        u = _setup()
+        card = CreditCard(user_id=u.id, name='Tarjeta', bank_name='Banco', credit_limit=5000,
+                          current_balance=0, closing_date=10, due_date=25)
+        db.session.add(card)
+        db.session.commit()
+
+        db.session.add(Transaction(user_id=u.id, credit_card_id=card.id, amount=2000,
+                                   category='other', transaction_type='expense'))
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 2000.0
+        assert card.minimum_payment == 100.0
+
+        db.session.add(Transaction(user_id=u.id, credit_card_id=card.id, amount=2500,
+                                   category='other', transaction_type='income'))
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 0.0
+        assert card.minimum_payment == 0.0
+
+        # El saldo a favor (-500) se conserva: un gasto de 100 sigue en 0 y coincide con el recálculo
+        db.session.add(Transaction(user_id=u.id, credit_card_id=card.id, amount=100,
+                                   category='other', transaction_type='expense'))
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 0.0
+        assert card.minimum_payment == 0.0
+        check = card.verify_balance()
+        assert check['stored'] == check['computed'] == -400.0
+        assert check['ok']
+
+
+def test_card_delta_api_tracks_high_water_and_verifies():
+    with app.app_context():
+        u = _setup()
+        card = CreditCard(user_id=u.id, name='Tarjeta', bank_name='Banco', credit_limit=5000,
+                          current_balance=0, closing_date=10, due_date=25)
+        db.session.add(card)
+        db.session.commit()
+        t1 = Transaction(user_id=u.id, credit_card_id=card.id, amount=300, category='other', transaction_type='expense')
+        t2 = Transaction(user_id=u.id, credit_card_id=card.id, amount=120, category='other', transaction_type='income')
+        db.session.add_all([t1, t2])
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 180.0
+        assert card.balance_applied_tx_id == max(t1.id, t2.id)
+        assert card.verify_balance()['ok']
+
+        # Editar un monto antiguo no mueve la marca de agua
+        db.session.get(Transaction, t1.id).amount = 500
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 380.0 and card.minimum_payment == 50.0
+        assert card.verify_balance()['ok']
+
+        # Deriva (escritura fuera del API) detectada y reparada
+        CreditCard.apply_balance_delta(db.session, card.id, 100000)
+        db.session.commit()
+        card = _fresh(CreditCard, card.id)
+        check = card.verify_balance()
+        assert not check['ok'] and check['stored'] == 1380.0 and check['computed'] == 380.0
+        card.update_balance()
+        db.session.commit()
+        assert _fresh(CreditCard, card.id).verify_balance()['ok']
+
+
+def test_rollback_discards_pending_deltas():
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.commit()
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=50, category='other',
+                                   transaction_type='income'))
+        db.session.flush()
+        db.session.rollback()
+        assert _fresh(Account, acc.id).balance == 0.0
+
+
+def test_monthly_checkpoints_and_backdated_patch():
+    from datetime import date, datetime
+    from app.models.balance_checkpoint import BalanceCheckpoint
+    from app.services.balance_checkpoint_service import BalanceCheckpointService
+
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.commit()
+        for when, amount, kind in [(datetime(2024, 1, 10), 100, 'income'), (datetime(2024, 2, 5), 30, 'expense'),
+                                   (datetime(2024, 4, 20), 50, 'income')]:
+            db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=amount, date=when,
+                                       category='other', transaction_type=kind))
+        db.session.commit()
+
+        assert BalanceCheckpointService.refresh_account(acc, until=date(2024, 4, 1)) == 3  # ene, feb, mar
+        db.session.commit()
+        assert BalanceCheckpointService.refresh_account(acc, until=date(2024, 4, 1)) == 0
+        assert [cp.balance for cp in BalanceCheckpoint.query.order_by(BalanceCheckpoint.period)] == [100.0, 70.0, 70.0]
+        # checkpoint + cola (abril aún sin checkpoint)
+        assert acc.get_monthly_balance(2024, 3) == 70.0
+        assert acc.get_monthly_balance(2024, 4) == 120.0
+
+        # Transacción retroactiva en febrero: parchea feb y mar, no enero
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=5, date=datetime(2024, 2, 28),
+                                   category='other', transaction_type='expense'))
+        db.session.commit()
+        assert [cp.balance for cp in BalanceCheckpoint.query.order_by(BalanceCheckpoint.period)] == [100.0, 65.0, 65.0]
+        assert acc.get_monthly_balance(2024, 4) == 115.0
+
+        # Mover una transacción de fecha también mueve su efecto
+        tx = Transaction.query.filter(Transaction.date == datetime(2024, 1, 10)).one()
+        tx.date = datetime(2024, 3, 2)
+        db.session.commit()
+        series = BalanceCheckpointService.month_end_series(acc, date(2024, 1, 1), date(2024, 4, 1))
+        assert series == [(date(2024, 1, 1), 0.0), (date(2024, 2, 1), -35.0),
+                          (date(2024, 3, 1), 65.0), (date(2024, 4, 1), 115.0)]
+
+
+def test_recompute_balances_batch_reports_and_repairs_drift():
+    from app.services.balance_service import recompute_balances
+
+    with app.app_context():
+        u = _setup()
+        accounts = [Account(user_id=u.id, name=f'Cuenta {i}', account_type='checking', balance=0) for i in range(5)]
+        debt = Account(user_id=u.id, name='Deuda', account_type='debt', balance=1000, is_debt_account=True,
+                       original_debt_amount=1000)
+        card = CreditCard(user_id=u.id, name='Tarjeta', bank_name='Banco', credit_limit=5000,
+                          current_balance=0, closing_date=10, due_date=25)
+        db.session.add_all(accounts + [debt, card])
+        db.session.commit()
+        for i, acc in enumerate(accounts):
+            db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=10 * (i + 1), category='other',
+                                       transaction_type='income'))
+        db.session.add(Transaction(user_id=u.id, account_id=debt.id, amount=200, category='other',
+                                   transaction_type='expense'))
+        db.session.add(Transaction(user_id=u.id, credit_card_id=card.id, amount=75, category='other',
+                                   transaction_type='expense'))
+        db.session.commit()
+
+        clean = recompute_balances(chunk_size=2)
+        assert clean['drift'] == [] and clean['written'] == 0
+        assert clean['accounts'] == 6 and clean['cards'] == 1 and clean['transactions'] == 7
+
+        # Provocar deriva fuera del ledger
+        accounts[2].balance = 999
+        debt.balance = 0
+        db.session.commit()
+        report = recompute_balances(write=False)
+        assert {(d['kind'], d['id']) for d in report['drift']} == {('account', accounts[2].id), ('account', debt.id)}
+        assert _fresh(Account, accounts[2].id).balance == 999.0
+
+        repaired = recompute_balances(account_ids=[accounts[2].id, debt.id], card_ids=[])
+        db.session.commit()
+        assert repaired['written'] == 2
+        assert _fresh(Account, accounts[2].id).balance == 30.0
+        assert _fresh(Account, debt.id).balance == 800.0
+
+
+def test_recompute_balances_redoes_rows_changed_before_update(monkeypatch):
+    from sqlalchemy import update
+    from app.services import balance_service
+
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.commit()
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=40, category='other',
+                                   transaction_type='income'))
+        db.session.commit()
+        acc.balance = 1  # deriva
+        db.session.commit()
+        version = acc.version_id
+
+        # Otra escritura toca la fila entre la lectura del lote y el UPDATE masivo
+        table = Account.__table__
+        real_ledger_rows = balance_service._ledger_rows
+        calls = []
+
+        def ledger_rows(session, column, ids):
+            calls.append(ids)
+            if len(calls) == 1:
+                session.execute(update(table).where(table.c.id == acc.id).values(version_id=table.c.version_id + 1))
+            return real_ledger_rows(session, column, ids)
+
+        monkeypatch.setattr(balance_service, '_ledger_rows', ledger_rows)
+        stats = balance_service.recompute_balances(account_ids=[acc.id], card_ids=[])
+        assert calls == [[acc.id], [acc.id]]
+        assert stats['written'] == 1 and len(stats['drift']) == 1
+        assert acc.version_id == version + 2  # objeto de la sesión con la versión real
+        acc.name = 'Renombrada'
+        db.session.commit()  # el flush ORM no choca con la versión
+        assert _fresh(Account, acc.id).balance == 40.0
+
+
+def test_reconcile_reports_and_repairs_by_user_shard():
+    from app.services.reconcile import run_reconcile
+
+    with app.app_context():
+        u = _setup()
+        other = User(username='baluser2', email='bal2@example.com', first_name='C', last_name='User', monthly_income=0)
+        other.password_hash = generate_password_hash('pass')
+        db.session.add(other)
+        db.session.commit()
+        accounts = [Account(user_id=owner.id, name='Cuenta', account_type='checking', balance=0)
+                    for owner in (u, other)]
+        db.session.add_all(accounts)
+        db.session.commit()
+        for acc in accounts:
+            db.session.add(Transaction(user_id=acc.user_id, account_id=acc.id, amount=40, category='other',
+                                       transaction_type='income'))
+        db.session.commit()
+        accounts[1].balance = 12.5
+        db.session.commit()
+
+        report = run_reconcile(shard_size=1)
+        assert report['users'] == 2 and report['accounts'] == 2
+        assert report['drift_count'] == 1 and report['max_delta_cents'] == 2750
+        assert report['affected'] == {'account': [accounts[1].id], 'card': []}
+        assert _fresh(Account, accounts[1].id).balance == 12.5  # sin --repair no escribe
+
+        assert run_reconcile(repair=True)['repaired'] == 1
+        assert _fresh(Account, accounts[1].id).balance == 40.0
+        assert run_reconcile()['drift_count'] == 0
+
+
+def test_running_balance_append_and_suffix_rewrite():
+    from datetime import datetime
+    from app.services.running_balance import running_balances
+
+    def statement(account_id):
+        txs = Transaction.query.options(*Transaction.profile('statement')).filter_by(account_id=account_id) \
+            .order_by(Transaction.date, Transaction.id).all()
+        balances = running_balances(txs)
+        return [balances[t.id] for t in txs]
+
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.commit()
+        for day, amount, kind in [(1, 100, 'income'), (5, 20, 'expense'), (9, 50, 'income')]:
+            db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=amount, date=datetime(2024, 3, day),
+                                       category='other', transaction_type=kind))
+            db.session.commit()
+        assert statement(acc.id) == [100.0, 80.0, 130.0]
+
+        # Alta retroactiva: reescribe desde su fecha
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=10, date=datetime(2024, 3, 3),
+                                   category='other', transaction_type='expense'))
+        db.session.commit()
+        assert statement(acc.id) == [100.0, 90.0, 70.0, 120.0]
+
+        # Edición y borrado
+        tx = Transaction.query.filter_by(account_id=acc.id).filter(Transaction.date == datetime(2024, 3, 5)).one()
+        tx.amount = 40
+        db.session.commit()
+        assert statement(acc.id) == [100.0, 90.0, 50.0, 100.0]
+        first = Transaction.query.filter_by(account_id=acc.id).filter(Transaction.date == datetime(2024, 3, 1)).one()
+        first.delete_with_cascade_update()
+        db.session.commit()
+        assert statement(acc.id) == [-10.0, -50.0, 0.0]
+        assert statement(acc.id)[-1] == _fresh(Account, acc.id).balance
+
+
+def test_versioned_balance_delta_retries_on_conflict():
+    import pytest
+    from sqlalchemy import update
+    from sqlalchemy.orm.exc import StaleDataError
+    from app.services.balance_service import versioned_update
+
+    with app.app_context():
+        u = _setup()
+        acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.commit()
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=25, category='other',
+                                   transaction_type='income'))
+        db.session.commit()
+        assert acc.version_id == 2  # alta (1) + un delta
+
+        # Delta en memoria + cambio ORM del mismo objeto: sin StaleDataError
+        acc.name = 'Renombrada'
+        db.session.add(Transaction(user_id=u.id, account_id=acc.id, amount=5, category='other',
+                                   transaction_type='expense'))
+        db.session.commit()
+        acc = _fresh(Account, acc.id)
+        assert acc.name == 'Renombrada' and acc.balance == 20.0
+
+        # Otra escritura gana entre la lectura y el UPDATE: se relee y reintenta
+        table = Account.__table__
+        conn = db.session.connection()
+        calls = []
+
+        def compute(row):
+            calls.append(row.version_id)
+            if len(calls) == 1:
+                conn.execute(update(table).where(table.c.id == acc.id).values(version_id=table.c.version_id + 1))
+            return {'name': f'v{row.version_id}'}
+
+        values = versioned_update(conn, table, acc.id, ('name',), compute)
+        assert calls == [calls[0], calls[0] + 1] and values['version_id'] == calls[0] + 2
+
+        def always_conflict(row):
+            conn.execute(update(table).where(table.c.id == acc.id).values(version_id=table.c.version_id + 1))
+            return {'name': 'x'}
+
+        with pytest.raises(StaleDataError):
+            versioned_update(conn, table, acc.id, ('name',), always_conflict, retries=3)
+        db.session.rollback()
+
+        # Escritura ORM con versión vieja (otra pestaña) no pisa el balance
+        stale = _fresh(Account, acc.id)
+        db.session.execute(update(table).where(table.c.id == acc.id).values(version_id=table.c.version_id + 1))
+        stale.balance = 999
+        with pytest.raises(StaleDataError):
+            db.session.commit()
+        db.session.rollback()
+        assert _fresh(Account, acc.id).balance == 20.0
+
+
+def _login(client):
+    return client.post('/auth/login', data={'username': 'baluser', 'password': 'pass'}, follow_redirects=True)
+
+
+def test_card_form_balances_enter_ledger_as_adjustments():
+    from app.services.balance_service import recompute_balances
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        u = _setup()
+        client = app.test_client()
+        _login(client)
+        form = {'name': 'Tarjeta', 'bank_name': 'Banco', 'last_four_digits': '1234', 'credit_limit': '5000',
+                'current_balance': '300', 'due_date': '25', 'closing_date': '10', 'is_active': 'on'}
+        client.post('/credit-cards/create', data=form)
+        card = CreditCard.query.filter_by(user_id=u.id).one()
+        assert card.current_balance == 300.0 and card.verify_balance()['ok']
+
+        client.post(f'/credit-cards/{card.id}/edit', data={**form, 'current_balance': '120.5'})
+        card = _fresh(CreditCard, card.id)
+        assert card.current_balance == 120.5 and card.verify_balance()['ok']
+        assert Transaction.query.filter_by(credit_card_id=card.id).count() == 2
+
+        # Saldo a favor: reenviar el 0 mostrado no borra el crédito
+        db.session.add(Transaction(user_id=u.id, credit_card_id=card.id, amount=200, category='other',
+                                   transaction_type='income'))
+        db.session.commit()
+        client.post(f'/credit-cards/{card.id}/edit', data={**form, 'current_balance': '0', 'name': 'Renombrada'})
+        card = _fresh(CreditCard, card.id)
+        assert card.name == 'Renombrada' and card.stored_balance_cents() == -7950
+        assert Transaction.query.filter_by(credit_card_id=card.id).count() == 3
+
+        # La reparación nocturna desde el ledger no cambia nada
+        assert recompute_balances(card_ids=[card.id])['drift'] == []
+
+
+def test_debt_balance_edit_enters_ledger_as_adjustment():
+    from app.services.balance_service import recompute_balances
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        u = _setup()
+        client = app.test_client()
+        _login(client)
+        form = {'name': 'Préstamo', 'creditor_name': 'Banco', 'original_amount': '1000', 'interest_rate': '0',
+                'minimum_payment': '50', 'payment_due_day': '5'}
+        client.post('/debts/create', data=form)
+        debt = Account.query.filter_by(user_id=u.id, is_debt_account=True).one()
+        assert debt.balance == 1000.0
+
+        client.post(f'/debts/{debt.id}/edit', data={**form, 'current_balance': '850.25', 'status': 'active'})
+        debt = _fresh(Account, debt.id)
+        adj = Transaction.query.filter_by(account_id=debt.id).one()
+        assert debt.balance == 850.25 and adj.transaction_type == 'expense' and adj.amount == 149.75
+
+        # Reenviar el mismo saldo no crea otro ajuste y la reparación desde el ledger no cambia nada
+        client.post(f'/debts/{debt.id}/edit', data={**form, 'current_balance': '850.25', 'name': 'Renombrado'})
+        debt = _fresh(Account, debt.id)
+        assert debt.name == 'Renombrado' and Transaction.query.filter_by(account_id=debt.id).count() == 1
+        assert recompute_balances(account_ids=[debt.id])['drift'] == []
+        assert _fresh(Account, debt.id).balance == 850.25
@@ -0,0 +1,56 @@
+import os
+
+from app.utils.chart_cache import ChartCache, chart_key
+
+
+def test_key_depends_on_data_size_and_dpi():
+    spec = {'labels': ['a', 'b'], 'values': [1.0, 2.0]}
+    key = chart_key('expense_pie', spec, (10, 8), None)
+    assert key == chart_key('expense_pie', dict(reversed(list(spec.items()))), (10, 8), None)
+    assert key != chart_key('expense_pie', {**spec, 'values': [1.0, 2.5]}, (10, 8), None)
+    assert key != chart_key('expense_pie', spec, (10, 8), 100)
+    assert key != chart_key('monthly_flow', spec, (10, 8), None)
+
+
+def test_memory_lru_and_shared_disk_tier(tmp_path):
+    calls = []
+
+    def render(value):
+        def _render():
+            calls.append(value)
+            return value
+        return _render
+
+    cache = ChartCache(memory_items=1, disk_dir=str(tmp_path))
+    assert cache.get_or_render('k1', render('png1')) == 'png1'
+    assert cache.get_or_render('k1', render('otro')) == 'png1'
+    cache.get_or_render('k2', render('png2'))  # desaloja k1 de memoria
+    assert cache.get_or_render('k1', render('otro')) == 'png1'  # desde disco
+    assert calls == ['png1', 'png2']
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 1, 'misses': 2}
+
+    # Otro proceso/worker con el mismo directorio reutiliza el PNG
+    other = ChartCache(memory_items=4, disk_dir=str(tmp_path))
+    assert other.get_or_render('k2', render('otro')) == 'png2'
+    assert calls == ['png1', 'png2']
+
+
+def test_disk_eviction_by_size(tmp_path):
+    cache = ChartCache(memory_items=0, disk_dir=str(tmp_path), max_bytes=250)
+    for i in range(5):
+        cache.get_or_render(f'key{i:02d}', lambda: 'x' * 100)
+        path = cache._path(f'key{i:02d}')
+        os.utime(path, (1000 + i, 1000 + i))
+    assert cache.evict() == 3
+    assert not os.path.exists(cache._path('key00'))
+    assert os.path.exists(cache._path('key04'))
+
+
+def test_disk_tier_is_opt_in():
+    from app import app
+    from app.utils.chart_cache import get_chart_cache
+
+    with app.app_context():
+        # Los PNG llevan montos descifrados: sin CHART_CACHE_DIR no se escriben a disco
+        assert app.config['CHART_CACHE_DIR'] is None
+        assert get_chart_cache().disk_dir is None
@@ -0,0 +1,63 @@
+import base64
+import threading
+
+from app.services import report_charts
+from app.services.chart_pool import ChartRenderPool
+
+FLOW = {'title': 'Flujo', 'labels': ['Ingresos', 'Gastos', 'Ahorro/Pérdida'], 'values': [100.0, 40.0, 60.0],
+        'colors': ['#28a745', '#dc3545', '#17a2b8']}
+PIE = {'title': 'Gastos', 'labels': ['Comida', 'Transporte'], 'values': [30.0, 10.0]}
+
+
+def _is_png(value):
+    return base64.b64decode(value).startswith(b'\x89PNG')
+
+
+def test_renderers_are_thread_safe():
+    expected = report_charts.render('monthly_flow', FLOW)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(report_charts.render('monthly_flow', FLOW)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [expected] * 4
+
+
+def test_pool_renders_in_parallel_and_degrades_on_timeout_or_full_queue():
+    pool = ChartRenderPool(workers=2, max_pending=4, timeout=30)
+    # Sin start() no hay workers y un request no los crea (nunca fork desde un hilo)
+    assert not pool.ready() and pool.render_many({'flow': ('monthly_flow', FLOW)}) == {'flow': None}
+    assert pool._executor is None and pool.stats['errors'] == 1
+    pool.start()
+    try:
+        assert pool.ready()
+        images = pool.render_many({'flow': ('monthly_flow', FLOW), 'pie': ('expense_pie', PIE)})
+        assert images['flow'] == report_charts.render('monthly_flow', FLOW)
+        assert _is_png(images['pie'])
+
+        pool.timeout = 0
+        assert pool.render_many({'flow': ('monthly_flow', FLOW)}) == {'flow': None}
+        assert pool.stats['timeouts'] == 1
+
+        pool.timeout, pool.max_pending = 30, 1
+        pool._slots = threading.BoundedSemaphore(1)
+        images = pool.render_many({'a': ('monthly_flow', FLOW), 'b': ('expense_pie', PIE)})
+        assert _is_png(images['a']) and images['b'] is None
+        assert pool.stats['rejected'] == 1
+    finally:
+        pool.shutdown()
+    assert _is_png(report_charts.placeholder())
+
+
+def test_app_creates_pool_before_requests():
+    from app import app
+    from app.services import chart_pool
+
+    with app.app_context():
+        pool = chart_pool.get_render_pool()
+        assert pool is not None and pool.ready()
+        assert chart_pool.init_render_pool(app) is pool  # idempotente
+        images = chart_pool.render_many({'flow': ('monthly_flow', FLOW)})
+        assert images['flow'] == report_charts.render('monthly_flow', FLOW)
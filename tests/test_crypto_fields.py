@@ -0,0 +1,130 @@
+import base64
+import os
+
+from app.utils.crypto_fields import (
+    KeyRing,
+    decrypt_field,
+    encrypt_field,
+    get_keyring,
+    reload_keys,
+)
+
+
+def _ensure_master_key():
+    if 'APP_MASTER_KEY' not in os.environ:
+        os.environ['APP_MASTER_KEY'] = base64.b64encode(b'A' * 32).decode()
+
+
+def test_keyring_caches_subkeys_and_ciphers():
+    _ensure_master_key()
+    ring = KeyRing()
+    first = ring.cipher('description', 1)
+    again = ring.cipher('description', 1)
+    assert first is again
+    assert ring.subkey('bidx', 'description', 1) == ring.subkey('bidx', 'description', 1)
+    stats = ring.stats()
+    assert stats['misses'] == 2  # enc + bidx
+    assert stats['hits'] >= 2
+    assert stats['ciphers'] == 1
+
+
+def test_keyring_reload_picks_up_new_key():
+    _ensure_master_key()
+    os.environ['APP_MASTER_KEY_7'] = base64.b64encode(b'B' * 32).decode()
+    try:
+        blob = encrypt_field('hola', 'notes', 7)
+        assert decrypt_field(blob, 'notes', 7) == 'hola'
+        os.environ['APP_MASTER_KEY_7'] = base64.b64encode(b'C' * 32).decode()
+        # Sin reload la llave vieja sigue en caché
+        assert decrypt_field(blob, 'notes', 7) == 'hola'
+        reload_keys(7)
+        assert decrypt_field(blob, 'notes', 7) is None
+        assert get_keyring().stats()['versions'] >= 1
+    finally:
+        os.environ.pop('APP_MASTER_KEY_7', None)
+        reload_keys(7)
+
+
+def test_decrypt_many_groups_versions_and_numeric_kinds():
+    from decimal import Decimal
+    from app.utils.crypto_fields import decrypt_column, decrypt_many
+    _ensure_master_key()
+    os.environ['APP_MASTER_KEY_3'] = base64.b64encode(b'D' * 32).decode()
+    try:
+        blobs = [encrypt_field('10.50', 'amount', 1), None, encrypt_field('2.25', 'amount', 3)]
+        versions = [1, 1, 3]
+        assert decrypt_many(blobs, 'amount', versions, kind='decimal') == [Decimal('10.50'), Decimal('0'), Decimal('2.25')]
+        assert decrypt_many(blobs, 'amount', versions, kind='float') == [10.5, 0.0, 2.25]
+        rows = [(b, v, 'expense') for b, v in zip(blobs, versions)]
+        assert decrypt_column(rows, 0, 'amount', version_index=1, kind='float') == [10.5, 0.0, 2.25]
+        assert decrypt_many([encrypt_field('x', 'notes')], 'notes') == ['x']
+    finally:
+        os.environ.pop('APP_MASTER_KEY_3', None)
+        reload_keys(3)
+
+
+def test_numeric_cents_format_and_legacy_strings():
+    from decimal import Decimal
+    from app.utils.crypto_fields import (
+        NUMERIC_BLOB_SIZE, decrypt_cents, decrypt_many, encrypt_amount, is_legacy_numeric_blob,
+    )
+    _ensure_master_key()
+    new_blob = encrypt_amount('1234.565', 'amount')
+    assert len(new_blob) == NUMERIC_BLOB_SIZE
+    assert len(encrypt_amount(-5, 'amount')) == NUMERIC_BLOB_SIZE
+    assert decrypt_cents(new_blob, 'amount') == 123457
+    legacy_blob = encrypt_field('99.90', 'amount')
+    assert decrypt_cents(legacy_blob, 'amount') == 9990
+    assert is_legacy_numeric_blob(legacy_blob, 'amount')
+    assert not is_legacy_numeric_blob(new_blob, 'amount')
+    assert decrypt_many([new_blob, legacy_blob], 'amount', kind='decimal') == [Decimal('1234.57'), Decimal('99.90')]
+    assert decrypt_many([new_blob, legacy_blob], 'amount', kind='cents') == [123457, 9990]
+
+
+def test_decrypt_many_parallel_matches_serial(monkeypatch):
+    import app.utils.crypto_fields as cf
+    _ensure_master_key()
+    monkeypatch.setattr(cf, '_PARALLEL_THRESHOLD', 10)
+    monkeypatch.setattr(cf, '_PARALLEL_WORKERS', 4)
+    blobs = [cf.encrypt_amount(i, 'amount') for i in range(1000)]
+    serial = cf.decrypt_many(blobs, 'amount', kind='cents')
+    parallel = cf.decrypt_many(blobs, 'amount', kind='cents', parallel=True)
+    assert parallel == serial == [i * 100 for i in range(1000)]
+
+
+def test_cipher_suite_per_version():
+    import pytest
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    from app.utils.crypto_fields import decrypt_cents, encrypt_cents, normalize_suite_name
+
+    _ensure_master_key()
+    os.environ['APP_MASTER_KEY_8'] = base64.b64encode(b'D' * 32).decode()
+    os.environ['APP_ENC_SUITE_8'] = 'ChaCha20-Poly1305'
+    reload_keys(8)
+    try:
+        assert isinstance(get_keyring().cipher('notes', 8), ChaCha20Poly1305)
+        blob = encrypt_field('hola', 'notes', 8)
+        assert decrypt_field(blob, 'notes', 8) == 'hola'
+        assert decrypt_cents(encrypt_cents(1234, 'amount', 8), 'amount', 8) == 1234
+        # La versión 1 sigue con AES-GCM; v8 con otra suite no descifra el blob
+        assert decrypt_field(encrypt_field('hola', 'notes', 1), 'notes', 1) == 'hola'
+        os.environ['APP_ENC_SUITE_8'] = 'aesgcm'
+        reload_keys(8)
+        assert decrypt_field(blob, 'notes', 8) is None
+    finally:
+        os.environ.pop('APP_MASTER_KEY_8', None)
+        os.environ.pop('APP_ENC_SUITE_8', None)
+        reload_keys(8)
+    assert normalize_suite_name('AES-256-GCM') == 'aesgcm'
+    assert normalize_suite_name('aes-gcm-siv') == 'aesgcmsiv'
+    with pytest.raises(RuntimeError):
+        normalize_suite_name('rot13')
+
+
+def test_crypto_bench_recommends_supported_suite():
+    from app.utils.crypto_bench import run_benchmark
+    report = run_benchmark(sizes=(9, 64), iterations=50)
+    names = {r['suite'] for r in report['suites']}
+    assert 'aesgcm' in names
+    assert report['recommended'] in names
+    assert report['suites'][0]['sizes'][9]['decrypt_ops'] > 0
@@ -0,0 +1,237 @@
+import base64
+import os
+from app import app, db
+from app.models.user import User
+from app.models.account import Account
+from app.models.credit_card import CreditCard
+from app.models.transaction import Transaction
+from app.services.key_rotation import rotate_all
+from app.utils.crypto_fields import blind_index, reload_keys
+from werkzeug.security import generate_password_hash
+
+
+def _setup_keys():
+    os.environ.setdefault('APP_MASTER_KEY', base64.b64encode(b'A' * 32).decode())
+    os.environ['APP_MASTER_KEY_2'] = base64.b64encode(b'B' * 32).decode()
+    reload_keys()
+
+
+def _seed():
+    u = User(username='rotuser', email='rot@example.com', first_name='R', last_name='U', monthly_income=0)
+    u.password_hash = generate_password_hash('pass')
+    db.session.add(u)
+    db.session.commit()
+    acc = Account(user_id=u.id, name='Cuenta', account_type='checking', balance=150.25, enc_version=1)
+    card = CreditCard(user_id=u.id, name='Tarjeta', bank_name='Banco', credit_limit=1000,
+                      current_balance=80.5, closing_date=10, due_date=25, enc_version=1)
+    db.session.add_all([acc, card])
+    for i in range(7):
+        t = Transaction(user_id=u.id, amount=10 + i, category='other', transaction_type='expense', enc_version=1)
+        t.description = f'Compra {i}'
+        t.notes = 'Nota' if i % 2 else None
+        db.session.add(t)
+    db.session.commit()
+    return u.id
+
+
+def _in_other_session(fn):
+    import threading
+
+    def run():
+        with app.app_context():
+            fn()
+    worker = threading.Thread(target=run)
+    worker.start()
+    worker.join()
+
+
+def _check_rotated(user_id):
+    db.session.expire_all()
+    txs = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.id).all()
+    assert all(t.enc_version == 2 for t in txs)
+    assert [t.amount for t in txs] == [10.0 + i for i in range(7)]
+    assert [t.description for t in txs] == [f'Compra {i}' for i in range(7)]
+    assert txs[0].description_bidx == blind_index('Compra 0', 'description', 2)
+    assert txs[0].notes_enc is None and txs[1].notes == 'Nota'
+    acc = Account.query.filter_by(user_id=user_id).one()
+    card = CreditCard.query.filter_by(user_id=user_id).one()
+    assert acc.enc_version == 2 and acc.balance == 150.25
+    assert card.enc_version == 2 and card.current_balance == 80.5
+    # Tokens de búsqueda regenerados con la llave v2
+    from app.services.transaction_search import search_transactions
+    from app.models.transaction_search_token import TransactionSearchToken
+    assert {tok.enc_version for tok in TransactionSearchToken.query.all()} == {2}
+    assert [t.description for t in search_transactions(user_id, 'compra 3')] == ['Compra 3']
+
+
+def test_rotate_all_in_process():
+    _setup_keys()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        stats = rotate_all(1, 2, batch_size=3)
+        by_table = {s['table']: s for s in stats}
+        assert by_table['transactions']['rows'] == 7
+        assert by_table['transactions']['batches'] == 3
+        assert by_table['accounts']['rows'] == 1 and by_table['credit_cards']['rows'] == 1
+        _check_rotated(user_id)
+        # Idempotente: una segunda pasada no encuentra filas v1
+        assert sum(s['rows'] for s in rotate_all(1, 2)) == 0
+
+
+def test_rotate_all_process_pool():
+    _setup_keys()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        stats = rotate_all(1, 2, batch_size=4, workers=2)
+        assert sum(s['failed'] for s in stats) == 0
+        _check_rotated(user_id)
+
+
+def test_online_rotation_resumes_from_cursor():
+    from app.models.key_rotation_state import KeyRotationState
+    from app.services.online_key_rotation import OnlineKeyRotationService, request_latency
+
+    _setup_keys()
+    request_latency.reset()
+    opts = {'from_version': 1, 'to_version': 2, 'batch_size': 10, 'rows_per_sec': 0,
+            'max_request_ms': 1e9, 'max_db_ms': 1e9}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        # Sin tiempo de tick: no avanza pero deja el cursor creado
+        first = OnlineKeyRotationService.run_tick({**opts, 'tick_seconds': 0})
+        assert first['status'] == 'running' and first['rows'] == 0
+        done = OnlineKeyRotationService.run_tick({**opts, 'tick_seconds': 30})
+        # 7 transacciones + cuenta + tarjeta + 1 rollup mensual (mismo mes/categoría)
+        assert done['status'] == 'done' and done['rows'] == 10
+        state = KeyRotationState.query.filter_by(table_name='transactions').one()
+        assert state.status == 'done' and state.rows_done == 7 and state.last_id > 0
+        _check_rotated(user_id)
+
+
+def test_online_rotation_tick_rejects_edit_loaded_before_it():
+    import pytest
+    from sqlalchemy.orm.exc import StaleDataError
+    from app.services.online_key_rotation import OnlineKeyRotationService, request_latency
+    from app.services.transaction_search import search_transactions
+
+    _setup_keys()
+    request_latency.reset()
+    opts = {'from_version': 1, 'to_version': 2, 'batch_size': 10, 'rows_per_sec': 0,
+            'max_request_ms': 1e9, 'max_db_ms': 1e9, 'tick_seconds': 30}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        # Un request carga la transacción (v1); el job hace su tick en otra sesión
+        tx = Transaction.query.options(*Transaction.profile('list_annotated')) \
+            .filter_by(user_id=user_id).order_by(Transaction.id).first()
+        tx_id = tx.id
+        _in_other_session(lambda: OnlineKeyRotationService.run_tick(opts))
+        with pytest.raises(StaleDataError):
+            tx.description = 'Editada'
+            tx.amount = 25
+            db.session.commit()
+        db.session.rollback()
+        _check_rotated(user_id)
+
+        # Tras recargar, la edición usa la llave nueva
+        tx = db.session.get(Transaction, tx_id)
+        tx.description = 'Editada'
+        tx.amount = 25
+        db.session.commit()
+        db.session.expire_all()
+        tx = db.session.get(Transaction, tx_id)
+        assert (tx.enc_version, tx.description, tx.amount) == (2, 'Editada', 25.0)
+        assert [t.id for t in search_transactions(user_id, 'editada')] == [tx_id]
+
+
+def test_online_rotation_pauses_under_request_latency():
+    from app.models.key_rotation_state import KeyRotationState
+    from app.services.online_key_rotation import OnlineKeyRotationService, request_latency
+
+    _setup_keys()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        _seed()
+        request_latency.reset()
+        request_latency.record(2000.0)
+        try:
+            summary = OnlineKeyRotationService.run_tick({'from_version': 1, 'to_version': 2, 'tick_seconds': 30,
+                                                         'max_request_ms': 500, 'max_db_ms': 1e9})
+        finally:
+            request_latency.reset()
+        assert summary['status'] == 'paused' and summary['rows'] == 0
+        state = KeyRotationState.query.filter_by(table_name='transactions').one()
+        assert state.status == 'paused' and 'requests' in state.pause_reason
+        assert Transaction.query.filter_by(enc_version=2).count() == 0
+
+
+def test_write_batch_rereads_rows_changed_after_read():
+    from sqlalchemy import text
+    from app.services.key_rotation import fetch_batch, reencrypt_rows, write_batch
+    from app.utils.crypto_fields import decrypt_cents, encrypt_cents
+
+    _setup_keys()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        acc = Account.query.filter_by(user_id=user_id).one()
+        version = acc.version_id
+        params, _ = reencrypt_rows('accounts', fetch_batch('accounts', 1, 0, 10), 1, 2)
+        # Una escritura concurrente (aún con v1) cambia el balance tras la lectura
+        db.session.execute(text('UPDATE accounts SET balance_enc = :b WHERE id = :id'),
+                           {'b': encrypt_cents(99900, 'account_balance', 1), 'id': acc.id})
+        assert write_batch('accounts', params, 1, 2) == 1
+        row = db.session.execute(text('SELECT balance_enc, enc_version, version_id FROM accounts WHERE id = :id'),
+                                 {'id': acc.id}).one()
+        assert row.enc_version == 2
+        assert decrypt_cents(row.balance_enc, 'account_balance', 2) == 99900  # no se pisó con el valor leído
+        assert row.version_id == version + 1
+
+
+def test_stale_transaction_edit_after_rotation_is_rejected():
+    import pytest
+    from sqlalchemy.orm.exc import StaleDataError
+
+    _setup_keys()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = _seed()
+        acc = Account.query.filter_by(user_id=user_id).one()
+        tx = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.id).first()
+        tx.account_id = acc.id
+        db.session.commit()
+        tx_id, balance = tx.id, acc.balance
+        db.session.expunge_all()
+        # Como en los controladores: cargada con un perfil de columnas
+        tx = Transaction.query.options(*Transaction.profile('list')).filter_by(id=tx_id).one()
+        assert tx.amount == 10.0  # cargada (y cacheada) con enc_version 1
+
+        # La rotación (otra sesión, como el job online) confirma entre la carga y el flush
+        _in_other_session(lambda: rotate_all(1, 2, batch_size=3))
+        with pytest.raises(StaleDataError):  # antes se guardaban blobs v1 con enc_version=2
+            tx.description = 'Editada'
+            tx.amount = 25
+            db.session.commit()
+        db.session.rollback()
+
+        db.session.expire_all()
+        tx = db.session.get(Transaction, tx_id)
+        assert tx.enc_version == 2 and tx.description == 'Compra 0' and tx.amount == 10.0
+        assert Account.query.filter_by(user_id=user_id).one().balance == balance
+        # Releída con la versión nueva, la edición se guarda bien
+        tx.description = 'Editada'
+        tx.amount = 25
+        db.session.commit()
+        db.session.expire_all()
+        tx = db.session.get(Transaction, tx_id)
+        assert tx.enc_version == 2 and tx.description == 'Editada' and tx.amount == 25.0
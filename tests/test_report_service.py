@@ -0,0 +1,197 @@
+import base64
+import os
+from datetime import datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.services.report_service import ReportService
+
+
+@pytest.fixture
+def user_id():
+    os.environ.setdefault('APP_MASTER_KEY', base64.b64encode(b'A' * 32).decode())
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        u = User(username='rep', email='rep@example.com', first_name='R', last_name='P', monthly_income=0)
+        u.password_hash = generate_password_hash('pass')
+        db.session.add(u)
+        db.session.commit()
+        rows = [
+            (datetime(2024, 1, 5), 'income', 'salary', None, 1000),
+            (datetime(2024, 1, 9), 'expense', 'food', None, 120.5),
+            (datetime(2024, 1, 20), 'income', 'debt_payment', 1, 300),  # pago a tarjeta: no es ingreso
+            (datetime(2024, 2, 2), 'expense', 'transport', None, 40),
+            (datetime(2024, 5, 2), 'expense', 'food', None, 10.25),
+        ]
+        for date, tx_type, category, card_id, amount in rows:
+            db.session.add(Transaction(user_id=u.id, date=date, transaction_type=tx_type, category=category,
+                                       credit_card_id=card_id, amount=amount))
+        db.session.commit()
+        yield u.id
+        db.session.remove()
+        db.drop_all()
+
+
+def test_monthly_summary_excludes_card_payments(user_id):
+    with app.app_context():
+        summary = ReportService.get_monthly_summary(user_id, 2024, 1)
+        assert summary['total_income'] == 1000
+        assert summary['total_expenses'] == 120.5
+        assert summary['net_income'] == 879.5
+        assert summary['expenses_by_category'] == {'Alimentación': 120.5}
+        assert summary['transaction_count'] == 3
+
+
+def test_year_scan_matches_monthly_queries(user_id):
+    with app.app_context():
+        summaries = ReportService.get_monthly_summaries_for_year(user_id, 2024)
+        for month in range(1, 13):
+            assert summaries[month - 1] == ReportService.get_monthly_summary(user_id, 2024, month)
+        quarters = ReportService.get_quarterly_reports_for_year(user_id, 2024)
+        assert quarters[0] == ReportService.get_quarterly_report(user_id, 2024, 1)
+        assert quarters[1]['total_expenses'] == 10.25
+
+
+def test_request_memo_reuses_results_until_user_writes(user_id):
+    from sqlalchemy import event
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.test_request_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            first = ReportService.get_monthly_summary(user_id, 2024, 1)
+            ReportService.generate_monthly_flow_chart(user_id, 2024, 1)
+            assert ReportService.get_monthly_summary(user_id, 2024, 1) is first
+            assert len(statements) == 1
+
+            db.session.add(Transaction(user_id=user_id, date=datetime(2024, 1, 25), transaction_type='expense',
+                                       category='food', amount=9.5))
+            db.session.flush()
+            assert ReportService.get_monthly_summary(user_id, 2024, 1)['total_expenses'] == 130
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+            db.session.rollback()
+
+
+def test_aggregate_rolls_months_into_quarters_and_years(user_id):
+    with app.app_context():
+        data = ReportService.aggregate(user_id, datetime(2023, 12, 1), datetime(2024, 7, 1))
+        assert len(data['months']) == 7
+        assert data['months'][(2023, 12)]['transaction_count'] == 0
+        assert data['quarters'][(2024, 1)]['total_expenses'] == 160.5
+        assert data['quarters'][(2024, 1)]['expenses_by_category'] == {'Alimentación': 120.5, 'Transporte': 40}
+        assert data['years'][2024]['total_income'] == 1000
+        assert data['total']['transaction_count'] == 5
+
+        annual = ReportService.get_annual_summary(user_id, 2024)
+        assert annual['total_expenses'] == 170.75
+        assert annual['net_income'] == 829.25
+        assert [q['total_expenses'] for q in annual['quarters']] == [160.5, 10.25, 0, 0]
+
+
+def test_monthly_rollups_follow_writes_and_match_scan(user_id):
+    from app.services.monthly_rollup import check_rollups, rebuild_rollups
+
+    with app.app_context():
+        assert check_rollups(db.session, user_id) == []
+        tx = Transaction.query.filter_by(user_id=user_id, category='transport').one()
+        tx.amount = 55
+        tx.category = 'food'
+        db.session.delete(Transaction.query.filter_by(user_id=user_id, category='food', transaction_type='expense')
+                          .order_by(Transaction.date.desc()).first())
+        db.session.add(Transaction(user_id=user_id, date=datetime(2024, 3, 3), transaction_type='income',
+                                   category='salary', amount=500))
+        db.session.commit()
+        assert check_rollups(db.session, user_id) == []
+
+        scanned = ReportService.aggregate.uncached(user_id, datetime(2024, 1, 1), datetime(2025, 1, 1))
+        app.config['REPORT_ROLLUPS_ENABLED'] = True
+        try:
+            assert ReportService.aggregate.uncached(user_id, datetime(2024, 1, 1), datetime(2025, 1, 1)) == scanned
+        finally:
+            app.config['REPORT_ROLLUPS_ENABLED'] = False
+        assert scanned['quarters'][(2024, 1)]['expenses_by_category'] == {'Alimentación': 175.5}
+
+        # Ene: salario, comida, abono a tarjeta; Feb: comida (antes transporte); Mar: salario
+        assert rebuild_rollups(db.session, user_id) == 5
+        assert check_rollups(db.session, user_id) == []
+
+
+def test_numpy_backend_matches_python_backend(user_id):
+    from app.models.account import Account
+
+    with app.app_context():
+        acc = Account(user_id=user_id, name='Nómina', account_type='checking', balance=0)
+        db.session.add(acc)
+        db.session.flush()
+        db.session.add(Transaction(user_id=user_id, account_id=acc.id, date=datetime(2024, 1, 15),
+                                   transaction_type='income', category='salary', amount=250.75))
+        db.session.commit()
+        ranges = [(datetime(2024, 1, 1), datetime(2025, 1, 1)), (datetime(2023, 11, 1), datetime(2024, 2, 10))]
+        expected = [ReportService.aggregate.uncached(user_id, *r) for r in ranges]
+        income = ReportService.get_income_by_account_summary.uncached(user_id, 2024, 1)
+        app.config['REPORT_BACKEND'] = 'numpy'
+        try:
+            assert [ReportService.aggregate.uncached(user_id, *r) for r in ranges] == expected
+            vectorized = ReportService.get_income_by_account_summary.uncached(user_id, 2024, 1)
+        finally:
+            app.config['REPORT_BACKEND'] = 'python'
+        assert vectorized['total_income'] == income['total_income'] == 250.75
+        assert vectorized['income_by_account']['Nómina']['transaction_count'] == 1
+
+
+def test_charts_render_once_for_unchanged_data(user_id, monkeypatch, tmp_path):
+    from app.services import report_charts
+
+    renders = []
+    real_render = report_charts.render
+    monkeypatch.setattr(report_charts, 'render', lambda kind, spec: renders.append(kind) or real_render(kind, spec))
+    monkeypatch.setitem(app.config, 'CHART_CACHE_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'REPORT_MEMO_ENABLED', False)
+    monkeypatch.setitem(app.config, 'CHART_RENDER_WORKERS', 0)  # contar los render en este proceso
+    with app.app_context():
+        first = ReportService.generate_monthly_flow_chart(user_id, 2024, 1)
+        assert ReportService.generate_monthly_flow_chart(user_id, 2024, 1) == first
+        assert renders == ['monthly_flow']
+        db.session.add(Transaction(user_id=user_id, date=datetime(2024, 1, 26), transaction_type='expense',
+                                   category='food', amount=3))
+        db.session.commit()
+        assert ReportService.generate_monthly_flow_chart(user_id, 2024, 1) != first
+        assert renders == ['monthly_flow', 'monthly_flow']
+
+
+def test_chart_api_serves_specs_with_etag_and_client_mode_skips_png(user_id, monkeypatch):
+    from app.services import report_charts
+
+    monkeypatch.setattr(report_charts, 'render', lambda kind, spec: pytest.fail('render en modo client'))
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'rep', 'password': 'pass'})
+
+    resp = client.get('/api/reports/monthly?year=2024&month=1')
+    assert resp.status_code == 200
+    charts = resp.get_json()['charts']
+    assert charts['monthly_flow']['values'] == [1000, 120.5, 879.5]
+    assert charts['expense_pie']['labels'] == ['Alimentación']
+    assert charts['debt_breakdown_pie'] is None
+    assert 'no-cache' in resp.headers['Cache-Control']
+    etag = resp.headers['ETag']
+    assert client.get('/api/reports/monthly?year=2024&month=1', headers={'If-None-Match': etag}).status_code == 304
+
+    single = client.get('/api/reports/charts/income_expense_trend?year=2024')
+    assert single.get_json()['spec']['expenses'][:2] == [120.5, 40]
+    assert client.get('/api/reports/charts/nope').status_code == 404
+
+    page = client.get('/reports/monthly?year=2024&month=1&render=client')
+    assert page.status_code == 200
+    assert b'data:image/png' not in page.data
+    assert b'data-chart="monthly_flow"' in page.data
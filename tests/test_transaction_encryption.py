@@ -49,3 +49,204 @@ def test_transaction_encrypted_fields(tmp_path):
         assert len(by_desc) == 1 and by_desc[0].id == stored.id
         by_notes = find_by_notes(u.id, 'Lista básica')
         assert len(by_notes) == 1
+
+
+def test_plaintext_cache_invalidation(monkeypatch):
+    _ensure_master_key()
+    import app.models.transaction as tx_module
+    from app.utils.plaintext_cache import set_plaintext_cache_enabled
+
+    calls = []
+
+    def counting(real):
+        def wrapper(blob, field, version=1):
+            calls.append(field)
+            return real(blob, field, version)
+        return wrapper
+
+    monkeypatch.setattr(tx_module, 'decrypt_field', counting(tx_module.decrypt_field))
+    monkeypatch.setattr(tx_module, 'decrypt_cents', counting(tx_module.decrypt_cents))
+    t = Transaction(user_id=1, amount=5, category='other', transaction_type='expense')
+    t.description = 'Café'
+    assert t.amount == 5.0 and t.amount == 5.0
+    assert t.description == 'Café' and t.description == 'Café'
+    assert calls.count('amount') == 1 and calls.count('description') == 1
+
+    t.amount = 7
+    assert t.amount == 7.0
+    assert calls.count('amount') == 2
+
+    set_plaintext_cache_enabled(False)
+    try:
+        t.amount
+        t.amount
+        assert calls.count('amount') == 4
+    finally:
+        set_plaintext_cache_enabled(True)
+
+
+def test_plaintext_cache_reset_on_refresh():
+    _ensure_master_key()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        t = Transaction(user_id=1, amount=3, category='other', transaction_type='expense')
+        db.session.add(t)
+        db.session.commit()
+        assert t.amount == 3.0
+        assert t.__dict__['_plain_cache']
+        db.session.refresh(t)
+        assert not t.__dict__['_plain_cache']
+        assert t.amount == 3.0
+
+
+def test_substring_search_tokens():
+    _ensure_master_key()
+    from app.models.transaction_search_token import TransactionSearchToken
+    from app.services.transaction_search import paginate_ids, search_transactions, verified_ids
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        u = User(username='searchuser', email='s@example.com', first_name='S', last_name='U', monthly_income=0)
+        u.password_hash = generate_password_hash('pass')
+        db.session.add(u)
+        db.session.commit()
+
+        def tx(desc, notes=None):
+            t = Transaction(user_id=u.id, amount=5, category='other', transaction_type='expense')
+            t.description = desc
+            t.notes = notes
+            db.session.add(t)
+            return t
+
+        uber = tx('Uber Eats 12/03')
+        cafe = tx('Café Central', notes='desayuno con Ana')
+        tx('Tube berry shop')  # comparte trigramas con "uber" pero no lo contiene
+        db.session.commit()
+
+        tokens = TransactionSearchToken.query.filter_by(transaction_id=uber.id).all()
+        assert tokens and all(tok.user_id == u.id and len(tok.token_hash) == 64 for tok in tokens)
+
+        assert [t.id for t in search_transactions(u.id, 'uber')] == [uber.id]
+        assert [t.id for t in search_transactions(u.id, 'UBER eat')] == [uber.id]
+        assert [t.id for t in search_transactions(u.id, 'cafe desayuno')] == [cafe.id]  # AND entre campos
+        assert search_transactions(u.id, 'uber desayuno') == []
+        assert len(search_transactions(u.id, 'uber', verify=False)) == 2
+
+        # Listado paginado: sólo ids verificados y sólo la página se carga
+        base = Transaction.query.filter_by(user_id=u.id).order_by(Transaction.id.desc())
+        assert verified_ids(base, u.id, 'uber') == [uber.id]
+        assert verified_ids(base, u.id, '  ') is None  # sin términos no hay filtro
+        ids = verified_ids(base, u.id, 'ber')  # "Uber" y "Tube berry"
+        page = paginate_ids(base, ids, page=2, per_page=1)
+        assert page.total == 2 and page.pages == 2 and [t.id for t in page.items] == ids[1:]
+
+        # El setter reemplaza los tokens del campo
+        uber.description = 'Didi Food'
+        db.session.commit()
+        assert search_transactions(u.id, 'uber') == []
+        assert [t.id for t in search_transactions(u.id, 'didi')] == [uber.id]
+
+        db.session.delete(cafe)
+        db.session.commit()
+        assert TransactionSearchToken.query.filter_by(transaction_id=cafe.id).count() == 0
+
+
+def test_amount_range_filter_uses_buckets():
+    _ensure_master_key()
+    from app.services.transaction_search import amount_range_criterion, verified_ids
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        u = User(username='rangeuser', email='r@example.com', first_name='R', last_name='U', monthly_income=0)
+        u.password_hash = generate_password_hash('pass')
+        db.session.add(u)
+        db.session.commit()
+        amounts = [0.5, 3, 12, 99.99, 100, 250, 499.99, 500, 501, 1200, 50000]
+        for a in amounts:
+            db.session.add(Transaction(user_id=u.id, amount=a, category='other', transaction_type='expense'))
+        legacy = Transaction(user_id=u.id, amount=800, category='other', transaction_type='expense')
+        db.session.add(legacy)
+        db.session.commit()
+        legacy.amount_bucket_bidx = None  # filas previas a la columna se descifran
+        db.session.commit()
+
+        def run(lo, hi):
+            stats = {}
+            crit = amount_range_criterion(u.id, lo, hi, stats=stats)
+            got = sorted(t.amount for t in Transaction.query.filter_by(user_id=u.id).filter(crit))
+            return got, stats['decrypted']
+
+        got, decrypted = run(500, None)
+        assert got == [500, 501, 800, 1200, 50000]
+        assert decrypted < len(amounts)
+        assert run(100, 500)[0] == [100, 250, 499.99, 500]
+        assert run(None, 3)[0] == [0.5, 3]
+        assert amount_range_criterion(u.id) is None
+
+        # Los demás filtros se aplican antes de descifrar los bordes
+        food = Transaction(user_id=u.id, amount=520, category='food', transaction_type='expense')
+        food.description = 'Super semanal'
+        db.session.add(food)
+        db.session.commit()
+        stats = {}
+        within = Transaction.query.filter_by(user_id=u.id, category='food')
+        crit = amount_range_criterion(u.id, 500, None, stats=stats, within=within)
+        assert [t.amount for t in within.filter(crit)] == [520] and stats['decrypted'] == 1
+
+        # Listado: un solo pase verifica monto (y texto) sobre los candidatos
+        base = Transaction.query.filter_by(user_id=u.id).order_by(Transaction.id)
+        stats = {}
+        ids = verified_ids(base, u.id, None, 500, 1000, stats=stats)
+        assert [db.session.get(Transaction, i).amount for i in ids] == [500, 501, 800, 520]
+        assert stats['decrypted'] < len(amounts)
+        assert verified_ids(base, u.id, 'super', 500, None) == [food.id]
+        assert verified_ids(base, u.id, 'super', None, 100) == []
+        assert verified_ids(base, u.id) is None
+
+
+def test_query_profiles_defer_unused_columns():
+    _ensure_master_key()
+    import pytest
+    from sqlalchemy import inspect as sa_inspect
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        u = User(username='profuser', email='p@example.com', first_name='P', last_name='U', monthly_income=0)
+        u.password_hash = generate_password_hash('pass')
+        db.session.add(u)
+        db.session.commit()
+        t = Transaction(user_id=u.id, amount=42, category='food', transaction_type='expense')
+        t.description = 'Super'
+        t.notes = 'Nota privada'
+        db.session.add(t)
+        db.session.commit()
+        tid = t.id
+
+        def loaded(profile):
+            db.session.expunge_all()
+            query = Transaction.query
+            if profile:
+                query = query.options(*Transaction.profile(profile))
+            obj = query.filter_by(id=tid).one()
+            return obj, sa_inspect(obj).unloaded
+
+        obj, unloaded = loaded(None)
+        assert {'notes_enc', 'creditor_name_enc', 'description_bidx', 'amount_bucket_bidx'} <= unloaded
+        obj, unloaded = loaded('aggregate')
+        assert 'description_enc' in unloaded and 'amount_enc' not in unloaded
+        assert obj.amount == 42
+        obj, unloaded = loaded('list_annotated')
+        assert 'notes_enc' not in unloaded and 'description_bidx' in unloaded
+        assert obj.notes == 'Nota privada'
+        obj, unloaded = loaded('detail')
+        assert 'notes_enc' not in unloaded and 'creditor_name_enc' not in unloaded
+        # Acceder a una columna diferida la carga bajo demanda
+        obj, _ = loaded('list')
+        assert obj.notes == 'Nota privada'
+        with pytest.raises(ValueError):
+            Transaction.profile('nope')